@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('portal.html', '.')],
-    hiddenimports=[],
+    hiddenimports=['server'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
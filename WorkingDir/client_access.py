@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Per-client internet access (released clients)
+Released phones are kept in two ipsets, one by IP (hash:ip) and one by MAC
+(hash:mac). Constant rules referring to the sets let their traffic skip the
+portal's DNAT rules and forward it, masqueraded, to the internet (see
+firewall.portal_ruleset); other hotspot clients are not forwarded. The
+kernel looks a packet up in a hash, so the cost per packet stays the same
+for 1 or 500 released clients, and releasing a client never touches
+iptables. Entries can carry a timeout, in which case the kernel expires
+them on its own.
+
+Releasing needs the built-in DNS responder (DNS_RESPONDER="1"): dnsmasq
+answers every name with the portal address, so a released phone would
+reach nothing. The launcher only sets the sets up (and turns on IPv4
+forwarding) in that mode; otherwise allow() refuses.
+
+An in-memory mirror of the sets answers is_allowed() without a subprocess.
+"""
+
+import subprocess
+import threading
+import time
+
+import firewall
+import portal_logging
+
+log = portal_logging.get_logger("access")
+
+IP_SET = "portal-allow-ip"
+MAC_SET = "portal-allow-mac"
+MAX_ENTRIES = 4096
+
+# Created with default timeout 0: entries are permanent unless added with a timeout
+SET_TYPES = {IP_SET: "hash:ip", MAC_SET: "hash:mac"}
+
+IP_FORWARD = "/proc/sys/net/ipv4/ip_forward"
+
+
+class ClientAccessError(firewall.FirewallError):
+    """ipset failed or is not installed"""
+
+
+_lock = threading.Lock()
+_allowed = {IP_SET: {}, MAC_SET: {}}  # set -> {entry: expires_at or None}
+_ready = False              # ensure_sets() succeeded: releasing is possible
+_forwarding_before = None   # ip_forward value before enable_forwarding()
+
+
+def run_ipset(*args, stdin=None):
+    try:
+        result = subprocess.run(["ipset", *args], input=stdin, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise ClientAccessError(f"ipset {' '.join(args[:2])} failed: {e}")
+    if result.returncode != 0:
+        raise ClientAccessError(f"ipset {' '.join(args[:2])} failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+def _entry(ip, mac):
+    if (ip is None) == (mac is None):
+        raise ValueError("Pass exactly one of ip or mac")
+    return (IP_SET, ip) if ip is not None else (MAC_SET, mac.lower())
+
+
+def parse_save(text):
+    """
+    Members of the portal sets in `ipset save` output.
+
+    Returns:
+        dict: set name -> {entry: remaining timeout in seconds, or None}
+    """
+    members = {name: {} for name in SET_TYPES}
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) < 3 or fields[0] != 'add' or fields[1] not in members:
+            continue
+        timeout = None
+        if 'timeout' in fields[3:]:
+            timeout = int(fields[fields.index('timeout') + 1]) or None
+        members[fields[1]][fields[2].lower()] = timeout
+    return members
+
+
+# ========================
+# Setup
+# ========================
+
+def ensure_sets():
+    """
+    Create the sets if needed (existing entries are kept) and load the
+    mirror from the kernel. Must run before a ruleset referencing the sets
+    (firewall.portal_ruleset(..., allow_sets=SET_TYPES)) is loaded.
+
+    Returns:
+        bool: True if the sets exist; False if ipset is unavailable
+    """
+    commands = "".join(f"create {name} {kind} timeout 0 maxelem {MAX_ENTRIES}\n"
+                       for name, kind in SET_TYPES.items())
+    try:
+        run_ipset("-exist", "restore", stdin=commands)
+        members = parse_save(run_ipset("save"))
+    except ClientAccessError as e:
+        log.error(f"Client allowlist unavailable, every client stays captive: {e}")
+        return False
+
+    global _ready
+    now = time.time()
+    with _lock:
+        for name, entries in members.items():
+            _allowed[name] = {entry: (now + timeout if timeout else None) for entry, timeout in entries.items()}
+        _ready = True
+    log.info("Client allowlist ready", extra={'ips': len(members[IP_SET]), 'macs': len(members[MAC_SET])})
+    return True
+
+
+def destroy():
+    """Remove the sets (only possible once no rule references them)"""
+    for name in SET_TYPES:
+        try:
+            run_ipset("destroy", name)
+        except ClientAccessError as e:
+            if "does not exist" not in str(e):
+                log.warning(str(e))
+    global _ready
+    with _lock:
+        for name in SET_TYPES:
+            _allowed[name] = {}
+        _ready = False
+
+
+def enable_forwarding():
+    """Turn on IPv4 forwarding for released clients (the previous value is kept for restore_forwarding)"""
+    global _forwarding_before
+    try:
+        with open(IP_FORWARD) as f:
+            before = f.read().strip()
+        if before != "1":
+            with open(IP_FORWARD, "w") as f:
+                f.write("1\n")
+    except OSError as e:
+        log.error(f"Cannot enable IPv4 forwarding, released clients have no internet: {e}")
+        return False
+    if _forwarding_before is None:
+        _forwarding_before = before
+    return True
+
+
+def restore_forwarding():
+    """Put ip_forward back to what it was before enable_forwarding()"""
+    global _forwarding_before
+    if _forwarding_before is None:
+        return
+    try:
+        with open(IP_FORWARD, "w") as f:
+            f.write(_forwarding_before + "\n")
+    except OSError as e:
+        log.warning(f"Could not restore {IP_FORWARD}: {e}")
+    _forwarding_before = None
+
+
+# ========================
+# Releasing clients
+# ========================
+
+def allow(ip=None, mac=None, ttl=None):
+    """
+    Release a client (by IP or by MAC). Releasing it again replaces the timeout.
+
+    Args:
+        ip: Client IP address
+        mac: Client MAC address (survives a new DHCP lease)
+        ttl: Seconds until the kernel drops the entry (None: until revoked)
+
+    Raises:
+        ClientAccessError: the allowlist is not set up (no ipset, or the
+            built-in DNS responder is off) or ipset failed
+    """
+    name, entry = _entry(ip, mac)
+    if not _ready:
+        raise ClientAccessError('Releasing clients needs ipset and the built-in DNS responder (DNS_RESPONDER="1")')
+    run_ipset("-exist", "add", name, entry, "timeout", str(int(ttl or 0)))
+    now = time.time()
+    with _lock:
+        # The kernel drops timed-out entries by itself; forget them here too
+        entries = _allowed[name]
+        for stale in [e for e, expires in entries.items() if expires is not None and expires <= now]:
+            del entries[stale]
+        entries[entry] = now + ttl if ttl else None
+    log.info("Client released", extra={'set': name, 'entry': entry, 'ttl': ttl})
+
+
+def revoke(ip=None, mac=None):
+    """Send a client back to the portal"""
+    name, entry = _entry(ip, mac)
+    run_ipset("-exist", "del", name, entry)
+    with _lock:
+        _allowed[name].pop(entry, None)
+    log.info("Client revoked", extra={'set': name, 'entry': entry})
+
+
+def expire(ip=None, mac=None, after=0):
+    """
+    End an existing release `after` seconds from now (0: now).
+
+    Returns:
+        bool: False if the client was not released
+    """
+    name, entry = _entry(ip, mac)
+    with _lock:
+        known = entry in _allowed[name]
+    if not known:
+        return False
+    if after > 0:
+        allow(ip, mac, ttl=after)
+    else:
+        revoke(ip, mac)
+    return True
+
+
+def revoke_all():
+    """Send every client back to the portal"""
+    for name in SET_TYPES:
+        run_ipset("flush", name)
+    with _lock:
+        for name in SET_TYPES:
+            _allowed[name] = {}
+    log.info("All clients revoked")
+
+
+def is_allowed(ip=None, mac=None):
+    """O(1) check against the mirror (no subprocess)"""
+    name, entry = _entry(ip, mac)
+    expires = _allowed[name].get(entry, 0)
+    return expires is None or expires > time.time()
+
+
+def allowed():
+    """
+    Returns:
+        dict: 'ip' and 'mac' -> {entry: seconds left, or None if permanent}
+    """
+    now = time.time()
+    with _lock:
+        snapshot = {name: dict(entries) for name, entries in _allowed.items()}
+    return {
+        kind: {entry: (None if expires is None else round(expires - now))
+               for entry, expires in snapshot[name].items() if expires is None or expires > now}
+        for kind, name in (('ip', IP_SET), ('mac', MAC_SET))
+    }
+
+
+if __name__ == "__main__":
+    # Rule count per approach, and the cost of releasing a client.
+    # NOTE: creates the portal sets; run on a test kiosk.
+    import os
+    import shutil
+
+    iface = "portalbench0"
+    ruleset = firewall.portal_ruleset(iface, "192.168.4.1", 8090, allow_sets=SET_TYPES)
+    print("nat PREROUTING with the allowlist (constant for any number of clients):")
+    for rule in ruleset.rules['nat']:
+        print(f"  {rule}")
+    print("per-client rules instead: 500 clients -> 500 rules walked per packet\n")
+
+    if os.geteuid() != 0 or shutil.which("ipset") is None:
+        raise SystemExit("ipset needs root and the ipset package; stopping before the timing run")
+
+    ensure_sets()
+    runs = 200
+    started = time.perf_counter()
+    for i in range(runs):
+        allow(ip=f"10.99.{i // 250}.{i % 250 + 1}", ttl=60)
+    add_ms = (time.perf_counter() - started) * 1000 / runs
+    started = time.perf_counter()
+    for _ in range(100000):
+        is_allowed(ip="10.99.0.7")
+    check_us = (time.perf_counter() - started) * 10
+    print(f"  allow(): {add_ms:.2f} ms per client   is_allowed(): {check_us:.2f} us")
+    for i in range(runs):
+        revoke(ip=f"10.99.{i // 250}.{i % 250 + 1}")
@@ -4,6 +4,9 @@
 # ========================================
 # Edit this file to configure your captive portal settings
 # All scripts will read from this configuration
+# Saved changes are applied by the running portal; INTERFACE, STATIC_IP,
+# SERVER_PORT, GAME_* and DNS_* restart it (phones reconnect), everything else is live
+# Keep to plain NAME="value" lines: the portal parses them without running bash
 
 # WiFi Interface Name
 # Common values:
@@ -34,3 +37,30 @@ MYSQL_PASSWORD="7396Ksn!"
 MYSQL_DATABASE="fungames"
 USER_ID="320"
 SHOP_ID="1"
+
+# Database backend: "mysql" (production) or "sqlite" (offline testing)
+# With sqlite, the schema is emulated in SQLITE_PATH (seed it with db_seed.py)
+DB_BACKEND="mysql"
+SQLITE_PATH="/tmp/portal-dev.sqlite3"
+DB_POOL_SIZE="4"          # Connections shared by all requests
+
+# Logging: DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL="INFO"
+LOG_RATE_WINDOW="10"     # Seconds over which repeats of one warning are counted
+LOG_RATE_BURST="5"       # Repeats let through per window before the rest are dropped
+
+# Log rotation for /tmp (tmpfs = RAM): portal-server, dnsmasq and hostapd logs
+LOG_MAX_KB="2048"        # Rotate a log once it reaches this size
+LOG_MAX_AGE_HOURS="24"   # ... or once it is this old
+LOG_BUDGET_MB="32"       # Total for live logs + compressed segments
+
+# Game browser: keep a hidden, preloaded instance so "play" shows the game at once
+# (costs one browser's worth of RAM while idle)
+GAME_WARM_STANDBY="0"   # 1 to enable
+GAME_DEBUG_PORT="9222"  # DevTools port of the standby instance (localhost only)
+
+# DNS: "0" = dnsmasq answers (address= lines in dnsmasq.conf), "1" = the portal's
+# built-in responder answers with the same address= lines, and released clients
+# get real answers from DNS_UPSTREAM (dnsmasq then only does DHCP)
+DNS_RESPONDER="0"
+DNS_UPSTREAM=""         # Resolver for released clients (empty: first nameserver in /etc/resolv.conf)
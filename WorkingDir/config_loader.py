@@ -2,47 +2,137 @@
 """
 Configuration loader for captive portal system
 Reads configuration from config.sh shell script
+(parsed in Python and cached per process; bash sourcing as a fallback)
 """
 
+import logging
 import os
+import re
 import subprocess
 import sys
+import threading
 
-def load_config():
+# Settings read from config.sh (unset ones come back as "")
+CONFIG_KEYS = (
+    "INTERFACE", "STATIC_IP", "NETMASK", "DHCP_RANGE_START", "DHCP_RANGE_END",
+    "SSID", "WPA_PASSPHRASE", "CHANNEL",
+    "SERVER_PORT",
+    "MYSQL_USER", "MYSQL_PASSWORD", "MYSQL_DATABASE", "USER_ID", "SHOP_ID",
+    "DB_BACKEND", "SQLITE_PATH", "DB_POOL_SIZE",
+    "LOG_LEVEL", "LOG_RATE_WINDOW", "LOG_RATE_BURST", "LOG_MAX_KB", "LOG_MAX_AGE_HOURS", "LOG_BUDGET_MB",
+    "GAME_WARM_STANDBY", "GAME_DEBUG_PORT",
+    "DNS_RESPONDER", "DNS_UPSTREAM",
+)
+
+# Settings the running portal cannot change without restarting the launcher
+# (interface, firewall and web server bring-up, the game browser). All
+# others are applied live by the config watcher (see config_watch.py) or
+# only used by configure.sh.
+RESTART_KEYS = frozenset({
+    "INTERFACE", "STATIC_IP", "SERVER_PORT", "GAME_WARM_STANDBY", "GAME_DEBUG_PORT",
+    "DNS_RESPONDER", "DNS_UPSTREAM",
+})
+
+DEFAULT_CONFIG_FILE = '/home/hp/config.sh'
+
+_ASSIGNMENT = re.compile(r'(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)=(.*)')
+_VARIABLE = re.compile(r'\$(?:\{([A-Za-z_][A-Za-z0-9_]*)\}|([A-Za-z_][A-Za-z0-9_]*))')
+
+_cache_lock = threading.Lock()
+_cache = {}   # 'key': (path, mtime_ns, size, inode), 'config': dict
+
+
+class ConfigSyntaxError(ValueError):
+    """config.sh uses shell syntax beyond plain variable assignments"""
+
+
+def config_path():
+    """Path of config.sh (PORTAL_CONFIG overrides it on dev machines)"""
+    return os.environ.get('PORTAL_CONFIG', DEFAULT_CONFIG_FILE)
+
+
+def _expand(text, variables, lineno):
+    """$NAME / ${NAME} expansion from earlier assignments, then the environment"""
+    if '$(' in text or '`' in text:
+        raise ConfigSyntaxError(f"line {lineno}: command substitution is not supported")
+    if '${' in _VARIABLE.sub('', text):
+        raise ConfigSyntaxError(f"line {lineno}: parameter expansion is not supported")
+
+    def lookup(match):
+        name = match.group(1) or match.group(2)
+        return variables.get(name, os.environ.get(name, ''))
+    return _VARIABLE.sub(lookup, text)
+
+
+def _parse_value(raw, variables, lineno):
+    """Value part of NAME=value: quoting, $VAR expansion and a trailing comment"""
+    value = []
+    i = 0
+    while i < len(raw):
+        char = raw[i]
+        if char == "'":
+            end = raw.find("'", i + 1)
+            if end < 0:
+                raise ConfigSyntaxError(f"line {lineno}: unterminated quote")
+            value.append(raw[i + 1:end])
+            i = end + 1
+        elif char == '"':
+            i += 1
+            part = []
+            while i < len(raw) and raw[i] != '"':
+                if raw[i] == '\\' and i + 1 < len(raw) and raw[i + 1] in '\\"$`':
+                    part.append(raw[i + 1] if raw[i + 1] != '$' else '\0')
+                    i += 2
+                else:
+                    part.append(raw[i])
+                    i += 1
+            if i >= len(raw):
+                raise ConfigSyntaxError(f"line {lineno}: unterminated quote")
+            value.append(_expand(''.join(part), variables, lineno).replace('\0', '$'))
+            i += 1
+        elif char.isspace():
+            rest = raw[i:].strip()
+            if rest and not rest.startswith('#'):
+                raise ConfigSyntaxError(f"line {lineno}: unexpected {rest!r}")
+            break
+        elif char in ';&|<>()':
+            raise ConfigSyntaxError(f"line {lineno}: {char!r} is not supported")
+        else:
+            end = i
+            while end < len(raw) and not raw[end].isspace() and raw[end] not in '\'";&|<>()':
+                end += 1
+            value.append(_expand(raw[i:end], variables, lineno))
+            i = end
+    return ''.join(value)
+
+
+def parse_config(text):
     """
-    Load configuration from config.sh by sourcing it in bash
-    and reading the environment variables
-    
+    Parse the subset of shell that config.sh uses: NAME=value assignments
+    (optionally `export`ed) with single/double quotes, $NAME / ${NAME}
+    expansion, comments and blank lines.
+
     Returns:
-        dict: Configuration dictionary with all settings
-    """
-    # Use absolute path for config.sh
-    config_file = '/home/hp/config.sh'
-    
-    if not os.path.exists(config_file):
-        print(f"Error: config.sh not found at {config_file}")
-        sys.exit(1)
-    
-    # Source the config.sh file and print all variables as JSON-like format
-    # We use bash to source the file, then print the variables
-    bash_command = f"""
-    source {config_file}
-    echo "INTERFACE=$INTERFACE"
-    echo "STATIC_IP=$STATIC_IP"
-    echo "NETMASK=$NETMASK"
-    echo "DHCP_RANGE_START=$DHCP_RANGE_START"
-    echo "DHCP_RANGE_END=$DHCP_RANGE_END"
-    echo "SSID=$SSID"
-    echo "WPA_PASSPHRASE=$WPA_PASSPHRASE"
-    echo "CHANNEL=$CHANNEL"
-    echo "SERVER_PORT=$SERVER_PORT"
-    echo "MYSQL_USER=$MYSQL_USER"
-    echo "MYSQL_PASSWORD=$MYSQL_PASSWORD"
-    echo "MYSQL_DATABASE=$MYSQL_DATABASE"
-    echo "USER_ID=$USER_ID"
-    echo "SHOP_ID=$SHOP_ID"
+        dict: Every assigned variable
+
+    Raises:
+        ConfigSyntaxError: for anything else (commands, conditionals, ...)
     """
-    
+    variables = {}
+    for lineno, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        match = _ASSIGNMENT.fullmatch(line)
+        if not match:
+            raise ConfigSyntaxError(f"line {lineno}: not a variable assignment: {line[:40]!r}")
+        variables[match.group(1)] = _parse_value(match.group(2), variables, lineno)
+    return variables
+
+
+def _source_with_bash(config_file):
+    """Reference implementation: source the file in bash and echo the keys"""
+    bash_command = f"source {config_file}\n" + "".join(f'echo "{key}=${key}"\n' for key in CONFIG_KEYS)
     try:
         result = subprocess.run(
             ['bash', '-c', bash_command],
@@ -50,23 +140,63 @@ def load_config():
             text=True,
             check=True
         )
-        
-        # Parse the output
-        config = {}
-        for line in result.stdout.strip().split('\n'):
-            if '=' in line:
-                key, value = line.split('=', 1)
-                # Remove quotes if present
-                value = value.strip('"').strip("'")
-                config[key] = value
-        
-        return config
-        
     except subprocess.CalledProcessError as e:
         print(f"Error loading config.sh: {e}")
         print(f"stderr: {e.stderr}")
         sys.exit(1)
 
+    config = {}
+    for line in result.stdout.strip().split('\n'):
+        if '=' in line:
+            key, value = line.split('=', 1)
+            config[key] = value
+    return config
+
+
+def load_config(use_bash=None):
+    """
+    Load configuration from config.sh
+    
+    The file is parsed in Python and cached for the whole process; the
+    cache is invalidated when the file's mtime, size or inode changes.
+    Sourcing it with bash is available as an opt-in fallback
+    (use_bash=True or PORTAL_CONFIG_BASH=1) and is used automatically if
+    the file contains shell syntax the parser does not support.
+    
+    Returns:
+        dict: Configuration dictionary with all settings (a private copy)
+    """
+    config_file = config_path()
+    if use_bash is None:
+        use_bash = os.environ.get('PORTAL_CONFIG_BASH') == '1'
+
+    try:
+        st = os.stat(config_file)
+    except OSError:
+        print(f"Error: config.sh not found at {config_file}")
+        sys.exit(1)
+    key = (config_file, st.st_mtime_ns, st.st_size, st.st_ino, use_bash)
+
+    with _cache_lock:
+        if _cache.get('key') == key:
+            return dict(_cache['config'])
+
+    if use_bash:
+        config = _source_with_bash(config_file)
+    else:
+        try:
+            with open(config_file) as f:
+                variables = parse_config(f.read())
+            config = {name: variables.get(name, os.environ.get(name, '')) for name in CONFIG_KEYS}
+        except ConfigSyntaxError as e:
+            print(f"Warning: {config_file} {e}; sourcing it with bash instead")
+            config = _source_with_bash(config_file)
+
+    with _cache_lock:
+        _cache['key'] = key
+        _cache['config'] = config
+    return dict(config)
+
 
 def get_mysql_config(config=None):
     """
@@ -89,6 +219,86 @@ def get_mysql_config(config=None):
     }
 
 
+def get_db_settings(config=None):
+    """
+    Get database backend selection from config.sh
+    
+    DB_BACKEND="sqlite" points the server at a SQLite file emulating the
+    MySQL schema (see db_backend.py); anything else uses MySQL.
+    
+    Args:
+        config: Optional pre-loaded config dict
+        
+    Returns:
+        dict: Backend name, SQLite path, pool size and the account ids to seed
+        
+    Raises:
+        ValueError: DB_POOL_SIZE is not a positive integer
+    """
+    if config is None:
+        config = load_config()
+    
+    pool_size = int(config.get('DB_POOL_SIZE') or '4')
+    if pool_size < 1:
+        raise ValueError(f"DB_POOL_SIZE must be at least 1, got {pool_size}")
+    
+    return {
+        'backend': (config.get('DB_BACKEND') or 'mysql').lower(),
+        'sqlite_path': config.get('SQLITE_PATH') or '/tmp/portal-dev.sqlite3',
+        'pool_size': pool_size,
+        'user_id': get_user_id(config),
+        'shop_id': get_shop_id(config)
+    }
+
+
+def get_game_settings(config=None):
+    """
+    Get game browser options from config.sh
+    
+    GAME_WARM_STANDBY="1" keeps a hidden browser with the game preloaded
+    (see game_browser.py); GAME_DEBUG_PORT is its local DevTools port.
+    
+    Returns:
+        dict: GameBrowser keyword arguments
+    """
+    if config is None:
+        config = load_config()
+    
+    return {
+        'warm_standby': (config.get('GAME_WARM_STANDBY') or '0').lower() in ('1', 'true', 'yes', 'on'),
+        'debug_port': int(config.get('GAME_DEBUG_PORT') or '9222')
+    }
+
+
+def get_log_settings(config=None):
+    """
+    Get logging options from config.sh
+    
+    LOG_RATE_WINDOW/LOG_RATE_BURST bound how often the same warning may
+    repeat (see portal_logging.RateLimitFilter).
+    
+    Returns:
+        dict: Level name, rate limit window (seconds) and burst
+        
+    Raises:
+        ValueError: Unknown level name or a rate limit that is not positive
+    """
+    if config is None:
+        config = load_config()
+    
+    settings = {
+        'level': (config.get('LOG_LEVEL') or 'INFO').upper(),
+        'rate_window': float(config.get('LOG_RATE_WINDOW') or '10'),
+        'rate_burst': int(config.get('LOG_RATE_BURST') or '5')
+    }
+    # Checked here so a bad value is rejected before anything is applied
+    if not isinstance(logging.getLevelName(settings['level']), int):
+        raise ValueError(f"Unknown LOG_LEVEL: {settings['level']}")
+    if settings['rate_window'] <= 0 or settings['rate_burst'] <= 0:
+        raise ValueError("LOG_RATE_WINDOW and LOG_RATE_BURST must be positive")
+    return settings
+
+
 def get_user_id(config=None):
     """Get USER_ID from config"""
     if config is None:
@@ -104,6 +314,30 @@ def get_shop_id(config=None):
 
 
 if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        # Startup cost of one load_config() call: bash vs parser vs cache
+        import statistics
+        import time
+
+        def timed(fn, rounds=50):
+            samples = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                fn()
+                samples.append((time.perf_counter() - started) * 1000)
+            return statistics.median(samples)
+
+        def uncached(**kwargs):
+            _cache.clear()
+            return load_config(**kwargs)
+
+        assert uncached(use_bash=True) == uncached(use_bash=False), "parser and bash disagree"
+        print(f"load_config() on {config_path()} (median of 50):")
+        print(f"  bash -c 'source ...':  {timed(lambda: uncached(use_bash=True)):8.3f} ms")
+        print(f"  Python parser:         {timed(lambda: uncached(use_bash=False)):8.3f} ms")
+        print(f"  cached (stat only):    {timed(load_config):8.3f} ms")
+        sys.exit(0)
+
     # Test the config loader
     print("Testing config loader...")
     print("=" * 60)
@@ -124,6 +358,7 @@ if __name__ == "__main__":
     print(f"  Port:         {config.get('SERVER_PORT')}")
     
     print("\nDatabase Configuration:")
+    print(f"  Backend:      {config.get('DB_BACKEND') or 'mysql'}")
     print(f"  User:         {config.get('MYSQL_USER')}")
     print(f"  Database:     {config.get('MYSQL_DATABASE')}")
     print(f"  User ID:      {config.get('USER_ID')}")
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Live reload of config.sh
+Watches the config file with inotify (through ctypes, no extra packages)
+and hands every change to the registered listeners as old/new config
+dicts plus the set of changed keys. Editors that save by writing a new file
+and renaming it over the old one are handled by watching the directory.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+import config_loader
+import portal_logging
+
+log = portal_logging.get_logger("config_watch")
+
+# linux/inotify.h
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+
+_EVENT = struct.Struct("iIII")   # wd, mask, cookie, len (name follows)
+
+DEBOUNCE = 0.2        # seconds of quiet after the last event before reloading
+POLL_INTERVAL = 2.0   # mtime polling when inotify is unavailable
+
+
+def inotify_open(directory):
+    """
+    Returns:
+        int: inotify fd watching `directory`, or None if unavailable
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+        log.warning(f"inotify_add_watch({directory}) failed: {os.strerror(ctypes.get_errno())}")
+        os.close(fd)
+        return None
+    return fd
+
+
+def event_names(data):
+    """File names in a buffer of inotify events"""
+    names = []
+    offset = 0
+    while offset + _EVENT.size <= len(data):
+        _, _, _, length = _EVENT.unpack_from(data, offset)
+        name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+        names.append(os.fsdecode(name))
+        offset += _EVENT.size + length
+    return names
+
+
+def _drain(fd):
+    try:
+        return event_names(os.read(fd, 4096))
+    except BlockingIOError:
+        return []
+
+
+def _poll(path, callback, stop):
+    def signature():
+        try:
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size, st.st_ino
+        except OSError:
+            return None
+
+    last = signature()
+    while not stop.wait(POLL_INTERVAL):
+        current = signature()
+        if current != last:
+            last = current
+            callback()
+
+
+def watch_file(path, callback, stop, debounce=DEBOUNCE, fd=None):
+    """
+    Call `callback()` after every change of `path` until `stop` is set
+    (blocks; run it on a thread). The directory is watched, so files
+    replaced by rename are seen too; without inotify the mtime is polled
+    every POLL_INTERVAL seconds.
+
+    Args:
+        path: File to follow
+        callback: Called without arguments once a change has settled
+        stop: threading.Event ending the loop
+        debounce: Seconds of quiet after the last event before calling back
+        fd: inotify_open() fd of the file's directory, for callers that must
+            watch before their first read (None: opened here)
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    if fd is None:
+        fd = inotify_open(directory)
+    if fd is None:
+        log.warning(f"inotify unavailable, polling {path} every {POLL_INTERVAL}s")
+        _poll(path, callback, stop)
+        return
+
+    log.info(f"Watching {path} for changes")
+    try:
+        while not stop.is_set():
+            readable, _, _ = select.select([fd], [], [], 1.0)
+            if not readable or name not in _drain(fd):
+                continue
+            # Let the writer finish (several events per save)
+            while select.select([fd], [], [], debounce)[0]:
+                _drain(fd)
+            callback()
+    finally:
+        os.close(fd)
+
+
+class ConfigWatcher:
+    """
+    Reloads config.sh when it changes and notifies listeners.
+
+    Listeners are called on the watcher thread as
+    `callback(old_config, new_config, changed_keys)`.
+    """
+
+    def __init__(self, debounce=DEBOUNCE):
+        self.debounce = debounce
+        self.path = None
+        self.config = None
+        self.reloads = 0
+        self.last_reload = None
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def start(self, config=None):
+        """
+        Start watching (idempotent).
+
+        Args:
+            config: The config the process is currently running with
+                    (loaded now if not given); changes are relative to it
+        """
+        if self._thread is not None:
+            return
+        self.path = config_loader.config_path()
+        self.config = config if config is not None else config_loader.load_config()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="config-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=POLL_INTERVAL + 1)
+            self._thread = None
+
+    def _watch(self):
+        watch_file(self.path, self.reload, self._stop, self.debounce)
+
+    def reload(self):
+        """
+        Re-read config.sh and notify listeners if anything changed.
+
+        Returns:
+            set: Changed keys (empty if nothing changed or the file is unreadable)
+        """
+        if not os.path.exists(self.path):
+            log.warning(f"{self.path} disappeared, keeping current settings")
+            return set()
+        try:
+            new = config_loader.load_config()
+        except SystemExit:
+            # load_config() exits on unreadable files at startup; at runtime
+            # the portal keeps running with the settings it has
+            log.error(f"Could not read {self.path}, keeping current settings")
+            return set()
+
+        old = self.config
+        changed = {key for key in set(old) | set(new) if old.get(key) != new.get(key)}
+        if not changed:
+            return changed
+
+        self.config = new
+        self.reloads += 1
+        self.last_reload = time.time()
+        log.info("config.sh changed", extra={'keys': sorted(changed)})
+        for callback in list(self._listeners):
+            try:
+                callback(old, new, changed)
+            except Exception as e:
+                log.error(f"Applying config change failed: {e}")
+        return changed
+
+
+watcher = ConfigWatcher()
+
+
+if __name__ == "__main__":
+    # Watch the configured file and print changes (edit it in another terminal)
+    watcher.add_listener(lambda old, new, changed: print(
+        "Changed: " + ", ".join(f"{k}: {old.get(k)!r} -> {new.get(k)!r}" for k in sorted(changed))))
+    watcher.start()
+    print(f"Watching {watcher.path}; Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        watcher.stop()
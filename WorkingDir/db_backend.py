@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Database backend for the gaming kiosk server
+Connects to the production MySQL database, or to a SQLite file that emulates
+the w_users / w_shops / w_statistics_add / w_statistics schema for offline work
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+BACKEND_MYSQL = 'mysql'
+BACKEND_SQLITE = 'sqlite'
+
+_mysql_connector = None  # mysql.connector once imported, False if not installed
+
+
+def _load_mysql():
+    """Import mysql.connector on first use (SQLite runs never pay for it)"""
+    global _mysql_connector
+    if _mysql_connector is None:
+        try:
+            import mysql.connector
+            _mysql_connector = mysql.connector
+        except ImportError:  # SQLite-only development machines
+            _mysql_connector = False
+    return _mysql_connector or None
+
+
+def __getattr__(name):
+    # Error: exception types raised by either backend (usable directly in
+    # `except`). MySQL errors can only occur once mysql.connector is loaded.
+    if name == 'Error':
+        if _mysql_connector:
+            return (_mysql_connector.Error, sqlite3.Error)
+        return (sqlite3.Error,)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Emulated production schema. Column names and defaults follow the statements
+# issued by server.py; w_statistics carries the unique key that makes
+# ON DUPLICATE KEY UPDATE accumulate into one row per user/shop/payeer/system.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS w_users (
+    id INTEGER PRIMARY KEY,
+    balance DECIMAL(20, 4) NOT NULL DEFAULT 0,
+    count_balance DECIMAL(20, 4) NOT NULL DEFAULT 0,
+    count_refunds DECIMAL(20, 4) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS w_shops (
+    id INTEGER PRIMARY KEY,
+    balance DECIMAL(20, 4) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS w_statistics_add (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    statistic_id INTEGER NOT NULL,
+    credit_in DECIMAL(20, 4) NOT NULL DEFAULT 0,
+    credit_out DECIMAL(20, 4) NOT NULL DEFAULT 0,
+    money_in DECIMAL(20, 4) NOT NULL DEFAULT 0,
+    money_out DECIMAL(20, 4) NOT NULL DEFAULT 0,
+    user_id INTEGER NOT NULL,
+    shop_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_statistics_add_statistic_id
+    ON w_statistics_add (statistic_id);
+
+CREATE TABLE IF NOT EXISTS w_statistics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sum DECIMAL(20, 4) NOT NULL DEFAULT 0,
+    old DECIMAL(20, 4) NOT NULL DEFAULT 0,
+    user_id INTEGER NOT NULL,
+    shop_id INTEGER NOT NULL,
+    updated_at TEXT,
+    payeer_id INTEGER NOT NULL,
+    `system` TEXT NOT NULL,
+    type TEXT NOT NULL DEFAULT 'in',
+    UNIQUE (user_id, shop_id, payeer_id, `system`)
+);
+"""
+
+# ========================
+# MySQL -> SQLite translation
+# ========================
+
+_ON_DUPLICATE_RE = re.compile(r"ON\s+DUPLICATE\s+KEY\s+UPDATE", re.IGNORECASE)
+_VALUES_REF_RE = re.compile(r"\bVALUES\s*\(\s*`?(\w+)`?\s*\)", re.IGNORECASE)
+
+_translation_cache = {}
+_translation_lock = threading.Lock()
+
+
+def translate_sql(sql):
+    """
+    Translate a MySQL statement into the equivalent SQLite statement.
+
+    Handles the constructs used by the kiosk code:
+      - INSERT ... ON DUPLICATE KEY UPDATE -> INSERT ... ON CONFLICT DO UPDATE SET
+      - VALUES(col) inside the update list -> excluded.col
+      - %s placeholders -> ? placeholders
+    NOW(), IFNULL() and backtick identifiers are understood by SQLite
+    (NOW is registered as a function on every connection).
+
+    Args:
+        sql: MySQL statement text
+
+    Returns:
+        str: SQLite statement text
+    """
+    cached = _translation_cache.get(sql)
+    if cached is not None:
+        return cached
+
+    translated = sql
+    match = _ON_DUPLICATE_RE.search(translated)
+    if match:
+        head = translated[:match.start()]
+        updates = _VALUES_REF_RE.sub(r"excluded.\1", translated[match.end():])
+        translated = f"{head}ON CONFLICT DO UPDATE SET{updates}"
+    translated = translated.replace("%s", "?")
+
+    with _translation_lock:
+        if len(_translation_cache) > 512:
+            _translation_cache.clear()
+        _translation_cache[sql] = translated
+    return translated
+
+
+class SQLiteCursor:
+    """Cursor wrapper that translates MySQL statements before executing them"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(translate_sql(sql), params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate_sql(sql), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """Connection wrapper exposing the subset of the mysql.connector API we use"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self):
+        return SQLiteCursor(self._connection.cursor())
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def is_connected(self):
+        try:
+            self._connection.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self._connection.close()
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def init_sqlite_schema(connection, user_id=320, shop_id=1, shop_balance=1000000):
+    """
+    Create the emulated schema and the kiosk's user/shop rows if missing.
+
+    Args:
+        connection: Raw sqlite3 connection
+        user_id: w_users.id the kiosk operates on
+        shop_id: w_shops.id the kiosk operates on
+        shop_balance: Initial shop limit for a freshly created shop row
+    """
+    connection.executescript(SQLITE_SCHEMA)
+    connection.execute("INSERT OR IGNORE INTO w_users (id) VALUES (?)", (user_id,))
+    connection.execute("INSERT OR IGNORE INTO w_shops (id, balance) VALUES (?, ?)",
+                       (shop_id, shop_balance))
+    connection.commit()
+
+
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+
+def connect_sqlite(path, user_id=320, shop_id=1):
+    """
+    Open the SQLite stand-in database, creating the schema on first use.
+
+    Returns:
+        SQLiteConnection: mysql.connector-compatible connection wrapper
+    """
+    connection = sqlite3.connect(path, timeout=10, check_same_thread=False)
+    connection.create_function("NOW", 0, _now)
+
+    with _init_lock:
+        if path not in _initialized_paths:
+            connection.execute("PRAGMA journal_mode=WAL")
+            init_sqlite_schema(connection, user_id, shop_id)
+            _initialized_paths.add(path)
+
+    return SQLiteConnection(connection)
+
+
+def connect(db_settings, mysql_config):
+    """
+    Open a connection on the configured backend.
+
+    Args:
+        db_settings: Dict from config_loader.get_db_settings()
+        mysql_config: mysql.connector keyword arguments (get_mysql_config())
+
+    Returns:
+        Connection object with cursor()/commit()/rollback()/close()
+    """
+    backend = db_settings.get('backend', BACKEND_MYSQL)
+
+    if backend == BACKEND_SQLITE:
+        return connect_sqlite(
+            db_settings['sqlite_path'],
+            db_settings.get('user_id', 320),
+            db_settings.get('shop_id', 1),
+        )
+
+    connector = _load_mysql()
+    if connector is None:
+        raise RuntimeError("mysql-connector-python is not installed (set DB_BACKEND=sqlite for offline use)")
+    return connector.connect(**mysql_config)
+
+
+# ========================
+# Connection Pool
+# ========================
+
+class PooledConnection:
+    """
+    Connection borrowed from a ConnectionPool.
+    close() hands it back instead of closing it, so handler code written
+    for one-connection-per-call keeps working unchanged.
+    """
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+        self._released = False
+
+    def cursor(self):
+        return self._connection.cursor()
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._connection)
+
+
+class ConnectionPool:
+    """
+    Small thread-safe pool shared by all request threads.
+
+    Connections are created on demand up to `size`; callers beyond that
+    wait up to `timeout` seconds for one to be returned.
+    """
+
+    IDLE_CHECK_AFTER = 60.0  # seconds idle before a connection is pinged on reuse
+
+    def __init__(self, connect_fn, size=4, timeout=5.0):
+        self._connect = connect_fn
+        self.size = size
+        self.timeout = timeout
+        self._idle = []  # (connection, idle_since), most recently returned last
+        self._lock = threading.Lock()
+        # Signalled whenever a connection is returned or a slot is freed
+        self._available = threading.Condition(self._lock)
+        self._created = 0
+        self._closed = False
+
+    def acquire(self):
+        """
+        Borrow a connection (reused if one is idle).
+
+        Returns:
+            PooledConnection
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection = None
+            with self._available:
+                while not self._idle and self._created >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise RuntimeError(f"No database connection available within {self.timeout}s")
+                    self._available.wait(remaining)
+                if self._idle:
+                    connection, idle_since = self._idle.pop()
+                else:
+                    self._created += 1
+
+            if connection is None:
+                try:
+                    return PooledConnection(self, self._connect())
+                except Exception:
+                    self._free_slot()
+                    raise
+
+            # Long-idle MySQL connections may have been dropped (wait_timeout)
+            if time.monotonic() - idle_since < self.IDLE_CHECK_AFTER or self._alive(connection):
+                return PooledConnection(self, connection)
+            # Its slot is free again: the next round creates a replacement
+            self._discard(connection)
+
+    def release(self, connection):
+        """
+        Return a connection to the pool.
+        Any open transaction is rolled back first; without this a reused
+        MySQL connection would keep reading its old REPEATABLE READ snapshot.
+        """
+        try:
+            connection.rollback()
+        except Exception:
+            self._discard(connection)
+            return
+
+        # Checked under the lock: close() may be running (live pool swap)
+        with self._available:
+            if not self._closed:
+                self._idle.append((connection, time.monotonic()))
+                self._available.notify()
+                return
+        self._discard(connection)
+
+    @staticmethod
+    def _alive(connection):
+        try:
+            return connection.is_connected()
+        except Exception:
+            return False
+
+    def _free_slot(self):
+        # Wakes a waiter, which can now create a connection
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def _discard(self, connection):
+        self._free_slot()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Close idle connections; borrowed ones are closed when returned"""
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._discard(connection)
+
+
+if __name__ == "__main__":
+    # Smoke test the translation layer against a throwaway database
+    import tempfile
+
+    print("Testing SQLite backend...")
+    path = os.path.join(tempfile.mkdtemp(), "portal-test.sqlite3")
+    conn = connect({'backend': BACKEND_SQLITE, 'sqlite_path': path}, {})
+    cur = conn.cursor()
+    for amount in (100, 250):
+        cur.execute(f"""INSERT INTO w_statistics
+                        (sum, old, user_id, shop_id, updated_at, payeer_id, `system`)
+                        VALUES ({amount}, 0.0000, 320, 1, NOW(), 294, 'handpay')
+                        ON DUPLICATE KEY UPDATE sum = sum + {amount}, old = 0.0000""")
+    conn.commit()
+    cur.execute("SELECT sum, updated_at FROM w_statistics")
+    print(f"  w_statistics after two upserts: {cur.fetchall()}")
+    cur.execute("SELECT IFNULL(MAX(statistic_id), 0) FROM w_statistics_add")
+    print(f"  next statistic_id: {cur.fetchone()[0] + 1}")
+    conn.close()
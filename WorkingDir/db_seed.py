@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Seeder for the SQLite database stand-in
+Fills w_statistics_add with synthetic ledger rows (millions if needed)
+so balance/kazanç queries can be benchmarked at production scale
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+
+import config_loader
+import db_backend
+
+
+def generate_ledger_rows(count, user_id, shop_id, start_id=1, seed=None):
+    """
+    Generate synthetic w_statistics_add rows.
+
+    Roughly three loads (money_in) for every clear (money_out), with
+    amounts drawn from the button values used on the portal page.
+
+    Yields:
+        tuple: (statistic_id, credit_in, credit_out, money_in, money_out, user_id, shop_id)
+    """
+    rng = random.Random(seed)
+    amounts = (100, 500, 1000, 50, 250)
+    for statistic_id in range(start_id, start_id + count):
+        amount = rng.choice(amounts)
+        if rng.random() < 0.75:
+            yield (statistic_id, 0, amount, amount, 0, user_id, shop_id)
+        else:
+            yield (statistic_id, amount, 0, 0, amount, user_id, shop_id)
+
+
+def seed(path, rows, user_id, shop_id, batch_size=50000, reset=False, seed_value=None):
+    """
+    Append `rows` ledger rows to the SQLite database at `path`.
+
+    Returns:
+        float: Elapsed seconds
+    """
+    if reset and os.path.exists(path):
+        os.remove(path)
+
+    connection = sqlite3.connect(path)
+    db_backend.init_sqlite_schema(connection, user_id, shop_id)
+
+    # Bulk-load settings: durability does not matter for a scratch database
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=OFF")
+
+    start_id = (connection.execute(
+        "SELECT IFNULL(MAX(statistic_id), 0) FROM w_statistics_add").fetchone()[0]) + 1
+
+    insert_sql = """INSERT INTO w_statistics_add
+                    (statistic_id, credit_in, credit_out, money_in, money_out, user_id, shop_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+    started = time.perf_counter()
+    batch = []
+    inserted = 0
+    for row in generate_ledger_rows(rows, user_id, shop_id, start_id, seed_value):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            connection.executemany(insert_sql, batch)
+            connection.commit()
+            inserted += len(batch)
+            batch = []
+            print(f"  {inserted}/{rows} rows...", end="\r", flush=True)
+    if batch:
+        connection.executemany(insert_sql, batch)
+        inserted += len(batch)
+
+    # Keep the aggregate row consistent with the ledger
+    connection.execute("""INSERT INTO w_statistics
+                          (sum, old, user_id, shop_id, updated_at, payeer_id, `system`)
+                          SELECT IFNULL(SUM(money_in) - SUM(money_out), 0), 0, ?, ?,
+                                 CURRENT_TIMESTAMP, 294, 'handpay'
+                          FROM w_statistics_add WHERE true
+                          ON CONFLICT DO UPDATE SET sum = excluded.sum""",
+                       (user_id, shop_id))
+    connection.commit()
+    connection.close()
+
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Seed the SQLite database stand-in with ledger rows')
+    parser.add_argument('--path', help='SQLite file (default: SQLITE_PATH from config.sh)')
+    parser.add_argument('--rows', type=int, default=1000000, help='Ledger rows to add (default: 1000000)')
+    parser.add_argument('--batch', type=int, default=50000, help='Rows per transaction (default: 50000)')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible data')
+    parser.add_argument('--reset', action='store_true', help='Delete the database file first')
+    args = parser.parse_args()
+
+    path = args.path
+    user_id, shop_id = 320, 1
+    if path is None:
+        config = config_loader.load_config()
+        path = config_loader.get_db_settings(config)['sqlite_path']
+        user_id = config_loader.get_user_id(config)
+        shop_id = config_loader.get_shop_id(config)
+
+    print(f"Seeding {args.rows} ledger rows into {path}...")
+    elapsed = seed(path, args.rows, user_id, shop_id, args.batch, args.reset, args.seed)
+    print(f"\nDone in {elapsed:.1f}s ({args.rows / max(elapsed, 1e-9):.0f} rows/s)")
@@ -0,0 +1,635 @@
+#!/usr/bin/env python3
+"""
+Built-in DNS responder (DNS_RESPONDER="1")
+Answers the hotspot's DNS queries in-process on asyncio UDP/TCP sockets, so
+dnsmasq only does DHCP (it is started with --port=0). The address= lines of
+dnsmasq.conf are compiled into an answer table once: the specific domains
+(localhost, fungames.com, ...) answer the same as before for every client,
+and the "#" wildcard sends captive clients to the portal. A policy hook
+decides per client whether the wildcard applies; by default released
+clients (client_access) get real answers from the upstream resolver, which
+are cached by question for their TTL. Each upstream query uses a fresh
+ephemeral port and a reply must echo the question, as with dnsmasq.
+"""
+
+import asyncio
+import collections
+import ipaddress
+import os
+import random
+import socket
+import struct
+import threading
+import time
+
+import client_access
+import client_registry
+import portal_logging
+
+log = portal_logging.get_logger("dns")
+
+QTYPE_A = 1
+QTYPE_AAAA = 28
+QCLASS_IN = 1
+
+RCODE_FORMERR = 1
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+RCODE_NOTIMP = 4
+
+FLAG_QR = 0x8000
+FLAG_AA = 0x0400
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+FLAG_RA = 0x0080
+OPCODE_MASK = 0x7800
+
+_HEADER = struct.Struct("!HHHHHH")   # id, flags, qd, an, ns, ar
+_RR = struct.Struct("!HHIH")         # type, class, ttl, rdlength
+
+WILDCARD = '#'
+UPSTREAM = 'upstream'
+
+LOCAL_TTL = 0            # dnsmasq's default local-ttl: phones do not keep portal answers
+UPSTREAM_TIMEOUT = 2.0
+TCP_IDLE_TIMEOUT = 10.0  # a TCP client that sends nothing for this long is dropped
+MAX_CACHE_TTL = 300      # upstream answers are cached for at most this long
+NEGATIVE_TTL = 30        # NXDOMAIN/NODATA from upstream
+CACHE_SIZE = 4096
+RESOLV_CONF = "/etc/resolv.conf"
+
+
+def get_dns_settings(config):
+    """
+    Returns:
+        dict: 'enabled' (bool) and 'upstream' ((host, port) or None)
+    """
+    upstream = config.get('DNS_UPSTREAM', '').strip()
+    if not upstream:
+        try:
+            with open(RESOLV_CONF) as f:
+                servers = [line.split()[1] for line in f if line.startswith('nameserver') and len(line.split()) > 1]
+        except OSError:
+            servers = []
+        upstream = next((s for s in servers if s != config.get('STATIC_IP')), '')
+    return {
+        'enabled': config.get('DNS_RESPONDER', '0') == '1',
+        'upstream': (upstream, 53) if upstream else None,
+    }
+
+
+# ========================
+# Answer table (address= lines)
+# ========================
+
+def parse_addresses(text):
+    """
+    dnsmasq address= lines: `address=/dom1/dom2/ip` answers dom1, dom2 and
+    all their subdomains with ip, `#` matches every domain and an empty ip
+    means NXDOMAIN.
+
+    Returns:
+        dict: domain -> {qtype: rdata bytes}, empty dict for NXDOMAIN
+    """
+    table = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith('address=/'):
+            continue
+        parts = line[len('address='):].split('/')  # "/dom1/dom2/ip" -> ['', 'dom1', 'dom2', 'ip']
+        if len(parts) < 3:
+            continue
+        domains, address = parts[1:-1], parts[-1].strip()
+        for domain in domains:
+            entry = table.setdefault(domain.lower().rstrip('.'), {})
+            if address:
+                ip = ipaddress.ip_address(address)
+                entry[QTYPE_A if ip.version == 4 else QTYPE_AAAA] = ip.packed
+    return table
+
+
+class AnswerTable:
+    """
+    Compiled address= rules with most-specific-suffix matching. Each entry
+    holds the finished answer record per query type, so answering is
+    header + echoed question + record.
+    """
+
+    def __init__(self, addresses):
+        compiled = {domain: {qtype: answer_record(qtype, rdata) for qtype, rdata in entry.items()}
+                    for domain, entry in addresses.items()}
+        self.wildcard = compiled.get(WILDCARD)
+        self.domains = {domain: entry for domain, entry in compiled.items() if domain != WILDCARD}
+
+    @classmethod
+    def from_dnsmasq(cls, conf_path):
+        with open(conf_path) as f:
+            return cls(parse_addresses(f.read()))
+
+    def match(self, qname):
+        """
+        Returns:
+            dict: Entry of the longest configured suffix of `qname`, or None
+        """
+        labels = qname.split('.')
+        for i in range(len(labels)):
+            entry = self.domains.get('.'.join(labels[i:]))
+            if entry is not None:
+                return entry
+        return None
+
+
+# ========================
+# Wire format
+# ========================
+
+def parse_question(data):
+    """
+    Returns:
+        tuple: (qname lower-case, qtype, end offset of the question), or
+        None if the packet is not a single-question query we can parse
+    """
+    if len(data) < _HEADER.size:
+        return None
+    labels = []
+    offset = _HEADER.size
+    while True:
+        if offset >= len(data):
+            return None
+        length = data[offset]
+        offset += 1
+        if length == 0:
+            break
+        if length & 0xC0 or offset + length > len(data):
+            return None  # compression is not used in questions
+        labels.append(data[offset:offset + length].decode('ascii', 'replace').lower())
+        offset += length
+    if offset + 4 > len(data):
+        return None
+    qtype, = struct.unpack_from("!H", data, offset)
+    return '.'.join(labels), qtype, offset + 4
+
+
+def answer_record(qtype, rdata, ttl=LOCAL_TTL):
+    """Answer RR for the (single) question, its name as a pointer to offset 12"""
+    return b'\xc0\x0c' + _RR.pack(qtype, QCLASS_IN, ttl, len(rdata)) + rdata
+
+
+def build_response(query, question_end, rcode=0, answer=b''):
+    """Authoritative reply to `query` (its question echoed back) with an optional answer record"""
+    query_id, flags = struct.unpack_from("!HH", query)
+    flags = FLAG_QR | FLAG_AA | FLAG_RA | (flags & (OPCODE_MASK | FLAG_RD)) | rcode
+    header = _HEADER.pack(query_id, flags, 1, 1 if answer else 0, 0, 0)
+    return header + query[_HEADER.size:question_end] + answer
+
+
+def local_response(query, question_end, entry, qtype):
+    """Answer from an address= entry (empty entry: NXDOMAIN; other types: NODATA)"""
+    if not entry:
+        return build_response(query, question_end, RCODE_NXDOMAIN)
+    return build_response(query, question_end, answer=entry.get(qtype, b''))
+
+
+def _skip_name(data, offset):
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1 + length
+        if length == 0:
+            return offset
+
+
+def response_ttl(data):
+    """Cache lifetime of an upstream response (None: do not cache)"""
+    try:
+        _, flags, qdcount, ancount, _, _ = _HEADER.unpack_from(data)
+        rcode = flags & 0xF
+        if rcode == RCODE_NXDOMAIN or (rcode == 0 and ancount == 0):
+            return NEGATIVE_TTL
+        if rcode != 0:
+            return None
+        offset = _HEADER.size
+        for _ in range(qdcount):
+            offset = _skip_name(data, offset) + 4
+        ttls = []
+        for _ in range(ancount):
+            offset = _skip_name(data, offset)
+            _, _, ttl, rdlength = _RR.unpack_from(data, offset)
+            ttls.append(ttl)
+            offset += _RR.size + rdlength
+        return min(min(ttls), MAX_CACHE_TTL)
+    except (IndexError, struct.error):
+        return None
+
+
+# ========================
+# Policy
+# ========================
+
+def released_upstream(client_ip, qname):
+    """Default policy: released clients resolve for real, everyone else is captive"""
+    if client_access.is_allowed(ip=client_ip):
+        return UPSTREAM
+    client = client_registry.registry.lookup(client_ip)
+    if client is not None and client_access.is_allowed(mac=client['mac']):
+        return UPSTREAM
+    return None
+
+
+# ========================
+# Responder
+# ========================
+
+def matches_question(reply, upstream_id, key):
+    """True if `reply` answers our query `upstream_id` for question `key` (bytes after the header)"""
+    if len(reply) < _HEADER.size + len(key):
+        return False
+    reply_id, flags, qdcount = struct.unpack_from("!HHH", reply)
+    return (reply_id == upstream_id and flags & FLAG_QR and qdcount == 1
+            and reply[_HEADER.size:_HEADER.size + len(key)] == key)
+
+
+class _UpstreamQuery(asyncio.DatagramProtocol):
+    """
+    One upstream query on its own socket: a fresh ephemeral port connected
+    to the resolver, so a spoofed reply has to guess port and ID, and must
+    echo our question to be taken.
+    """
+
+    def __init__(self, future, upstream_id, key):
+        self.future = future
+        self.upstream_id = upstream_id
+        self.key = key
+
+    def datagram_received(self, data, addr):
+        if not self.future.done() and matches_question(data, self.upstream_id, self.key):
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        log.debug(f"Upstream error: {exc}")
+
+
+class DnsResponder(asyncio.DatagramProtocol):
+    """
+    UDP and TCP DNS server on its own event loop thread. TCP answers the
+    same way (clients retry there when an upstream answer was truncated)
+    and is forwarded to the upstream over TCP.
+
+    Args:
+        table: AnswerTable compiled from dnsmasq.conf
+        upstream: (host, port) of the real resolver, or None
+        policy: callable(client_ip, qname) -> UPSTREAM or None (wildcard)
+    """
+
+    def __init__(self, table, upstream=None, policy=released_upstream, cache_size=CACHE_SIZE):
+        self.table = table
+        self.upstream = upstream
+        self.policy = policy
+        self.cache_size = cache_size
+        self.stats = {'queries': 0, 'tcp_queries': 0, 'local': 0, 'cache_hits': 0, 'upstream': 0,
+                      'errors': 0}
+        self._cache = collections.OrderedDict()  # question bytes -> (expires or None, response without ID)
+        self._loop = None
+        self._transport = None
+        self._tcp_server = None
+        self._tasks = set()  # forwards in flight (the loop only keeps weak references)
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+
+    # ------------------------
+    # Lifecycle
+    # ------------------------
+
+    def start(self, host, port=53):
+        """
+        Bind host:port (UDP and TCP) and serve on a background thread.
+
+        Raises:
+            OSError: if a socket cannot be bound
+        """
+        self._thread = threading.Thread(target=self._run, args=(host, port), name="dns", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            self._thread = None
+            raise self._error
+        log.info(f"DNS responder listening on {host}:{port}",
+                 extra={'upstream': self.upstream, 'domains': len(self.table.domains)})
+
+    def stop(self):
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self, host, port):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._transport, _ = self._loop.run_until_complete(
+                self._loop.create_datagram_endpoint(lambda: self, local_addr=(host, port)))
+            self._tcp_server = self._loop.run_until_complete(
+                asyncio.start_server(self._serve_tcp, host, port, reuse_address=True))
+        except OSError as e:
+            if self._transport is not None:
+                self._transport.close()
+            self._error = e
+            self._ready.set()
+            self._loop.close()
+            return
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._transport.close()
+            self._tcp_server.close()
+            self._loop.close()
+
+    # ------------------------
+    # Queries
+    # ------------------------
+
+    def _answer(self, data, client_ip, cached=True):
+        """
+        Everything that is answered without waiting.
+
+        Returns:
+            tuple: (response, None), or (None, (question_end, key)) when the
+            query has to go upstream
+        """
+        question = parse_question(data)
+        if question is None or struct.unpack_from("!H", data, 2)[0] & (FLAG_QR | OPCODE_MASK):
+            self.stats['errors'] += 1
+            return (self._error_response(data) if len(data) >= _HEADER.size else None), None
+        qname, qtype, question_end = question
+
+        entry = self.table.match(qname)
+        if entry is None:
+            if self.upstream is not None and self.policy is not None and self.policy(client_ip, qname) == UPSTREAM:
+                key = data[_HEADER.size:question_end]
+                response = self._cached(data, key) if cached else None
+                if response is not None:
+                    return response, None
+                self.stats['upstream'] += 1
+                return None, (question_end, key)
+            entry = self.table.wildcard
+            if entry is None:
+                return build_response(data, question_end, RCODE_NXDOMAIN), None
+        self.stats['local'] += 1
+        return local_response(data, question_end, entry, qtype), None
+
+    def datagram_received(self, data, addr):
+        self.stats['queries'] += 1
+        response, forward = self._answer(data, addr[0])
+        if response is not None:
+            self._transport.sendto(response, addr)
+        elif forward is not None:
+            task = self._loop.create_task(self._forward_udp(data, *forward, addr))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _serve_tcp(self, reader, writer):
+        """RFC 1035 TCP: 2-byte length prefix, several queries per connection"""
+        client_ip = writer.get_extra_info('peername')[0]
+        try:
+            while True:
+                length, = struct.unpack("!H", await asyncio.wait_for(reader.readexactly(2), TCP_IDLE_TIMEOUT))
+                data = await asyncio.wait_for(reader.readexactly(length), TCP_IDLE_TIMEOUT)
+                self.stats['tcp_queries'] += 1
+                # The cache may hold a truncated UDP answer; over TCP ask again
+                response, forward = self._answer(data, client_ip, cached=False)
+                if forward is not None:
+                    response = await self._upstream_response(data, *forward, tcp=True)
+                if response is None:
+                    break
+                writer.write(struct.pack("!H", len(response)) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _error_response(data):
+        query_id, flags = struct.unpack_from("!HH", data)
+        rcode = RCODE_NOTIMP if flags & OPCODE_MASK else RCODE_FORMERR
+        return _HEADER.pack(query_id, FLAG_QR | (flags & (OPCODE_MASK | FLAG_RD)) | rcode, 0, 0, 0, 0)
+
+    def _cached(self, data, key):
+        cached = self._cache.get(key)
+        if cached is None:
+            return None
+        expires, body = cached
+        if expires <= time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        self.stats['cache_hits'] += 1
+        return data[:2] + body
+
+    async def _forward_udp(self, data, question_end, key, addr):
+        try:
+            response = await self._upstream_response(data, question_end, key)
+        except Exception as e:
+            log.error(f"Forwarding a query failed: {e!r}")
+            self.stats['errors'] += 1
+            response = build_response(data, question_end, RCODE_SERVFAIL)
+        self._transport.sendto(response, addr)
+
+    async def _upstream_response(self, data, question_end, key, tcp=False):
+        """The upstream's answer under the client's query ID (SERVFAIL if there is none)"""
+        upstream_id = random.getrandbits(16)
+        query = struct.pack("!H", upstream_id) + data[2:]
+        try:
+            if tcp:
+                reply = await asyncio.wait_for(self._query_tcp(query, upstream_id, key), UPSTREAM_TIMEOUT)
+            else:
+                reply = await self._query_udp(query, upstream_id, key)
+        except (asyncio.TimeoutError, OSError, asyncio.IncompleteReadError) as e:
+            log.debug(f"Upstream query failed: {e!r}")
+            self.stats['errors'] += 1
+            return build_response(data, question_end, RCODE_SERVFAIL)
+
+        ttl = response_ttl(reply)
+        # A truncated answer is incomplete: the client retries over TCP
+        if ttl and not struct.unpack_from("!H", reply, 2)[0] & FLAG_TC:
+            self._cache[key] = (time.monotonic() + ttl, reply[2:])
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return data[:2] + reply[2:]
+
+    async def _query_udp(self, query, upstream_id, key):
+        future = self._loop.create_future()
+        transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: _UpstreamQuery(future, upstream_id, key), remote_addr=self.upstream)
+        try:
+            transport.sendto(query)
+            return await asyncio.wait_for(future, UPSTREAM_TIMEOUT)
+        finally:
+            transport.close()
+
+    async def _query_tcp(self, query, upstream_id, key):
+        reader, writer = await asyncio.open_connection(*self.upstream)
+        try:
+            writer.write(struct.pack("!H", len(query)) + query)
+            await writer.drain()
+            length, = struct.unpack("!H", await reader.readexactly(2))
+            reply = await reader.readexactly(length)
+        finally:
+            writer.close()
+        if not matches_question(reply, upstream_id, key):
+            raise OSError("upstream TCP reply does not match the query")
+        return reply
+
+
+responder = None
+
+
+def start(conf_path, host, upstream=None, port=53):
+    """
+    Start the module responder with the address= rules of `conf_path`.
+
+    Returns:
+        bool: True if it is serving
+    """
+    global responder
+    try:
+        table = AnswerTable.from_dnsmasq(conf_path)
+        server = DnsResponder(table, upstream)
+        server.start(host, port)
+    except (OSError, ValueError) as e:
+        log.error(f"DNS responder failed to start: {e}")
+        return False
+    responder = server
+    return True
+
+
+def stop():
+    global responder
+    if responder is not None:
+        responder.stop()
+        responder = None
+
+
+# ========================
+# Benchmark
+# ========================
+
+def make_query(qname, qtype=QTYPE_A, query_id=0):
+    name = b''.join(bytes([len(label)]) + label.encode() for label in qname.split('.')) + b'\0'
+    return _HEADER.pack(query_id, FLAG_RD, 1, 0, 0, 0) + name + struct.pack("!HH", qtype, QCLASS_IN)
+
+
+def resolve(server, qname, qtype=QTYPE_A, timeout=1.0):
+    """
+    One query (for checks).
+
+    Returns:
+        tuple: (rcode, list of answer rdata as text)
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(timeout)
+    try:
+        sock.sendto(make_query(qname, qtype, 0x1234), server)
+        data = sock.recv(4096)
+    finally:
+        sock.close()
+    _, flags, qdcount, ancount, _, _ = _HEADER.unpack_from(data)
+    offset = _HEADER.size
+    for _ in range(qdcount):
+        offset = _skip_name(data, offset) + 4
+    answers = []
+    for _ in range(ancount):
+        offset = _skip_name(data, offset)
+        rtype, _, _, rdlength = _RR.unpack_from(data, offset)
+        offset += _RR.size
+        answers.append(str(ipaddress.ip_address(data[offset:offset + rdlength])))
+        offset += rdlength
+    return flags & 0xF, answers
+
+
+def bench_qps(server, names, seconds=3.0, window=64):
+    """
+    Queries answered per second with `window` queries in flight from one socket.
+
+    Returns:
+        dict: 'qps', 'answered', 'lost'
+    """
+    queries = [make_query(name, QTYPE_A, i) for i, name in enumerate(names)]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(server)
+    sock.settimeout(0.5)
+    answered = sent = lost = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    try:
+        while time.perf_counter() < deadline:
+            while sent - answered - lost < window:
+                sock.send(queries[sent % len(queries)])
+                sent += 1
+            try:
+                sock.recv(4096)
+                answered += 1
+            except socket.timeout:
+                lost = sent - answered
+    finally:
+        sock.close()
+    elapsed = time.perf_counter() - started
+    return {'qps': answered / elapsed, 'answered': answered, 'lost': lost}
+
+
+if __name__ == "__main__":
+    # Answers from this directory's dnsmasq.conf, then queries per second of
+    # the built-in responder vs. dnsmasq with the same address= lines
+    # (started on a spare port when dnsmasq is installed, or --compare HOST:PORT).
+    import argparse
+    import shutil
+    import subprocess
+    import tempfile
+
+    parser = argparse.ArgumentParser(description='Built-in DNS responder check and QPS benchmark')
+    parser.add_argument('--conf', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "dnsmasq.conf"))
+    parser.add_argument('--compare', help='Running DNS server to benchmark too (HOST:PORT)')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    local = ("127.0.0.1", 5353)
+    table = AnswerTable.from_dnsmasq(args.conf)
+    demo = DnsResponder(table)
+    demo.start(*local)
+
+    for qname, qtype in (("fungames.com", QTYPE_A), ("cdn.www.fungames.com", QTYPE_A), ("localhost", QTYPE_A),
+                         ("example.org", QTYPE_A), ("example.org", QTYPE_AAAA)):
+        rcode, answers = resolve(local, qname, qtype)
+        print(f"  {qname:22} {'AAAA' if qtype == QTYPE_AAAA else 'A':4} rcode={rcode} {answers}")
+
+    names = [f"host{i}.example{i % 50}.com" for i in range(500)] + ["www.fungames.com"] * 100
+    targets = {'built-in': local}
+    dnsmasq = None
+    if args.compare:
+        host, _, port = args.compare.rpartition(':')
+        targets['compare'] = (host, int(port))
+    elif shutil.which("dnsmasq"):
+        conf = tempfile.NamedTemporaryFile("w", suffix=".conf", delete=False)
+        with open(args.conf) as f:
+            conf.write("".join(line for line in f if line.startswith("address=")))
+        conf.close()
+        dnsmasq = subprocess.Popen(["dnsmasq", "-k", "-C", conf.name, "--port=5354", "--listen-address=127.0.0.1",
+                                    "--bind-interfaces", "--no-resolv", "--no-hosts", "--user=root"],
+                                   stderr=subprocess.DEVNULL)
+        time.sleep(0.5)
+        targets['dnsmasq'] = ("127.0.0.1", 5354)
+    else:
+        print("  (dnsmasq not installed; pass --compare HOST:PORT to benchmark a running one)")
+
+    try:
+        for name, server in targets.items():
+            result = bench_qps(server, names, args.seconds)
+            print(f"  {name:10} {result['qps']:10.0f} queries/s  (answered {result['answered']}, lost {result['lost']})")
+    finally:
+        if dnsmasq is not None:
+            dnsmasq.terminate()
+            os.unlink(conf.name)
+        demo.stop()
+    print(f"  responder stats: {demo.stats}")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Hardware fingerprint for the license check
+Collects the identifiers secgen.py has always hashed (system UUID, baseboard
+serial, product UUID, Ethernet MACs) straight from sysfs instead of running
+dmidecode, cat and ip. dmidecode is only run for a field sysfs does not
+provide. The resulting SHA-256 is identical to the one secgen.py writes.
+"""
+
+import hashlib
+import os
+import re
+import subprocess
+
+# Fixed application salt
+SALT = "your-product-name-v1"
+
+DMI_DIR = "/sys/class/dmi/id"
+NET_DIR = "/sys/class/net"
+ARPHRD_ETHER = "1"  # interfaces `ip link` prints as "link/ether"
+
+# Firmware identifiers cannot change while the machine runs
+_dmi_cache = {}
+
+
+def run(cmd):
+    try:
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=True
+        )
+        return result.stdout.strip()
+    except Exception:
+        return ""
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return ""
+
+
+def _usable(value):
+    # dmidecode prints "Not Specified" for empty strings and replaces
+    # unprintable bytes; let it decide those cases
+    return bool(value) and value.isascii() and value.isprintable()
+
+
+def _dmi(sysfs_name, dmidecode_keyword, transform=None):
+    """One DMI string from sysfs, or from `dmidecode -s` if sysfs lacks it"""
+    if sysfs_name not in _dmi_cache:
+        value = _read(os.path.join(DMI_DIR, sysfs_name))
+        if _usable(value):
+            value = transform(value) if transform else value
+        else:
+            value = run(["dmidecode", "-s", dmidecode_keyword])
+        _dmi_cache[sysfs_name] = value
+    return _dmi_cache[sysfs_name]
+
+
+def system_uuid():
+    """`dmidecode -s system-uuid` (the kernel prints the same UUID in lower case)"""
+    return _dmi("product_uuid", "system-uuid", str.upper)
+
+
+def baseboard_serial():
+    """`dmidecode -s baseboard-serial-number`"""
+    return _dmi("board_serial", "baseboard-serial-number")
+
+
+def product_uuid():
+    """`cat /sys/class/dmi/id/product_uuid` (empty if unreadable, as before)"""
+    return _read(os.path.join(DMI_DIR, "product_uuid"))
+
+
+def macs():
+    """Sorted MACs of the Ethernet-type interfaces, as `ip link` lists them"""
+    found = []
+    try:
+        names = os.listdir(NET_DIR)
+    except OSError:
+        return found
+    for name in names:
+        if _read(os.path.join(NET_DIR, name, "type")) == ARPHRD_ETHER:
+            address = _read(os.path.join(NET_DIR, name, "address"))
+            if address:
+                found.append(address)
+    return sorted(found)
+
+
+def identifiers():
+    """
+    Returns:
+        dict: system_uuid, baseboard_serial, product_uuid and macs
+    """
+    return {
+        'system_uuid': system_uuid(),
+        'baseboard_serial': baseboard_serial(),
+        'product_uuid': product_uuid(),
+        'macs': macs(),
+    }
+
+
+def hardware_hash(ids=None):
+    """
+    Salted SHA-256 of the identifiers (the value stored in /home/hp/dlI).
+
+    Args:
+        ids: identifiers() result (collected now if None)
+    """
+    ids = ids or identifiers()
+    values = []
+    for v in [ids['system_uuid'], ids['baseboard_serial'], ids['product_uuid']]:
+        if v:
+            values.append(v.strip())
+    values.extend(ids['macs'])
+
+    # Join everything with a delimiter
+    fingerprint_raw = "|".join(values)
+    return hashlib.sha256((SALT + "|" + fingerprint_raw).encode()).hexdigest()
+
+
+def legacy_identifiers():
+    """The original collection through dmidecode, cat and ip (reference only)"""
+    try:
+        ip_link = subprocess.run(["ip", "link"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 text=True, check=True).stdout
+        legacy_macs = sorted(re.findall(r"link/ether ([0-9a-f:]{17})", ip_link))
+    except Exception:
+        legacy_macs = []
+    return {
+        'system_uuid': run(["dmidecode", "-s", "system-uuid"]),
+        'baseboard_serial': run(["dmidecode", "-s", "baseboard-serial-number"]),
+        'product_uuid': run(["cat", "/sys/class/dmi/id/product_uuid"]),
+        'macs': legacy_macs,
+    }
+
+
+if __name__ == "__main__":
+    # Compatibility check against the original algorithm, plus timings (run as root)
+    import time
+
+    started = time.perf_counter()
+    legacy = legacy_identifiers()
+    legacy_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    current = identifiers()
+    first_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    hardware_hash()
+    cached_ms = (time.perf_counter() - started) * 1000
+
+    for key in current:
+        status = "ok" if current[key] == legacy[key] else "DIFFERENT"
+        print(f"  {key:17} {status:9} sysfs={current[key]!r} legacy={legacy[key]!r}")
+    print(f"  legacy (dmidecode/cat/ip): {legacy_ms:8.2f} ms  {hardware_hash(legacy)}")
+    print(f"  sysfs, first call:         {first_ms:8.2f} ms  {hardware_hash(current)}")
+    print(f"  sysfs, DMI cached:         {cached_ms:8.2f} ms")
+    if hardware_hash(current) != hardware_hash(legacy):
+        raise SystemExit("FAILED: fingerprint differs from the original algorithm")
+    print("OK: identical fingerprint")
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Firewall programming for the captive portal
+The complete ruleset is built in memory and loaded with one iptables-restore
+call, so the firewall goes from the old rules to the new ones atomically
+instead of through a dozen half-configured intermediate states. When the
+kernel already has exactly these rules, nothing is written at all.
+"""
+
+import ipaddress
+import subprocess
+import time
+
+import portal_logging
+
+log = portal_logging.get_logger("firewall")
+
+# Tables owned by the portal and their built-in chains. Tables not listed
+# here (raw, security) are never touched.
+TABLE_CHAINS = {
+    'filter': ('INPUT', 'FORWARD', 'OUTPUT'),
+    'nat': ('PREROUTING', 'INPUT', 'OUTPUT', 'POSTROUTING'),
+    'mangle': ('PREROUTING', 'INPUT', 'FORWARD', 'OUTPUT', 'POSTROUTING'),
+}
+
+
+class FirewallError(Exception):
+    """iptables-restore/iptables-save failed or is not installed"""
+
+
+class Ruleset:
+    """
+    Desired contents of the portal's tables.
+
+    Rules are written the way iptables-save prints them (e.g. `-p tcp -m tcp
+    --dport 80`) so they can be compared with the live ruleset. A rule in
+    another spelling still works; it only defeats the no-change fast path.
+    """
+
+    def __init__(self):
+        self.policies = {table: {chain: 'ACCEPT' for chain in chains}
+                         for table, chains in TABLE_CHAINS.items()}
+        self.chains = {table: [] for table in TABLE_CHAINS}   # user-defined chains
+        self.rules = {table: [] for table in TABLE_CHAINS}    # "-A CHAIN ..." lines
+
+    def set_policy(self, table, chain, policy):
+        self.policies[table][chain] = policy
+
+    def add_chain(self, table, chain):
+        if chain not in self.chains[table]:
+            self.chains[table].append(chain)
+
+    def append(self, table, chain, spec):
+        """Append `-A chain spec` to `table`"""
+        self.rules[table].append(f"-A {chain} {spec}")
+
+    def render(self):
+        """
+        Returns:
+            str: iptables-restore input replacing all portal tables
+        """
+        lines = []
+        for table in TABLE_CHAINS:
+            lines.append(f"*{table}")
+            for chain, policy in self.policies[table].items():
+                lines.append(f":{chain} {policy} [0:0]")
+            for chain in self.chains[table]:
+                lines.append(f":{chain} - [0:0]")
+            lines.extend(self.rules[table])
+            lines.append("COMMIT")
+        return "\n".join(lines) + "\n"
+
+    def canonical(self):
+        """Comparable form (see parse_save)"""
+        return parse_save(self.render())
+
+
+def parse_save(text, tables=TABLE_CHAINS):
+    """
+    Reduce iptables-save/-restore text to a comparable structure, ignoring
+    counters, comments and tables the portal does not manage. Tables
+    missing from the text count as empty with ACCEPT policies.
+
+    Returns:
+        dict: table -> (policies dict, user chain set, rule list)
+    """
+    state = {table: ({chain: 'ACCEPT' for chain in chains}, set(), [])
+             for table, chains in tables.items()}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('*'):
+            current = state.get(line[1:])
+            continue
+        if current is None or line == 'COMMIT':
+            continue
+        policies, chains, rules = current
+        if line.startswith(':'):
+            chain, policy = line[1:].split()[:2]
+            if policy == '-':
+                chains.add(chain)
+            else:
+                policies[chain] = policy
+        elif line.startswith('-A '):
+            rules.append(line)
+    return state
+
+
+def portal_ruleset(iface, ip, port, allow_sets=(), accounting_sets=None, prefix=24):
+    """
+    Rules of a running portal: HTTP/HTTPS from the hotspot are redirected
+    to the portal server and all hotspot traffic to this machine is accepted.
+
+    Args:
+        allow_sets: ipsets of released clients (see client_access), which
+                    skip the redirect and are forwarded (masqueraded) to
+                    the internet; everyone else on the hotspot is not
+                    forwarded at all. The sets must already exist
+        accounting_sets: (up, down) ipsets with counters (see
+                         traffic_accounting) that count every client packet
+        prefix: Prefix length of the hotspot network (`ip` is on it)
+    """
+    ruleset = Ruleset()
+    if accounting_sets:
+        up, down = accounting_sets
+        # No target: the set match alone updates the client's counters
+        ruleset.append('mangle', 'PREROUTING', f"-i {iface} -m set --match-set {up} src")
+        ruleset.append('mangle', 'POSTROUTING', f"-o {iface} -m set --match-set {down} dst")
+    for name in allow_sets:
+        ruleset.append('nat', 'PREROUTING', f"-i {iface} -m set --match-set {name} src -j RETURN")
+    for dport in (80, 443):
+        ruleset.append('nat', 'PREROUTING',
+                       f"-i {iface} -p tcp -m tcp --dport {dport} -j DNAT --to-destination {ip}:{port}")
+    ruleset.append('filter', 'INPUT', f"-i {iface} -j ACCEPT")
+    # After the rules above: iptables-save lists INPUT before FORWARD and
+    # PREROUTING before POSTROUTING, and the no-change check compares in order
+    if allow_sets:
+        network = ipaddress.ip_interface(f"{ip}/{prefix}").network
+        for name in allow_sets:
+            ruleset.append('filter', 'FORWARD', f"-i {iface} -m set --match-set {name} src -j ACCEPT")
+        ruleset.append('filter', 'FORWARD', f"-o {iface} -m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT")
+        ruleset.append('filter', 'FORWARD', f"-i {iface} -j DROP")
+        ruleset.append('nat', 'POSTROUTING', f"-s {network} ! -o {iface} -j MASQUERADE")
+    return ruleset
+
+
+def current():
+    """
+    Read the live ruleset with one iptables-save call.
+
+    Returns:
+        dict: Same structure as parse_save()
+    """
+    try:
+        result = subprocess.run(["iptables-save"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise FirewallError(f"iptables-save failed: {e}")
+    if result.returncode != 0:
+        raise FirewallError(f"iptables-save failed: {result.stderr.strip()}")
+    return parse_save(result.stdout)
+
+
+def apply(ruleset, force=False):
+    """
+    Make the kernel's portal tables equal to `ruleset` in one transaction.
+
+    Args:
+        ruleset: Ruleset to load
+        force: Skip the comparison and always load
+
+    Returns:
+        dict: 'changed' (False when the rules already matched) and 'ms'
+
+    Raises:
+        FirewallError: if the ruleset could not be loaded
+    """
+    started = time.perf_counter()
+    if not force:
+        try:
+            if current() == ruleset.canonical():
+                elapsed = round((time.perf_counter() - started) * 1000, 1)
+                log.info("Firewall already up to date", extra={'ms': elapsed})
+                return {'changed': False, 'ms': elapsed}
+        except FirewallError as e:
+            log.warning(f"Could not compare firewall rules, loading anyway: {e}")
+
+    try:
+        result = subprocess.run(["iptables-restore"], input=ruleset.render(), stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise FirewallError(f"iptables-restore failed: {e}")
+    if result.returncode != 0:
+        raise FirewallError(f"iptables-restore failed: {result.stderr.strip()}")
+
+    elapsed = round((time.perf_counter() - started) * 1000, 1)
+    log.info("Firewall rules loaded", extra={'ms': elapsed,
+                                             'rules': sum(len(r) for r in ruleset.rules.values())})
+    return {'changed': True, 'ms': elapsed}
+
+
+def clear():
+    """Flush all portal tables and reset policies to ACCEPT (one transaction)"""
+    return apply(Ruleset())
+
+
+if __name__ == "__main__":
+    # Benchmark on a scratch interface name: the per-rule shell commands the
+    # launcher used to run vs. one iptables-restore vs. the no-change path.
+    # NOTE: replaces the live filter/nat/mangle tables; run on a test kiosk.
+    import os
+    import shutil
+    import statistics
+
+    iface, ip, port = "portalbench0", "192.168.4.1", 8090
+    ruleset = portal_ruleset(iface, ip, port)
+
+    if os.geteuid() != 0 or shutil.which("iptables-restore") is None:
+        print("iptables-restore needs root and the iptables package; ruleset that would be loaded:\n")
+        print(ruleset.render())
+        raise SystemExit(0)
+
+    legacy = [
+        "iptables -F", "iptables -t nat -F", "iptables -t mangle -F",
+        "iptables -X", "iptables -t nat -X", "iptables -t mangle -X",
+        "iptables -P INPUT ACCEPT", "iptables -P FORWARD ACCEPT", "iptables -P OUTPUT ACCEPT",
+        f"iptables -t nat -D PREROUTING -i {iface} -p tcp --dport 80 -j DNAT --to-destination {ip}:{port} 2>/dev/null",
+        f"iptables -t nat -D PREROUTING -i {iface} -p tcp --dport 443 -j DNAT --to-destination {ip}:{port} 2>/dev/null",
+        f"iptables -D INPUT -i {iface} -j ACCEPT 2>/dev/null",
+        f"iptables -t nat -A PREROUTING -i {iface} -p tcp --dport 80 -j DNAT --to-destination {ip}:{port}",
+        f"iptables -t nat -A PREROUTING -i {iface} -p tcp --dport 443 -j DNAT --to-destination {ip}:{port}",
+        f"iptables -A INPUT -i {iface} -j ACCEPT",
+    ]
+
+    def timed(fn, rounds=5):
+        samples = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    saved = subprocess.run(["iptables-save"], stdout=subprocess.PIPE, text=True).stdout
+    try:
+        per_rule = timed(lambda: [subprocess.run(cmd, shell=True) for cmd in legacy])
+        restore = timed(lambda: apply(ruleset, force=True))
+        unchanged = timed(lambda: apply(ruleset))
+        print(f"  per-rule iptables ({len(legacy)} forks): {per_rule:8.1f} ms")
+        print(f"  iptables-restore (1 transaction):   {restore:8.1f} ms")
+        print(f"  already up to date (iptables-save): {unchanged:8.1f} ms")
+        print(f"  fast path taken: {not apply(ruleset)['changed']}")
+    finally:
+        subprocess.run(["iptables-restore"], input=saved, text=True)
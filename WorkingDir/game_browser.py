@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+"""
+Game browser manager
+Starts Brave for the game in its own process group and remembers it, so
+"is the game open" is a lookup instead of a scan over every process and
+closing it is a signal instead of `pkill -f brave` through a shell.
+
+With warm standby enabled, a second instance is kept running off-screen
+with the game page already loaded; pressing play only moves it on screen
+and makes it fullscreen over the DevTools protocol.
+"""
+
+import atexit
+import http.client
+import json
+import os
+import select
+import signal
+import subprocess
+import threading
+import time
+
+import portal_logging
+import ws_control
+
+log = portal_logging.get_logger("game")
+
+BRAVE_COMMAND = [
+    "brave-browser",
+    "--no-sandbox",
+    "--incognito",
+    "--new-window",
+    "--start-fullscreen",
+    "--ignore-certificate-errors",
+    "--allow-insecure-localhost",
+    "--test-type",
+    "--disable-features=OutdatedBuildDetector",
+]
+
+# Extra flags for the hidden standby instance: its own profile (so it runs
+# as a separate browser process), DevTools on localhost, parked off-screen,
+# and no throttling of the hidden page so the game stays loaded and live.
+STANDBY_PROFILE = "/tmp/game-browser-standby"
+STANDBY_FLAGS = [
+    "--remote-debugging-address=127.0.0.1",
+    f"--user-data-dir={STANDBY_PROFILE}",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--window-position=-10000,-10000",
+    "--window-size=1280,720",
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+]
+
+KILL_TIMEOUT = 3.0          # seconds between SIGTERM and SIGKILL
+DEFAULT_DEBUG_PORT = 9222
+STANDBY_READY_TIMEOUT = 60  # seconds for the standby page to finish loading
+STANDBY_RESPAWN_DELAY = 2   # seconds after close (the old profile lock must go)
+STANDBY_MAX_BACKOFF = 120   # seconds between attempts after repeated failures
+
+
+def _wait_pid_exit(pid):
+    """
+    Block until a process that is not our child exits.
+    Uses a pidfd (Linux 5.3+) so the wait costs nothing; falls back to
+    polling the PID once a second.
+    """
+    if hasattr(os, "pidfd_open"):
+        try:
+            fd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            return
+        except OSError:
+            fd = None
+        if fd is not None:
+            try:
+                select.select([fd], [], [])
+            finally:
+                os.close(fd)
+            return
+
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return
+        except PermissionError:
+            pass
+        time.sleep(1)
+
+
+# ========================
+# DevTools protocol
+# ========================
+
+class DevToolsError(Exception):
+    """The browser rejected a DevTools command"""
+
+
+def devtools_get(port, path, timeout=2.0):
+    """
+    GET one of the browser's DevTools HTTP endpoints (/json/list, ...).
+
+    Returns:
+        Parsed JSON, or the raw text for non-JSON replies
+    """
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        connection.request("GET", path)
+        body = connection.getresponse().read().decode("utf-8", errors="replace")
+    finally:
+        connection.close()
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body
+
+
+class DevTools:
+    """Synchronous DevTools protocol session over one WebSocket"""
+
+    def __init__(self, ws_url, timeout=5.0):
+        self.ws = ws_control.connect(ws_url, timeout)
+        self._next_id = 0
+
+    def call(self, method, **params):
+        """
+        Send a command and wait for its reply (events in between are skipped).
+
+        Returns:
+            dict: The command's `result`
+        """
+        self._next_id += 1
+        command_id = self._next_id
+        self.ws.send_json({'id': command_id, 'method': method, 'params': params})
+        while True:
+            message = self.ws.receive()
+            if message is None:
+                raise ConnectionError(f"DevTools connection lost during {method}")
+            reply = json.loads(message)
+            if reply.get('id') != command_id:
+                continue
+            if 'error' in reply:
+                raise DevToolsError(f"{method}: {reply['error'].get('message')}")
+            return reply.get('result', {})
+
+    def close(self):
+        self.ws.close()
+        try:
+            self.ws.sock.close()
+        except OSError:
+            pass
+
+
+class _Standby:
+    """A hidden browser instance waiting to be shown"""
+
+    def __init__(self, process, port):
+        self.process = process
+        self.pid = process.pid
+        self.port = port
+        self.target_id = None  # DevTools id of the game page once the browser is up
+        self.ready = threading.Event()
+
+
+class GameBrowser:
+    """
+    Owns the game browser instance.
+
+    State is kept in memory and updated by a watcher thread that blocks on
+    the browser's exit (waitpid for browsers we started, a pidfd for one
+    adopted from a previous server run), so is_open() is O(1).
+    """
+
+    def __init__(self, url, command=None, warm_standby=False, debug_port=DEFAULT_DEBUG_PORT):
+        self.url = url
+        self.command = list(command or BRAVE_COMMAND)
+        self.warm_standby = warm_standby
+        self.debug_port = debug_port
+        self.last_launch = None  # {'mode': 'warm'|'cold', 'ms': float}
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pgid = None
+        self._adopt_checked = False
+
+        self._standby = None
+        self._standby_failures = 0
+        self._standby_timer = None
+        self._stopped = False
+
+    # ------------------------
+    # State
+    # ------------------------
+
+    def is_open(self):
+        """True while the browser we started (or adopted) is on screen"""
+        if not self._adopt_checked:
+            self._adopt_existing()
+        return self._pid is not None
+
+    @property
+    def pid(self):
+        return self._pid
+
+    def standby_ready(self):
+        standby = self._standby
+        return standby is not None and standby.ready.is_set()
+
+    def _set_running(self, pid, pgid):
+        with self._lock:
+            self._pid = pid
+            self._pgid = pgid
+
+    def _on_exit(self, pid):
+        """Called by a watcher thread once process `pid` has exited"""
+        with self._lock:
+            was_visible = pid == self._pid
+            if was_visible:
+                self._pid = None
+                self._pgid = None
+            was_standby = self._standby is not None and self._standby.pid == pid
+            if was_standby:
+                self._standby = None
+
+        if was_visible:
+            log.info("Game browser exited", extra={'pid': pid})
+            self._schedule_standby(STANDBY_RESPAWN_DELAY)
+        elif was_standby:
+            self._standby_failures += 1
+            log.warning("Standby game browser exited", extra={'pid': pid})
+            self._schedule_standby(min(STANDBY_RESPAWN_DELAY * 2 ** self._standby_failures,
+                                       STANDBY_MAX_BACKOFF))
+
+    def _start_watcher(self, pid, wait):
+        def watch():
+            wait()
+            self._on_exit(pid)
+
+        threading.Thread(target=watch, name="game-browser-watch", daemon=True).start()
+
+    def _adopt_existing(self):
+        """
+        One-time scan for browsers left over from a previous server run (the
+        only time the process table is walked). A visible game browser is
+        adopted; a leftover standby is killed, as it holds the profile and
+        DevTools port the new one needs.
+        """
+        self._adopt_checked = True
+        try:
+            import psutil
+        except ImportError:
+            return
+
+        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+            try:
+                if not proc.info['name'] or 'brave' not in proc.info['name'].lower():
+                    continue
+                cmdline = " ".join(proc.info['cmdline'] or []).lower()
+                if '--start-fullscreen' not in cmdline and '--new-window' not in cmdline:
+                    continue
+                # Prefer the browser main process over its helpers
+                if '--type=' in cmdline:
+                    continue
+                pid = proc.info['pid']
+                pgid = os.getpgid(pid)
+            except (psutil.Error, OSError):
+                continue
+
+            if STANDBY_PROFILE in cmdline:
+                log.info("Stopping leftover standby game browser", extra={'pid': pid})
+                self._signal(pid, pgid, signal.SIGKILL)
+                continue
+            if self._pid is None:
+                self._set_running(pid, pgid)
+                self._start_watcher(pid, lambda pid=pid: _wait_pid_exit(pid))
+                log.info("Adopted running game browser", extra={'pid': pid})
+
+    # ------------------------
+    # Actions
+    # ------------------------
+
+    def _spawn(self, args):
+        return subprocess.Popen(
+            args,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+    def open(self):
+        """
+        Put the game on screen: show the warm standby if one is ready,
+        otherwise start the browser in a new session (its own process group).
+
+        Returns:
+            int: Browser PID
+        """
+        started = time.perf_counter()
+
+        standby = self._take_standby()
+        if standby is not None:
+            # Mark it visible first so its watcher treats an exit as a close
+            self._set_running(standby.pid, standby.pid)
+            try:
+                self._show(standby)
+                self._record_launch('warm', started, standby.pid)
+                return standby.pid
+            except (OSError, ValueError, DevToolsError, ws_control.WebSocketError) as e:
+                log.warning(f"Could not show standby game browser, cold starting: {e}")
+                self._signal(standby.pid, standby.pid, signal.SIGKILL)
+
+        process = self._spawn(self.command + [self.url])
+        self._set_running(process.pid, process.pid)
+        self._start_watcher(process.pid, process.wait)
+        self._record_launch('cold', started, process.pid)
+        return process.pid
+
+    def _record_launch(self, mode, started, pid):
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.last_launch = {'mode': mode, 'ms': elapsed_ms}
+        if mode == 'warm':
+            log.info("Game visible", extra={'mode': mode, 'time_to_visible_ms': elapsed_ms, 'pid': pid})
+        else:
+            # Only the spawn is timed; the page still has to load after this
+            log.info("Game browser started", extra={'mode': mode, 'spawn_ms': elapsed_ms, 'pid': pid})
+
+    def close(self, timeout=KILL_TIMEOUT):
+        """
+        Send SIGTERM to the browser's process group; escalate to SIGKILL
+        after `timeout` seconds in the background. Returns immediately.
+
+        Returns:
+            bool: True if a browser was signalled
+        """
+        with self._lock:
+            pid, pgid = self._pid, self._pgid
+        if pid is None:
+            return False
+
+        self._signal(pid, pgid, signal.SIGTERM)
+
+        def escalate():
+            if self._pid == pid:
+                log.warning("Game browser ignored SIGTERM, sending SIGKILL", extra={'pid': pid})
+                self._signal(pid, pgid, signal.SIGKILL)
+
+        timer = threading.Timer(timeout, escalate)
+        timer.daemon = True
+        timer.start()
+        return True
+
+    @staticmethod
+    def _signal(pid, pgid, sig):
+        try:
+            # Never signal our own group (an adopted browser may share it)
+            if pgid is not None and pgid != os.getpgrp():
+                os.killpg(pgid, sig)
+            else:
+                os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def toggle(self):
+        """
+        Open the browser if closed, close it if open.
+
+        Returns:
+            str: 'opened' or 'closed'
+        """
+        if self.is_open():
+            self.close()
+            return 'closed'
+        self.open()
+        return 'opened'
+
+    # ------------------------
+    # Warm standby
+    # ------------------------
+
+    def start_standby(self):
+        """Enable the warm standby and start the first hidden instance"""
+        if not self.warm_standby:
+            return
+        if not self._adopt_checked:
+            self._adopt_existing()
+        atexit.register(self.stop_standby)
+        self._schedule_standby(0)
+
+    def stop_standby(self):
+        """Kill the hidden instance and stop respawning it"""
+        self._stopped = True
+        if self._standby_timer is not None:
+            self._standby_timer.cancel()
+        with self._lock:
+            standby, self._standby = self._standby, None
+        if standby is not None:
+            self._signal(standby.pid, standby.pid, signal.SIGKILL)
+
+    def _schedule_standby(self, delay):
+        if not self.warm_standby or self._stopped:
+            return
+        if self._standby_timer is not None:
+            self._standby_timer.cancel()
+        self._standby_timer = threading.Timer(delay, self._spawn_standby)
+        self._standby_timer.daemon = True
+        self._standby_timer.start()
+
+    def _spawn_standby(self):
+        with self._lock:
+            # One instance at a time: none while the game is on screen
+            if self._stopped or self._standby is not None or self._pid is not None:
+                return
+            args = ([flag for flag in self.command if flag != "--start-fullscreen"]
+                    + [f"--remote-debugging-port={self.debug_port}"] + STANDBY_FLAGS + [self.url])
+            try:
+                standby = _Standby(self._spawn(args), self.debug_port)
+            except OSError as e:
+                log.error(f"Could not start standby game browser: {e}")
+                return
+            self._standby = standby
+
+        self._start_watcher(standby.pid, standby.process.wait)
+        started = time.perf_counter()
+        if self._wait_until_loaded(standby):
+            self._standby_failures = 0
+            standby.ready.set()
+            log.info("Standby game browser ready", extra={
+                'pid': standby.pid, 'load_ms': round((time.perf_counter() - started) * 1000, 1)})
+        elif self._standby is standby:
+            log.warning("Standby game browser did not load in time, restarting",
+                        extra={'pid': standby.pid})
+            self._signal(standby.pid, standby.pid, signal.SIGKILL)
+
+    def _wait_until_loaded(self, standby, timeout=STANDBY_READY_TIMEOUT):
+        """Poll DevTools until the game page has finished loading"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if standby.process.poll() is not None or self._standby is not standby:
+                return False
+            try:
+                pages = [t for t in devtools_get(standby.port, "/json/list") if t.get('type') == 'page']
+                if pages:
+                    standby.target_id = pages[0]['id']
+                    session = DevTools(pages[0]['webSocketDebuggerUrl'])
+                    try:
+                        state = session.call('Runtime.evaluate', expression='document.readyState',
+                                             returnByValue=True)
+                    finally:
+                        session.close()
+                    if state.get('result', {}).get('value') == 'complete':
+                        return True
+            except (OSError, ValueError, KeyError, TypeError, DevToolsError, ws_control.WebSocketError):
+                pass  # browser still starting up
+            time.sleep(0.25)
+        return False
+
+    def _take_standby(self):
+        """Hand over the standby if its browser is up (page may still be loading)"""
+        with self._lock:
+            standby = self._standby
+            if standby is None or standby.target_id is None or standby.process.poll() is not None:
+                return None
+            self._standby = None
+        if self._standby_timer is not None:
+            self._standby_timer.cancel()
+        return standby
+
+    def _show(self, standby):
+        """Move the hidden window on screen, make it fullscreen and focus it"""
+        version = devtools_get(standby.port, "/json/version")
+        browser = DevTools(version['webSocketDebuggerUrl'])
+        try:
+            window_id = browser.call('Browser.getWindowForTarget', targetId=standby.target_id)['windowId']
+            # Position can only be changed in the normal state; fullscreen is a separate step
+            browser.call('Browser.setWindowBounds', windowId=window_id,
+                         bounds={'left': 0, 'top': 0, 'windowState': 'normal'})
+            browser.call('Browser.setWindowBounds', windowId=window_id,
+                         bounds={'windowState': 'fullscreen'})
+        finally:
+            browser.close()
+        devtools_get(standby.port, f"/json/activate/{standby.target_id}")
+
+
+if __name__ == "__main__":
+    # Benchmark: legacy process-table scan + pkill vs. the PID-tracking manager.
+    # A sleeping Python process stands in for Brave.
+    # With --visible (needs brave-browser and a display): cold vs warm
+    # time until the game page is on screen and loaded.
+    import statistics
+    import sys
+
+    import psutil
+
+    def legacy_is_open():
+        for proc in psutil.process_iter(['name', 'cmdline']):
+            try:
+                if proc.info['name'] and 'brave' in proc.info['name'].lower():
+                    cmdline = " ".join(proc.info['cmdline']).lower()
+                    if '--start-fullscreen' in cmdline or '--new-window' in cmdline:
+                        return True
+            except Exception:
+                pass
+        return False
+
+    def measure(fn, rounds):
+        samples = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    if "--visible" in sys.argv:
+        url = sys.argv[-1] if sys.argv[-1].startswith("http") else "https://example.com/"
+
+        browser = GameBrowser(url, warm_standby=True)
+        browser._adopt_checked = True
+
+        # Cold: a plain launch, timed until its page reports readyState complete
+        started = time.perf_counter()
+        cold = _Standby(browser._spawn(browser.command + [f"--remote-debugging-port={DEFAULT_DEBUG_PORT}",
+                                                          f"--user-data-dir={STANDBY_PROFILE}",
+                                                          "--no-first-run", url]), DEFAULT_DEBUG_PORT)
+        browser._standby = cold
+        loaded = browser._wait_until_loaded(cold)
+        cold_ms = (time.perf_counter() - started) * 1000
+        browser._standby = None
+        browser._signal(cold.pid, cold.pid, signal.SIGKILL)
+        cold.process.wait()
+        print(f"  cold start to loaded game: {cold_ms:8.0f} ms" + ("" if loaded else " (timed out)"))
+
+        time.sleep(STANDBY_RESPAWN_DELAY)
+        browser.start_standby()
+        deadline = time.monotonic() + STANDBY_READY_TIMEOUT
+        while not browser.standby_ready() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        browser.open()
+        print(f"  warm standby to visible:   {browser.last_launch['ms']:8.0f} ms ({browser.last_launch['mode']})")
+        browser.stop_standby()
+        browser.close(timeout=1)
+        sys.exit(0)
+
+    print(f"Processes on this machine: {len(psutil.pids())}")
+    print(f"  legacy 'is open' scan:   {measure(legacy_is_open, 20):8.3f} ms")
+
+    browser = GameBrowser("about:blank", command=[sys.executable, "-c", "import time; time.sleep(60)"])
+    browser._adopt_checked = True
+    print(f"  GameBrowser.is_open():   {measure(browser.is_open, 1000):8.4f} ms")
+
+    started = time.perf_counter()
+    os.system("pkill -f 'no-such-game-browser-process'")
+    print(f"  legacy close (pkill):    {(time.perf_counter() - started) * 1000:8.3f} ms")
+
+    open_ms, close_ms = [], []
+    for _ in range(5):
+        started = time.perf_counter()
+        browser.open()
+        open_ms.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        browser.close()
+        close_ms.append((time.perf_counter() - started) * 1000)
+        while browser.is_open():
+            time.sleep(0.01)
+    print(f"  GameBrowser.open():      {statistics.median(open_ms):8.3f} ms")
+    print(f"  GameBrowser.close():     {statistics.median(close_ms):8.3f} ms")
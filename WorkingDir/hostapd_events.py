@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+hostapd station events
+Attaches to hostapd's control socket (ATTACH) and follows
+AP-STA-CONNECTED / AP-STA-DISCONNECTED, keeping per-station connection
+time and signal data. When a phone leaves, the registered evictors drop its
+per-client server state right away instead of waiting for timeouts.
+FakeHostapd stands in for the control socket in demos and tests.
+"""
+
+import os
+import re
+import socket
+import threading
+import time
+
+import client_registry
+import portal_logging
+import supervisor
+
+log = portal_logging.get_logger("stations")
+
+HOSTAPD_CONF = "/home/hp/hostapd.conf"  # Same file the launcher starts hostapd with
+
+EVENT_CONNECTED = 'AP-STA-CONNECTED'
+EVENT_DISCONNECTED = 'AP-STA-DISCONNECTED'
+EVENT_TERMINATING = 'CTRL-EVENT-TERMINATING'
+
+PING_INTERVAL = 10.0   # seconds without events before checking hostapd is still there
+PING_TIMEOUT = 3.0     # seconds to wait for the PONG
+RETRY_MIN = 1          # reattach delay (seconds), doubled while hostapd is away
+RETRY_MAX = 30
+
+_EVENT_LINE = re.compile(r'^<\d>(\S+)(?: (\S+))?')
+
+
+def parse_sta(text):
+    """
+    Reply to STA/STA-FIRST/STA-NEXT: the MAC on the first line, then
+    key=value lines.
+
+    Returns:
+        tuple: (mac, {key: value}), or (None, {}) for an empty reply
+    """
+    lines = text.strip().splitlines()
+    if not lines or lines[0].startswith('FAIL'):
+        return None, {}
+    info = {}
+    for line in lines[1:]:
+        key, sep, value = line.partition('=')
+        if sep:
+            info[key] = value
+    return lines[0].strip().lower(), info
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class StationMonitor:
+    """
+    Follows station events of one hostapd instance.
+
+    Listeners are called on the monitor thread as `callback(event, station)`
+    with event 'connected' or 'disconnected'. Evictors are called as
+    `callback(mac, ip)` when a station leaves (ip from the DHCP leases, may
+    be None).
+    """
+
+    def __init__(self, ctrl_path=None):
+        self.ctrl_path = ctrl_path
+        self.attached = False
+        self.events = 0
+        self._lock = threading.Lock()
+        self._stations = {}  # mac -> station dict
+        self._listeners = []
+        self._evictors = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._sock = None
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def add_evictor(self, callback):
+        self._evictors.append(callback)
+
+    # ------------------------
+    # Station data
+    # ------------------------
+
+    def stations(self):
+        """
+        Returns:
+            list: Connected stations (mac, ip, hostname, connected_at,
+                  connected_s, signal, rx_bytes, tx_bytes, inactive_ms)
+        """
+        now = time.time()
+        with self._lock:
+            stations = [dict(s) for s in self._stations.values()]
+        for station in stations:
+            station['connected_s'] = round(now - station['connected_at'], 1)
+            client = client_registry.registry.by_mac(station['mac'])
+            station['ip'] = client['ip'] if client else None
+            station['hostname'] = client['hostname'] if client else None
+        return sorted(stations, key=lambda s: s['connected_at'])
+
+    def refresh(self):
+        """Re-read signal and traffic counters of every station from hostapd"""
+        for mac in list(self._stations):
+            self._update(mac, self._query(f"STA {mac}")[1])
+
+    def _query(self, command):
+        try:
+            return parse_sta(supervisor.hostapd_request(self.ctrl_path, command))
+        except OSError as e:
+            log.debug(f"hostapd {command} failed: {e}")
+            return None, {}
+
+    def _update(self, mac, info):
+        with self._lock:
+            station = self._stations.get(mac)
+            if station is None or not info:
+                return
+            station['signal'] = _to_int(info.get('signal'))
+            station['rx_bytes'] = _to_int(info.get('rx_bytes'))
+            station['tx_bytes'] = _to_int(info.get('tx_bytes'))
+            station['inactive_ms'] = _to_int(info.get('inactive_msec'))
+
+    def _connected(self, mac, info=None, connected_at=None):
+        with self._lock:
+            known = mac in self._stations
+            self._stations[mac] = {'mac': mac, 'connected_at': connected_at or time.time(),
+                                   'signal': None, 'rx_bytes': None, 'tx_bytes': None, 'inactive_ms': None}
+        self._update(mac, info if info is not None else self._query(f"STA {mac}")[1])
+        if not known:
+            station = self._stations[mac]
+            log.info("Station connected", extra={'mac': mac, 'signal': station['signal']})
+            self._notify('connected', station)
+
+    def _disconnected(self, mac):
+        with self._lock:
+            station = self._stations.pop(mac, None)
+        if station is None:
+            return
+        client = client_registry.registry.by_mac(mac)
+        ip = client['ip'] if client else None
+        log.info("Station disconnected", extra={'mac': mac, 'ip': ip,
+                                                'connected_s': round(time.time() - station['connected_at'], 1)})
+        self._notify('disconnected', station)
+        for callback in list(self._evictors):
+            try:
+                callback(mac, ip)
+            except Exception as e:
+                log.error(f"Evicting {mac} failed: {e}")
+
+    def _notify(self, event, station):
+        for callback in list(self._listeners):
+            try:
+                callback(event, dict(station))
+            except Exception as e:
+                log.error(f"Station listener failed: {e}")
+
+    def _sync(self):
+        """After (re)attaching: take over stations already associated, drop those gone meanwhile"""
+        present = {}
+        mac, info = self._query("STA-FIRST")
+        while mac and mac not in present:
+            present[mac] = info
+            mac, info = self._query(f"STA-NEXT {mac}")
+        for gone in set(self._stations) - set(present):
+            self._disconnected(gone)
+        now = time.time()
+        for mac, info in present.items():
+            if mac in self._stations:
+                self._update(mac, info)
+            else:
+                # connected_time is seconds since association
+                self._connected(mac, info, now - (_to_int(info.get('connected_time')) or 0))
+
+    # ------------------------
+    # Event socket
+    # ------------------------
+
+    def start(self):
+        """Attach in the background and keep reattaching (idempotent)"""
+        if self._thread is not None:
+            return
+        if self.ctrl_path is None:
+            self.ctrl_path = supervisor.hostapd_ctrl_path(HOSTAPD_CONF)
+        if self.ctrl_path is None:
+            log.warning(f"No ctrl_interface in {HOSTAPD_CONF}, station events are unavailable")
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="hostapd-events", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=PING_INTERVAL + 1)
+            self._thread = None
+
+    def _attach(self):
+        local_path = f"/tmp/portal-hostapd-events-{os.getpid()}"
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            try:
+                os.unlink(local_path)
+            except FileNotFoundError:
+                pass
+            sock.bind(local_path)
+            sock.settimeout(1.0)
+            sock.connect(self.ctrl_path)
+            sock.send(b"ATTACH")
+            reply = sock.recv(4096)
+            if not reply.startswith(b"OK"):
+                raise OSError(f"ATTACH refused: {reply[:40]!r}")
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _detach(self):
+        if self._sock is None:
+            return
+        try:
+            self._sock.send(b"DETACH")
+        except OSError:
+            pass
+        self._sock.close()
+        self._sock = None
+        self.attached = False
+        try:
+            os.unlink(f"/tmp/portal-hostapd-events-{os.getpid()}")
+        except FileNotFoundError:
+            pass
+
+    def _run(self):
+        delay = RETRY_MIN
+        while not self._stop.is_set():
+            try:
+                self._sock = self._attach()
+            except OSError as e:
+                log.debug(f"hostapd not attachable ({e}), retrying in {delay}s")
+                self._stop.wait(delay)
+                delay = min(delay * 2, RETRY_MAX)
+                continue
+            delay = RETRY_MIN
+            self.attached = True
+            log.info(f"Attached to {self.ctrl_path}")
+            try:
+                self._sync()
+                self._receive()
+            except OSError as e:
+                log.warning(f"Lost hostapd control socket: {e}")
+            finally:
+                self._detach()
+
+    def _receive(self):
+        """Handle events until hostapd goes away or stop() is called"""
+        last_seen = time.monotonic()
+        ping_sent = None
+        while not self._stop.is_set():
+            try:
+                data = self._sock.recv(4096)
+            except socket.timeout:
+                now = time.monotonic()
+                if ping_sent is not None and now - ping_sent > PING_TIMEOUT:
+                    log.warning("hostapd stopped answering PING")
+                    return
+                if ping_sent is None and now - last_seen >= PING_INTERVAL:
+                    self._sock.send(b"PING")
+                    ping_sent = now
+                continue
+            # Replies share the socket with events; anything received (PONG included) proves hostapd is alive
+            last_seen = time.monotonic()
+            ping_sent = None
+            match = _EVENT_LINE.match(data.decode(errors='replace'))
+            if not match:
+                continue
+            event, mac = match.groups()
+            self.events += 1
+            if event == EVENT_CONNECTED and mac:
+                self._connected(mac.lower())
+            elif event == EVENT_DISCONNECTED and mac:
+                self._disconnected(mac.lower())
+            elif event == EVENT_TERMINATING:
+                log.info("hostapd is shutting down")
+                return
+
+
+class FakeHostapd:
+    """
+    Stand-in for hostapd's control socket: answers PING, ATTACH, DETACH,
+    STA, STA-FIRST and STA-NEXT, and sends station events to attached
+    monitors. Drive it with connect()/disconnect().
+    """
+
+    def __init__(self, ctrl_path):
+        self.ctrl_path = ctrl_path
+        self.stations = {}  # mac -> {'signal', 'associated_at', ...}
+        self.monitors = set()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(ctrl_path)
+        self._sock.settimeout(0.2)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="fake-hostapd", daemon=True)
+        self._thread.start()
+
+    def connect(self, mac, signal=-50):
+        self.stations[mac] = {'signal': signal, 'associated_at': time.time(), 'rx_bytes': 0, 'tx_bytes': 0}
+        self._event(f"{EVENT_CONNECTED} {mac}")
+
+    def disconnect(self, mac):
+        self.stations.pop(mac, None)
+        self._event(f"{EVENT_DISCONNECTED} {mac}")
+
+    def close(self, terminating=True):
+        if terminating:
+            self._event(EVENT_TERMINATING)
+        self._running = False
+        self._thread.join()
+        self._sock.close()
+        os.unlink(self.ctrl_path)
+
+    def _event(self, text):
+        for monitor in list(self.monitors):
+            try:
+                self._sock.sendto(f"<3>{text}".encode(), monitor)
+            except OSError:
+                self.monitors.discard(monitor)
+
+    def _sta(self, mac):
+        station = self.stations.get(mac)
+        if station is None:
+            return ""
+        return (f"{mac}\nflags=[AUTH][ASSOC][AUTHORIZED]\nsignal={station['signal']}\n"
+                f"rx_bytes={station['rx_bytes']}\ntx_bytes={station['tx_bytes']}\ninactive_msec=0\n"
+                f"connected_time={int(time.time() - station['associated_at'])}\n")
+
+    def _reply(self, command, sender):
+        if command == "PING":
+            return "PONG\n"
+        if command == "ATTACH":
+            self.monitors.add(sender)
+            return "OK\n"
+        if command == "DETACH":
+            self.monitors.discard(sender)
+            return "OK\n"
+        macs = sorted(self.stations)
+        if command == "STA-FIRST":
+            return self._sta(macs[0]) if macs else ""
+        if command.startswith("STA-NEXT "):
+            later = [mac for mac in macs if mac > command.split()[1]]
+            return self._sta(later[0]) if later else ""
+        if command.startswith("STA "):
+            return self._sta(command.split()[1]) or "FAIL\n"
+        return "UNKNOWN COMMAND\n"
+
+    def _serve(self):
+        while self._running:
+            try:
+                data, sender = self._sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            try:
+                self._sock.sendto(self._reply(data.decode().strip(), sender).encode(), sender)
+            except OSError:
+                pass
+
+
+monitor = StationMonitor()
+
+
+if __name__ == "__main__":
+    # Drive a StationMonitor with FakeHostapd: sync, events, eviction,
+    # TERMINATING and reattach. Exits 1 if any check fails.
+    import sys
+    import tempfile
+
+    def wait_for(condition, timeout):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    failures = []
+
+    def check(label, ok, detail=""):
+        print(f"  {'ok  ' if ok else 'FAIL'} {label}{f' ({detail})' if detail else ''}")
+        if not ok:
+            failures.append(label)
+
+    def macs():
+        return [s['mac'] for s in demo.stations()]
+
+    with tempfile.TemporaryDirectory() as scratch:
+        ctrl_path = os.path.join(scratch, "wlan0")
+        fake = FakeHostapd(ctrl_path)
+        fake.connect("aa:bb:cc:00:00:01", signal=-42)  # associated before we attach
+
+        demo = StationMonitor(ctrl_path)
+        evicted = []
+        timings = {}
+        demo.add_evictor(lambda mac, ip: (timings.setdefault('evicted', time.perf_counter()),
+                                          evicted.append(mac)))
+        demo.start()
+        check("attach syncs stations already associated",
+              wait_for(lambda: macs() == ["aa:bb:cc:00:00:01"], 2), macs())
+        check("signal read on sync", demo.stations()[:1] and demo.stations()[0]['signal'] == -42)
+
+        fake.connect("aa:bb:cc:00:00:02", signal=-67)
+        check("connect event adds the station",
+              wait_for(lambda: "aa:bb:cc:00:00:02" in macs(), 2), macs())
+
+        timings['sent'] = time.perf_counter()
+        fake.disconnect("aa:bb:cc:00:00:01")
+        check("disconnect event runs the evictor for that MAC",
+              wait_for(lambda: evicted == ["aa:bb:cc:00:00:01"], 2), evicted)
+        if 'evicted' in timings:
+            print(f"       disconnect -> evictor: {(timings['evicted'] - timings['sent']) * 1000:.2f} ms")
+        check("other stations remain", macs() == ["aa:bb:cc:00:00:02"], macs())
+
+        fake.close()  # sends CTRL-EVENT-TERMINATING
+        check("TERMINATING detaches the monitor", wait_for(lambda: not demo.attached, 2))
+
+        fake = FakeHostapd(ctrl_path)
+        fake.connect("aa:bb:cc:00:00:03")
+        check("reattaches to a restarted hostapd",
+              wait_for(lambda: demo.attached and "aa:bb:cc:00:00:03" in macs(), RETRY_MIN * 8), macs())
+        demo.stop()
+        fake.close()
+
+    print("FAILED" if failures else "OK: station monitor checks passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Import-time profile and budget check
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter,
+reports where the time goes and checks the entry modules against their
+budgets, so a new top-level import of a heavy package shows up as a failure
+instead of as a slower boot.
+
+Usage:
+    python3 import_profile.py            # report
+    python3 import_profile.py --check    # exit 1 if a budget is exceeded
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+import os
+
+# Modules that must not be imported (directly or indirectly) by importing
+# the entry module, and the total import time allowed on a development
+# machine (use --scale on slower hardware).
+BUDGETS = {
+    'launcher': {
+        'max_ms': 80,
+        'forbidden': ('server', 'flask', 'werkzeug', 'mysql', 'tkinter', 'psutil', 'asyncio'),
+    },
+    'server': {
+        'max_ms': 250,
+        'forbidden': ('mysql', 'tkinter', 'psutil'),
+    },
+}
+
+_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def profile(module, runs=3):
+    """
+    Import `module` in fresh interpreters and parse -X importtime.
+
+    Args:
+        module: Module name (imported from this directory)
+        runs: Interpreters to start; the fastest run is reported
+
+    Returns:
+        dict: 'total_ms' and 'modules', a list of
+        (name, self_ms, cumulative_ms, depth) in import order
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+        modules = []
+        for line in result.stderr.splitlines():
+            match = _LINE.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                modules.append((name, int(self_us) / 1000, int(cumulative_us) / 1000, (len(indent) - 1) // 2))
+        total = next((m[2] for m in reversed(modules) if m[0] == module), 0.0)
+        if best is None or total < best['total_ms']:
+            best = {'total_ms': total, 'modules': modules}
+    return best
+
+
+def check(module, budget, scale=1.0, data=None):
+    """
+    Returns:
+        list: Human-readable budget violations (empty if within budget)
+    """
+    data = data or profile(module)
+    problems = []
+    loaded = {name for name, _, _, _ in data['modules']}
+    for name in budget.get('forbidden', ()):
+        hits = sorted(m for m in loaded if m == name or m.startswith(name + '.'))
+        if hits:
+            problems.append(f"{module} imports {name} at import time ({len(hits)} module(s))")
+    limit = budget.get('max_ms')
+    if limit is not None and data['total_ms'] > limit * scale:
+        problems.append(f"{module} import took {data['total_ms']:.1f} ms (budget {limit * scale:.0f} ms)")
+    return problems
+
+
+def report(module, data, top=15):
+    """Top entries by cumulative time, as text"""
+    lines = [f"import {module}: {data['total_ms']:.1f} ms"]
+    ranked = sorted(data['modules'], key=lambda m: m[2], reverse=True)
+    for name, self_ms, cumulative_ms, depth in ranked[:top]:
+        lines.append(f"  {cumulative_ms:8.1f} ms  (self {self_ms:6.1f})  {'  ' * depth}{name}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Import-time report and budget check')
+    parser.add_argument('modules', nargs='*', default=list(BUDGETS), help='Entry modules (default: all budgeted)')
+    parser.add_argument('--check', action='store_true', help='Exit 1 if any budget is exceeded')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply time budgets (slow hardware)')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        data = profile(module)
+        print(report(module, data, args.top))
+        problems = check(module, BUDGETS.get(module, {}), args.scale, data)
+        for problem in problems:
+            print(f"  !! {problem}")
+        failures.extend(problems)
+        print()
+
+    if args.check:
+        print("FAILED" if failures else "OK: all imports within budget")
+        sys.exit(1 if failures else 0)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Background jobs for the portal server
+Slow side effects (starting the game browser, refreshing bak.txt and the
+pushed balance) run on a small bounded worker pool instead of the request
+thread. Every job gets an ID that can be polled at /api/jobs/<id>.
+"""
+
+import collections
+import itertools
+import queue
+import threading
+import time
+
+import portal_logging
+
+log = portal_logging.get_logger("jobs")
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 64
+KEEP_FINISHED = 256      # finished jobs kept for status lookups
+LATENCY_SAMPLES = 512    # samples kept per latency series
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """The job queue is at capacity"""
+
+
+class LatencyStats:
+    """Fixed-size ring of latency samples (ms) with percentile summaries"""
+
+    def __init__(self, size=LATENCY_SAMPLES):
+        self._samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add(self, ms):
+        with self._lock:
+            self._samples.append(ms)
+            self.count += 1
+
+    def summary(self):
+        """
+        Returns:
+            dict: count (all time) and p50/p95/max over the recent samples
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self.count
+        if not samples:
+            return {'count': count}
+        return {
+            'count': count,
+            'p50_ms': round(samples[len(samples) // 2], 3),
+            'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+            'max_ms': round(samples[-1], 3),
+        }
+
+
+class Job:
+    """One unit of background work and its outcome"""
+
+    def __init__(self, job_id, name, fn, args, kwargs, key=None):
+        self.id = job_id
+        self.name = name
+        self.key = key
+        self.status = STATUS_QUEUED
+        self.result = None
+        self.error = None
+        self.request_id = portal_logging.get_request_id()
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._submitted = time.perf_counter()
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job finished; returns True if it did"""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.result is not None:
+            data['result'] = self.result
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+
+class JobExecutor:
+    """
+    Bounded worker pool.
+
+    Jobs submitted with the same `key` run one at a time in submission
+    order (e.g. all balance refreshes), so a slow older job can never
+    overwrite the result of a newer one. Keyless jobs run in parallel.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._jobs = collections.OrderedDict()   # id -> Job
+        self._waiting = {}                       # key -> deque of jobs behind the active one
+        self._listeners = []
+        self._threads = []
+        self._running = 0
+        self.failed = 0
+        self.rejected = 0
+        self.queue_latency = LatencyStats()
+        self.run_time = LatencyStats()
+
+    def _start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def add_listener(self, callback):
+        """Call `callback(job)` after every job finishes (completion events)"""
+        self._listeners.append(callback)
+
+    def submit(self, name, fn, *args, key=None, **kwargs):
+        """
+        Queue `fn(*args, **kwargs)` to run on a worker.
+
+        Args:
+            name: Short job name shown in status and logs
+            fn: Callable; its return value becomes the job result
+            key: Optional serialization key (see class docstring)
+
+        Returns:
+            Job
+
+        Raises:
+            QueueFullError: if the queue is at capacity
+        """
+        with self._lock:
+            if not self._threads:
+                self._start()
+            waiting = sum(len(d) for d in self._waiting.values())
+            if self._queue.qsize() + waiting >= self._queue.maxsize:
+                self.rejected += 1
+                raise QueueFullError(f"Job queue full ({self._queue.maxsize})")
+            job = Job(next(self._ids), name, fn, args, kwargs, key)
+
+            if key is not None and key in self._waiting:
+                # Another job with this key is queued or running; go behind it
+                self._waiting[key].append(job)
+            else:
+                try:
+                    self._queue.put_nowait(job)
+                except queue.Full:
+                    self.rejected += 1
+                    raise QueueFullError(f"Job queue full ({self._queue.maxsize})")
+                if key is not None:
+                    self._waiting[key] = collections.deque()
+
+            self._jobs[job.id] = job
+            self._trim()
+        return job
+
+    def get(self, job_id):
+        """Look up a job by ID (None once it has aged out)"""
+        return self._jobs.get(job_id)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            self._run(job)
+            self._release_key(job)
+
+    def _run(self, job):
+        self.queue_latency.add((time.perf_counter() - job._submitted) * 1000)
+        with self._lock:
+            self._running += 1
+        job.status = STATUS_RUNNING
+        job.started_at = time.time()
+        portal_logging.set_request_id(job.request_id)
+        started = time.perf_counter()
+        try:
+            job.result = job._fn(*job._args, **job._kwargs)
+            job.status = STATUS_DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = STATUS_FAILED
+            self.failed += 1
+            log.error(f"Job {job.name} failed: {e}", extra={'job_id': job.id})
+        finally:
+            self.run_time.add((time.perf_counter() - started) * 1000)
+            job.finished_at = time.time()
+            job._fn = job._args = job._kwargs = None
+            with self._lock:
+                self._running -= 1
+            job._done.set()
+
+        for callback in list(self._listeners):
+            try:
+                callback(job)
+            except Exception as e:
+                log.error(f"Job listener failed: {e}")
+        portal_logging.clear_request_id()
+
+    def _release_key(self, job):
+        """Queue the next job waiting on the same key"""
+        if job.key is None:
+            return
+        with self._lock:
+            waiting = self._waiting.get(job.key)
+            if not waiting:
+                self._waiting.pop(job.key, None)
+                return
+            # Moved under the same lock that admits new jobs: the follower
+            # already counted against the bound, so its slot is still free
+            self._queue.put_nowait(waiting.popleft())
+
+    def stats(self):
+        """
+        Returns:
+            dict: Queue depth, running/failed/rejected counts and the
+            queue-latency / run-time summaries
+        """
+        with self._lock:
+            running = self._running
+            waiting = sum(len(d) for d in self._waiting.values())
+        return {
+            'workers': self.workers,
+            'queued': self._queue.qsize() + waiting,
+            'running': running,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'queue_latency': self.queue_latency.summary(),
+            'run_time': self.run_time.summary(),
+        }
+
+
+executor = JobExecutor()
+
+
+if __name__ == "__main__":
+    # Queue latency under load: 500 short jobs and a few slow ones on 2 workers
+    print("Measuring job queue latency...")
+    results = []
+
+    def submit(*args, **kwargs):
+        while True:
+            try:
+                return executor.submit(*args, **kwargs)
+            except QueueFullError:
+                time.sleep(0.001)  # back-pressure: the bound held
+
+    for i in range(500):
+        submit("bench", lambda n=i: results.append(n), key="bench" if i % 2 else None)
+        if i % 100 == 0:
+            submit("slow", time.sleep, 0.02)
+        if i % 50 == 0:
+            time.sleep(0.005)
+
+    while executor.stats()['queued'] or executor.stats()['running']:
+        time.sleep(0.01)
+
+    stats = executor.stats()
+    print(f"  jobs run:      {stats['run_time']['count']} (submissions refused while full: {stats['rejected']})")
+    print(f"  queue latency: {stats['queue_latency']}")
+    print(f"  run time:      {stats['run_time']}")
+    ordered = [n for n in results if n % 2]
+    assert ordered == sorted(ordered), "keyed jobs ran out of order"
+    print("OK: keyed jobs ran in submission order")
@@ -1,28 +1,40 @@
 #!/usr/bin/env python3
+import startup_profiler  # First, so the timeline covers the imports below
 import os
 import sys
 import subprocess
 import time
 import signal
-import psutil
+import threading
 import socket
+import importlib
+from concurrent.futures import ThreadPoolExecutor
 import config_loader
-import server
-import server_display  # Server-side on-screen notifications
+import portal_logging   # Queue-backed structured logging
+import log_rotation     # Size/age rotation of the /tmp logs
+import supervisor       # Supervised hostapd/dnsmasq with readiness probes
+import firewall         # Atomic iptables-restore rulesets
+import client_access    # ipset allowlist of released clients
+import traffic_accounting  # Per-client byte/packet counters
+import port_owner       # Port -> owning process via /proc socket inodes
+import netlink          # Link/address setup over rtnetlink
+import config_watch     # Live reload of config.sh
+import license_check    # Hardware license (background, cached per boot)
+import server_display  # Server-side on-screen notifications (tkinter loads on init)
+# server (Flask, the DB driver) is imported during bring-up, see start_services()
 
+startup_profiler.mark("imports")
 
-# Colors for output
-RED = '\033[0;31m'
-GREEN = '\033[0;32m'
-YELLOW = '\033[1;33m'
-BLUE = '\033[0;34m'
-CYAN = '\033[0;36m'
-NC = '\033[0m'
+log = portal_logging.get_logger("launcher")
 
-def log_info(msg): print(f"{CYAN}[INFO]{NC} {msg}")
-def log_success(msg): print(f"{GREEN}[SUCCESS]{NC} {msg}")
-def log_warning(msg): print(f"{YELLOW}[WARNING]{NC} {msg}")
-def log_error(msg): print(f"{RED}[ERROR]{NC} {msg}")
+# Config the services were started with (cleanup must undo exactly that,
+# even after config.sh was edited)
+RUNNING_CONFIG = None
+
+def log_info(msg): log.info(msg)
+def log_success(msg): log.info(msg, extra={'success': True})
+def log_warning(msg): log.warning(msg)
+def log_error(msg): log.error(msg)
 
 def get_executable_dir():
     if getattr(sys, 'frozen', False):
@@ -42,6 +54,16 @@ def run_cmd(cmd, check=True, capture=False):
         if capture: return e.stderr.strip()
         return False
 
+def wait_until(condition, timeout, interval=0.05):
+    """Poll `condition()` until it returns True or `timeout` seconds pass"""
+    deadline = time.monotonic() + timeout
+    while True:
+        if condition():
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+
 def is_port_available(port, host='0.0.0.0'):
     """Check if port is available for binding"""
     try:
@@ -53,26 +75,20 @@ def is_port_available(port, host='0.0.0.0'):
     except OSError:
         return False
 
-def get_processes_using_port(port):
-    """Find all processes using the specified port"""
-    processes = []
-    for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-        try:
-            connections = proc.connections(kind='inet')
-            for conn in connections:
-                if conn.status == 'LISTEN' and conn.laddr.port == port:
-                    processes.append({
-                        'pid': proc.info['pid'],
-                        'name': proc.info['name'],
-                        'cmdline': ' '.join(proc.info['cmdline']) if proc.info['cmdline'] else ''
-                    })
-                    break
-        except (psutil.NoSuchProcess, psutil.AccessDenied, AttributeError):
-            continue
-    return processes
+def get_processes_using_port(port, host=None):
+    """
+    Find the processes listening on the specified port.
+
+    Resolved through the socket inode in /proc (see port_owner) rather than
+    asking every process for its connections.
+    """
+    if host in port_owner.WILDCARD_ADDRESSES:
+        host = None
+    return port_owner.find_owners(port, host)
 
 def kill_process_by_pid(pid, process_name, timeout=5):
     """Kill a process by PID with graceful fallback"""
+    import psutil
     try:
         proc = psutil.Process(pid)
         log_info(f"  Sending SIGTERM to {process_name} (PID: {pid})...")
@@ -105,11 +121,11 @@ def cleanup_port(port, host='0.0.0.0', max_retries=3):
             log_success(f"Port {port} is available")
             return True
         
-        processes = get_processes_using_port(port)
+        processes = get_processes_using_port(port, host)
         
         if not processes:
             log_warning(f"Port {port} appears busy but no processes found")
-            time.sleep(1)
+            wait_until(lambda: is_port_available(port, host), 1)
             continue
         
         log_warning(f"Found {len(processes)} process(es) using port {port}:")
@@ -123,7 +139,8 @@ def cleanup_port(port, host='0.0.0.0', max_retries=3):
             if kill_process_by_pid(proc['pid'], proc['name']):
                 success_count += 1
         
-        time.sleep(1)
+        # The owners have exited; the socket is released right after
+        wait_until(lambda: is_port_available(port, host), 1)
     
     if is_port_available(port, host):
         log_success(f"Port {port} successfully cleaned up")
@@ -206,92 +223,231 @@ def setup_x11():
     else:
         os.environ["DISPLAY"] = ":0"
         run_cmd("xhost +local:root > /dev/null 2>&1", check=False)
-def cleanup_all(iface, port):
-    """
-    Comprehensive cleanup before starting services
-    Equivalent to start.sh lines 96-145
+def stop_portal_processes(timeout=3):
     """
-    log_info("=" * 60)
-    log_info("CLEANUP SECTION - Stopping existing services")
-    log_info("=" * 60)
+    Stop a previous portal server, dnsmasq and hostapd and wait until they
+    have actually exited (SIGKILL for any still running after `timeout`)
     
-    # Step 1: Stop Python web server
-    log_info("Step 1/5: Stopping Python web server...")
-    run_cmd("pkill -f 'python3 server.py'", check=False)
-    run_cmd("pkill -f 'server.py'", check=False)
+    Returns:
+        int: Number of processes stopped
+    """
+    import psutil
+    me = os.getpid()
+    targets = {}
+    for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+        try:
+            name = proc.info['name'] or ''
+            cmdline = ' '.join(proc.info['cmdline'] or [])
+            if proc.info['pid'] != me and (name in ('dnsmasq', 'hostapd') or 'server.py' in cmdline):
+                targets[proc.pid] = proc
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
     
     pid_file = "/tmp/portal-server.pid"
     if os.path.exists(pid_file):
         try:
             with open(pid_file, 'r') as f:
-                pid = f.read().strip()
-            run_cmd(f"kill {pid}", check=False)
+                pid = int(f.read().strip())
+            if pid != me and psutil.pid_exists(pid):
+                targets[pid] = psutil.Process(pid)
             os.remove(pid_file)
             log_success(f"Removed PID file: {pid_file}")
-        except:
+        except (OSError, ValueError, psutil.Error):
             pass
     
-    log_success("Python web server stopped")
-    time.sleep(1)
-    
-    # Step 2: Stop dnsmasq
-    log_info("Step 2/5: Stopping dnsmasq...")
-    run_cmd("killall dnsmasq", check=False)
-    run_cmd("pkill -f dnsmasq", check=False)
-    log_success("dnsmasq stopped")
-    time.sleep(1)
-    
-    # Step 3: Stop hostapd
-    log_info("Step 3/5: Stopping hostapd...")
-    run_cmd("killall hostapd", check=False)
-    run_cmd("pkill -f hostapd", check=False)
-    log_success("hostapd stopped")
-    time.sleep(1)
-    
-    # Step 4: Clear iptables rules
-    log_info("Step 4/5: Clearing iptables rules...")
-    run_cmd("iptables -F", check=False)
-    run_cmd("iptables -t nat -F", check=False)
-    run_cmd("iptables -t mangle -F", check=False)
-    run_cmd("iptables -X", check=False)
-    run_cmd("iptables -t nat -X", check=False)
-    run_cmd("iptables -t mangle -X", check=False)
-    run_cmd("iptables -P INPUT ACCEPT", check=False)
-    run_cmd("iptables -P FORWARD ACCEPT", check=False)
-    run_cmd("iptables -P OUTPUT ACCEPT", check=False)
-    log_success("iptables rules cleared")
-    time.sleep(1)
-    
-    # Step 5: Reset network interface
-    log_info(f"Step 5/5: Resetting network interface {iface}...")
-    run_cmd(f"ip addr flush dev {iface}", check=False)
-    run_cmd(f"ip link set {iface} down", check=False)
+    for proc in targets.values():
+        try:
+            proc.terminate()
+        except psutil.NoSuchProcess:
+            pass
+    _, alive = psutil.wait_procs(list(targets.values()), timeout=timeout)
+    for proc in alive:
+        log_warning(f"  {proc.pid} did not stop, sending SIGKILL...")
+        try:
+            proc.kill()
+        except psutil.NoSuchProcess:
+            pass
+    psutil.wait_procs(alive, timeout=1)
+    return len(targets)
+
+def clear_iptables(keep_allowlist=False):
+    """
+    Flush all rules and chains, reset the default policies to ACCEPT and
+    drop the ipsets. keep_allowlist (restart) keeps the released clients,
+    so the next bring-up's ensure_sets() finds them again.
+    """
+    # Stop routing before the FORWARD rules go (the restarted launcher turns
+    # forwarding back on if it still releases clients)
+    client_access.restore_forwarding()
+    try:
+        firewall.clear()
+    except firewall.FirewallError as e:
+        log_error(f"Clearing iptables failed: {e}")
+        return
+    if not keep_allowlist:
+        client_access.destroy()
+    traffic_accounting.destroy()
+
+def reset_interface(iface):
+    """Drop the hotspot address and hand the interface back to NetworkManager"""
+    netlink.reset(iface)
     run_cmd(f"nmcli device set {iface} managed yes", check=False)
+
+def cleanup_all(iface, port):
+    """
+    Comprehensive cleanup before starting services
+    Equivalent to start.sh lines 96-145
+    
+    The interface is reset once hostapd (which holds it) has exited.
+    Old iptables rules are not flushed here: bring-up replaces the whole
+    ruleset in one transaction (see configure_firewall), so the firewall
+    is never left empty in between.
+    """
+    log_info("=" * 60)
+    log_info("CLEANUP SECTION - Stopping existing services")
+    log_info("=" * 60)
+    
+    log_info("Stopping web server, dnsmasq and hostapd...")
+    with startup_profiler.phase("cleanup_processes"):
+        stopped = stop_portal_processes()
+    log_success(f"Stopped {stopped} process(es)")
+    
+    log_info(f"Resetting network interface {iface}...")
+    with startup_profiler.phase("cleanup_interface"):
+        reset_interface(iface)
     log_success(f"Interface {iface} reset")
-    time.sleep(1)
     
     log_info("=" * 60)
     log_success("CLEANUP COMPLETE - Ready to start fresh")
     log_info("=" * 60)
 
+def configure_interface(iface, ip):
+    """Take the interface from NetworkManager and give it the hotspot address"""
+    # At boot the WiFi driver may still be loading
+    if not netlink.wait_link(iface, 30):
+        log_error(f"Interface {iface} did not appear")
+    
+    log_info(f"Stopping NetworkManager on {iface}...")
+    run_cmd(f"nmcli device set {iface} managed no", check=False)
+    
+    log_info(f"Configuring interface {iface}...")
+    result = netlink.configure(iface, f"{ip}/24")
+    if not result['ok']:
+        log_error(f"Configuring {iface} with {ip}/24 failed")
+
+def configure_firewall(iface, ip, port, dhcp_range=None, release=False):
+    """
+    Redirect HTTP/HTTPS from the hotspot to the portal and accept its traffic.
+    Replaces any previous rules atomically (nothing is written if they match).
+    Traffic of the DHCP range is counted per client (traffic_accounting ipsets).
+    With `release` (the built-in DNS responder is on), released clients
+    (client_access ipsets) bypass the redirect and are forwarded to the
+    internet.
+    """
+    log_info("Configuring iptables...")
+    allow_sets = ()
+    if release and client_access.ensure_sets() and client_access.enable_forwarding():
+        allow_sets = client_access.SET_TYPES
+    accounting_sets = None
+    if dhcp_range and all(dhcp_range) and traffic_accounting.ensure_sets(*dhcp_range):
+        accounting_sets = traffic_accounting.ACCOUNTING_SETS
+    try:
+        result = firewall.apply(firewall.portal_ruleset(iface, ip, port, allow_sets, accounting_sets))
+        log_success(f"iptables rules {'loaded' if result['changed'] else 'already in place'} ({result['ms']} ms)")
+    except firewall.FirewallError as e:
+        log_error(f"Configuring iptables failed: {e}")
+
+def builtin_dns_settings(config):
+    """DNS_RESPONDER settings, or None when dnsmasq answers DNS (asyncio is then never imported)"""
+    if config.get('DNS_RESPONDER', '0') != '1':
+        return None
+    import dns_responder
+    return dns_responder.get_dns_settings(config)
+
+def start_network_services(base_dir, ip, dns_settings=None):
+    """
+    Start hostapd and dnsmasq in the foreground under the supervisor, which
+    restarts them if they die. Returns at once; see wait_ready().
+    With the built-in DNS responder, dnsmasq only does DHCP.
+    """
+    builtin_dns = bool(dns_settings and dns_settings['enabled'])
+    hostapd_conf = os.path.join(base_dir, "hostapd.conf")
+    log_info("Starting hostapd and dnsmasq...")
+    supervisor.services.add(supervisor.Service(
+        'hostapd',
+        ["hostapd", "-f", log_rotation.MANAGED_LOGS['hostapd'], hostapd_conf],
+        probe=supervisor.hostapd_probe(hostapd_conf)))
+    dnsmasq_conf = os.path.join(base_dir, "dnsmasq.conf")
+    dnsmasq = ["dnsmasq", "-k", "-C", dnsmasq_conf, f"--log-facility={log_rotation.MANAGED_LOGS['dnsmasq']}"]
+    if builtin_dns:
+        dnsmasq.append("--port=0")  # DHCP only; port 53 is ours
+        probe = supervisor.ports_probe(udp=[67], address=ip)
+    else:
+        probe = supervisor.ports_probe(tcp=[53], udp=[53, 67], address=ip)
+    supervisor.services.add(supervisor.Service('dnsmasq', dnsmasq, probe=probe))
+    supervisor.services.start('hostapd', 'dnsmasq')
+
+    if builtin_dns:
+        import dns_responder
+        log_info("Starting the built-in DNS responder...")
+        if dns_responder.start(dnsmasq_conf, ip, dns_settings['upstream']):
+            supervisor.services.add(supervisor.Service('dns', probe=supervisor.ports_probe(udp=[53], address=ip))).start()
+        else:
+            log_error("Hotspot clients have no DNS; set DNS_RESPONDER=\"0\" to use dnsmasq")
+
+def wait_for_display(display=":0", timeout=30):
+    """Wait until the X server accepts connections on its local socket"""
+    socket_path = f"/tmp/.X11-unix/X{display.lstrip(':').split('.')[0]}"
+    
+    def x_server_up():
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+    
+    return wait_until(x_server_up, timeout, interval=0.1)
+
 def start_services():
     if os.geteuid() != 0:
         log_error("This script must be run as root (use sudo)")
 
-    config = config_loader.load_config()
+    global RUNNING_CONFIG
+    config = RUNNING_CONFIG = config_loader.load_config()
     iface = config.get('INTERFACE')
     ip = config.get('STATIC_IP')
     port = config.get('SERVER_PORT', '8080')
     base_dir = "/home/hp"  # Fixed absolute path for configs
     
+    # The launcher owns the /tmp logs: our own records go to the server log,
+    # hostapd/dnsmasq write theirs next to it, and one rotator bounds them all
+    portal_logging.redirect(path=log_rotation.MANAGED_LOGS['portal-server'])
+    rotator = log_rotation.LogRotator(**log_rotation.get_rotation_settings(config))
+    rotator.start()
+    
+    def on_config_change(old, new, changed):
+        # Rotation limits are plain attributes read on every check
+        for name, value in log_rotation.get_rotation_settings(new).items():
+            setattr(rotator, name, value)
+        restart_keys = sorted(changed & config_loader.RESTART_KEYS)
+        if restart_keys:
+            log_warning(f"{', '.join(restart_keys)} changed in config.sh, restarting the portal")
+            os.kill(os.getpid(), signal.SIGHUP)
+    
+    # Registered before init_server() starts the watcher
+    config_watch.watcher.add_listener(on_config_change)
+
     log_info(f"Starting Captive Portal on {iface} ({ip})...")
+    
+    # Fingerprinting runs alongside bring-up; a mismatch still powers off
+    license_check.start()
 
     # Cleanup all existing services first
-
-    cleanup_all(iface, port)
-
-    # Grant X11 and setup audio
-    setup_x11()
+    with startup_profiler.phase("cleanup"):
+        cleanup_all(iface, port)
 
     # Required files check
     for f in ["hostapd.conf", "dnsmasq.conf"]:
@@ -300,97 +456,125 @@ def start_services():
             # We don't exit(1) because we want to allow manual recovery if needed
             # but for services it is critical. Let's keep a warning.
 
-    # 1. NM stop
-    log_info(f"Stopping NetworkManager on {iface}...")
-    run_cmd(f"nmcli device set {iface} managed no", check=False)
+    # Independent bring-up steps run side by side:
+    #   X11/audio | interface -> hostapd/dnsmasq -> port check | firewall | server import
+    with ThreadPoolExecutor(max_workers=4, thread_name_prefix="bringup") as pool:
+        server_import = pool.submit(startup_profiler.call, "import_server", importlib.import_module, "server")
+        x11 = pool.submit(startup_profiler.call, "x11_audio", setup_x11)
+        dns_settings = builtin_dns_settings(config)
+        dhcp_range = (config.get('DHCP_RANGE_START'), config.get('DHCP_RANGE_END'))
+        # Releasing clients needs the built-in DNS (dnsmasq answers every name with the portal)
+        release = bool(dns_settings and dns_settings['enabled'])
+        rules = pool.submit(startup_profiler.call, "firewall", configure_firewall, iface, ip, port, dhcp_range,
+                            release)
+        
+        startup_profiler.call("interface", configure_interface, iface, ip)
+        startup_profiler.call("start_services", start_network_services, base_dir, ip, dns_settings)
+        
+        # Needs the address on the interface to test-bind ip:port
+        log_info(f"Cleaning up port {port}...")
+        if not startup_profiler.call("port_cleanup", cleanup_port, int(port), ip):
+            log_error(f"Cannot free port {port}, aborting server start")
+            log_error("Please check what's using the port: sudo lsof -i :{port}")
+            sys.exit(1)
+        
+        rules.result()
+        x11.result()
+        server = server_import.result()
+
+    # Wait for hostapd/dnsmasq to actually come up
+    with startup_profiler.phase("services_ready"):
+        not_ready = supervisor.services.wait_ready(['hostapd', 'dnsmasq'])
+    for name in not_ready:
+        log_error(f"{name} is not ready yet (still retrying, see /api/services)")
     
-    # 2. Interface setup
-    log_info(f"Configuring interface {iface}...")
-    run_cmd(f"ip link set {iface} down", check=False)
-    run_cmd(f"ip addr flush dev {iface}", check=False)
-    run_cmd(f"ip addr add {ip}/24 dev {iface}")
-    run_cmd(f"ip link set {iface} up")
-    
-    # 3. Hostapd
-    log_info("Starting hostapd...")
-    run_cmd("killall hostapd 2>/dev/null", check=False)
-    subprocess.Popen(["hostapd", "-B", os.path.join(base_dir, "hostapd.conf")], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    time.sleep(2)
-    
-    # 4. Dnsmasq
-    log_info("Starting dnsmasq...")
-    run_cmd("killall dnsmasq 2>/dev/null", check=False)
-    subprocess.Popen(["dnsmasq", "-C", os.path.join(base_dir, "dnsmasq.conf")], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    
-    # 5. Iptables
-    log_info("Configuring iptables...")
-    # Clean old rules
-    run_cmd(f"iptables -t nat -D PREROUTING -i {iface} -p tcp --dport 80 -j DNAT --to-destination {ip}:{port} 2>/dev/null", check=False)
-    run_cmd(f"iptables -t nat -D PREROUTING -i {iface} -p tcp --dport 443 -j DNAT --to-destination {ip}:{port} 2>/dev/null", check=False)
-    run_cmd(f"iptables -D INPUT -i {iface} -j ACCEPT 2>/dev/null", check=False)
-    
-    # Add new
-    run_cmd(f"iptables -t nat -A PREROUTING -i {iface} -p tcp --dport 80 -j DNAT --to-destination {ip}:{port}")
-    run_cmd(f"iptables -t nat -A PREROUTING -i {iface} -p tcp --dport 443 -j DNAT --to-destination {ip}:{port}")
-    run_cmd(f"iptables -A INPUT -i {iface} -j ACCEPT")
-
-    # 6. Clean up port before starting server
-    log_info(f"Cleaning up port {port}...")
-    if not cleanup_port(int(port), ip):
-        log_error(f"Cannot free port {port}, aborting server start")
-        log_error("Please check what's using the port: sudo lsof -i :{port}")
-        sys.exit(1)
-
-    # 7. Start Web Server
-    log_success("Captive Portal is ready!")
+    # Start Web Server
     log_info(f"SSID: {config.get('SSID')}")
     
     # Initialize server (License check, Display, etc.)
-    server.init_server()
+    with startup_profiler.phase("init_server"):
+        server.init_server(config)
+    
+    # The web server runs in this process; the supervisor only probes it
+    http = supervisor.services.add(supervisor.Service('http', probe=supervisor.tcp_connect_probe(ip, int(port))))
+    http.start()
+    
+    def announce_ready():
+        if http.ready.wait(supervisor.READY_TIMEOUT):
+            startup_profiler.mark("http_ready")
+            log_success("Captive Portal is ready!")
+            try:
+                timeline = startup_profiler.write()
+                log_info(f"Startup took {timeline['total_s']:.2f}s (timeline: {startup_profiler.TIMELINE_PATH})",
+                         extra={'services': supervisor.services.states()})
+            except OSError as e:
+                log_warning(f"Could not write startup timeline: {e}")
+    
+    threading.Thread(target=announce_ready, name="startup-ready", daemon=True).start()
     
     # Run the Flask app
     server.app.run(host=ip, port=int(port), debug=False)
 
+def teardown(restarting=False):
+    """
+    Stop the services and restore the interface and firewall of the running config
+    
+    Args:
+        restarting: The launcher starts over right away (SIGHUP); released
+            clients stay released
+    """
+    config = RUNNING_CONFIG or config_loader.load_config()
+    iface = config.get('INTERFACE')
+    
+    # 1. Stop networking services (supervised children first, so they aren't restarted)
+    log_info("Stopping hostapd and dnsmasq...")
+    supervisor.services.stop_all()
+    if 'dns_responder' in sys.modules:
+        sys.modules['dns_responder'].stop()
+    run_cmd("killall hostapd dnsmasq 2>/dev/null", check=False)
+    
+    # 2./3. Clear iptables rules and reset the interface, restoring
+    # NetworkManager management (no restart: causes a race condition)
+    log_info(f"Clearing iptables rules and resetting interface {iface}...")
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        flush = pool.submit(clear_iptables, keep_allowlist=restarting)
+        reset_interface(iface)
+        flush.result()
+
 def cleanup(sig, frame):
     log_info("\nStopping Captive Portal...")
     try:
-        config = config_loader.load_config()
-        iface = config.get('INTERFACE')
-        
-        # 1. Stop networking services
-        log_info("Stopping hostapd and dnsmasq...")
-        run_cmd("killall hostapd 2>/dev/null", check=False)
-        run_cmd("killall dnsmasq 2>/dev/null", check=False)
-        
-        # 2. Clear iptables rules (Full cleanup matching cleanup_all)
-        log_info("Clearing iptables rules...")
-        run_cmd("iptables -F", check=False)
-        run_cmd("iptables -t nat -F", check=False)
-        run_cmd("iptables -t mangle -F", check=False)
-        run_cmd("iptables -X", check=False)
-        run_cmd("iptables -t nat -X", check=False)
-        run_cmd("iptables -t mangle -X", check=False)
-        run_cmd("iptables -P INPUT ACCEPT", check=False)
-        run_cmd("iptables -P FORWARD ACCEPT", check=False)
-        run_cmd("iptables -P OUTPUT ACCEPT", check=False)
-        
-        # 3. Reset interface
-        log_info(f"Resetting interface {iface}...")
-        run_cmd(f"ip addr flush dev {iface}", check=False)
-        run_cmd(f"ip link set {iface} down", check=False)
-        
-        # 4. Restore NetworkManager management (No restart!)
-        log_info("Restoring NetworkManager management...")
-        run_cmd(f"nmcli device set {iface} managed yes", check=False)
-        # run_cmd("systemctl restart NetworkManager", check=False) # REMOVED: Causes race condition
-        
+        teardown()
         log_success("Cleanup complete. Networking restored.")
     except Exception as e:
         log_error(f"Error during cleanup: {e}")
     finally:
         sys.exit(0)
 
+def restart(sig, frame):
+    """
+    SIGHUP: tear down and start over with the current config.sh (sent by
+    the config watcher when a setting that needs a restart changed)
+    """
+    log_info("Restarting Captive Portal...")
+    try:
+        config_watch.watcher.stop()
+        teardown(restarting=True)
+    except Exception as e:
+        log_error(f"Error during cleanup: {e}")
+    portal_logging.shutdown()  # Flush before the process image is replaced
+    
+    # Frozen builds are their own interpreter
+    argv = sys.argv if getattr(sys, 'frozen', False) else [sys.executable] + sys.argv
+    os.execv(sys.executable, argv)
+
 if __name__ == "__main__":
+    if "--probe-startup" in sys.argv:
+        # Used by startup_bench.py: emit the first log line and exit
+        log_info(f"Launcher started ({startup_profiler.profiler.now():.3f}s after exec)")
+        portal_logging.shutdown()
+        sys.exit(0)
+
     # Write launch time to log immediately
     try:
         log_path = os.path.join(get_executable_dir(), "launchlog.txt")
@@ -402,12 +586,14 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Failed to write launch log: {e}")
     
-    a=10
-    for i in range(10):
-        a*=a
-        time.sleep(1)
+    # At boot the launcher can start before the desktop; wait for the X
+    # server instead of sleeping a fixed time
+    with startup_profiler.phase("wait_display"):
+        if not wait_for_display():
+            log_warning("X display not available, continuing without it")
 
     server_display.show_notification("Merhaba")
     signal.signal(signal.SIGINT, cleanup)
     signal.signal(signal.SIGTERM, cleanup)
+    signal.signal(signal.SIGHUP, restart)
     start_services()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Hardware license verification
+Compares the hardware fingerprint hash with the one stored in LICENSE_FILE
+(written by secgen.py). Verification runs in the background while the
+services come up; a successful result is cached for the rest of the boot in
+a root-owned file, so restarts of the portal skip the fingerprinting.
+The same thread then keeps re-checking: on a jittered timer, and whenever a
+network interface appears, disappears or changes its MAC.
+"""
+
+import hashlib
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+
+import fingerprint
+import netlink
+import portal_logging
+
+log = portal_logging.get_logger("license")
+
+LICENSE_FILE = "/home/hp/dlI"  # Fixed absolute path
+CACHE_FILE = "/run/portal-license.json"  # tmpfs: gone after a reboot
+BOOT_ID_FILE = "/proc/sys/kernel/random/boot_id"
+
+# Re-verification: every REVERIFY_INTERVAL seconds +/- REVERIFY_JITTER, and
+# after link events once they have been quiet for HOTPLUG_SETTLE seconds.
+# A mismatch must still be there CONFIRM_DELAY seconds later before it counts.
+REVERIFY_INTERVAL = 3600
+REVERIFY_JITTER = 0.25
+HOTPLUG_SETTLE = 2.0
+CONFIRM_DELAY = 30
+
+_lock = threading.Lock()
+_thread = None
+result = None  # None while pending, then True/False
+
+# Re-verification counters; cpu_ms is CPU time of the license thread itself
+stats = {'checks': 0, 'link_events': 0, 'hotplug_checks': 0, 'cpu_ms': 0.0, 'last_check': None}
+
+
+def calculate_hardware_hash():
+    # Same identifiers as secgen.py, read from sysfs
+    return fingerprint.hardware_hash()
+
+
+# ========================
+# Per-boot cache
+# ========================
+
+def _boot_id():
+    try:
+        with open(BOOT_ID_FILE) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cache_key(stored_hash):
+    """What a cached result is valid for: this boot and this license file"""
+    boot_id = _boot_id()
+    if boot_id is None:
+        return None
+    return hashlib.sha256(f"{boot_id}|{stored_hash}".encode()).hexdigest()
+
+
+def _read_cache(key):
+    """True if the cache file says this key was verified (and is trustworthy)"""
+    try:
+        fd = os.open(CACHE_FILE, os.O_RDONLY | os.O_NOFOLLOW)
+    except OSError:
+        return False
+    try:
+        st = os.fstat(fd)
+        # Only a file root wrote and nobody else can change counts
+        if st.st_uid != 0 or st.st_mode & 0o022:
+            log.warning(f"Ignoring {CACHE_FILE}: not owned and writable by root only")
+            return False
+        with os.fdopen(fd, "r") as f:
+            fd = None
+            return json.load(f).get("key") == key
+    except (OSError, ValueError, AttributeError):
+        return False
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+def _write_cache(key):
+    if os.geteuid() != 0:
+        return
+    tmp_path = f"{CACHE_FILE}.{os.getpid()}"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"key": key}, f)
+        os.replace(tmp_path, CACHE_FILE)
+    except OSError as e:
+        log.warning(f"Could not cache license result: {e}")
+
+
+def clear_cache():
+    try:
+        os.unlink(CACHE_FILE)
+    except FileNotFoundError:
+        pass
+
+
+# ========================
+# Verification
+# ========================
+
+def verify_license(use_cache=True):
+    """
+    Check the fingerprint against LICENSE_FILE.
+
+    Returns:
+        bool: True if the license matches this hardware
+    """
+    # DMI serials are root-readable only; without them the fingerprint cannot match
+    if os.geteuid() != 0:
+        log.warning("Not running as root, cannot verify hardware license.")
+
+    try:
+        # Look for license file in the fixed absolute directory
+        if not os.path.exists(LICENSE_FILE):
+            return False
+
+        with open(LICENSE_FILE, "r") as f:
+            stored_hash = f.read().strip()
+
+        key = _cache_key(stored_hash) if use_cache else None
+        if key is not None and _read_cache(key):
+            log.debug("License verified earlier this boot")
+            return True
+
+        current_hash = calculate_hardware_hash()
+        log.debug("License hash compared", extra={'current_hash': current_hash, 'stored_hash': stored_hash})
+        valid = current_hash == stored_hash
+        if valid and key is not None:
+            _write_cache(key)  # only successes are cached
+        return valid
+    except Exception as e:
+        log.error(f"Verification error: {e}")
+        return False
+
+
+def enforce_failure():
+    """License mismatch: power the machine off (never returns)"""
+    log.critical("arakci ayip sana")
+    log.critical("License verification failed - Shutting down system")
+
+    try:
+        subprocess.run(["shutdown", "-h", "now"], check=False)
+    except Exception as e:
+        log.error(f"Shutdown command failed: {e}")
+    portal_logging.shutdown()  # Flush before the machine goes down
+    os._exit(1)
+
+
+def _stored_hash():
+    try:
+        with open(LICENSE_FILE, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def recheck():
+    """
+    One re-verification: sysfs reads only (DMI values are cached by
+    fingerprint, the MACs are re-read), no cache file, no subprocess.
+
+    Returns:
+        bool: True if the hardware still matches LICENSE_FILE
+    """
+    cpu_started = time.thread_time()
+    valid = _stored_hash() == calculate_hardware_hash()
+    stats['checks'] += 1
+    stats['cpu_ms'] += (time.thread_time() - cpu_started) * 1000
+    stats['last_check'] = time.time()
+    return valid
+
+
+def _next_interval():
+    return REVERIFY_INTERVAL * random.uniform(1 - REVERIFY_JITTER, 1 + REVERIFY_JITTER)
+
+
+def _wait_for_hotplug(monitor, timeout):
+    """
+    Sleep until the timer runs out or the set of MACs changes.
+
+    Returns:
+        bool: True if woken by a MAC change, False on timeout
+    """
+    deadline = time.monotonic() + timeout
+    macs = fingerprint.macs()
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if monitor is None:
+            time.sleep(remaining)
+            return False
+        if not any(True for _ in monitor.events(remaining)):
+            return False
+        stats['link_events'] += 1
+        # Let a burst of events (driver reload, rename, up/down) settle
+        while any(True for _ in monitor.events(HOTPLUG_SETTLE)):
+            stats['link_events'] += 1
+        # Most events are flag changes; only new/removed/readdressed NICs matter
+        if fingerprint.macs() != macs:
+            stats['hotplug_checks'] += 1
+            return True
+
+
+def _reverify_loop():
+    try:
+        monitor = netlink.Netlink(groups=netlink.RTMGRP_LINK)
+    except netlink.NetlinkError as e:
+        log.warning(f"{e}, re-verifying the license on the timer only")
+        monitor = None
+
+    while True:
+        hotplug = _wait_for_hotplug(monitor, _next_interval())
+        if recheck():
+            log.debug("License re-verified", extra={'hotplug': hotplug, 'cpu_ms': round(stats['cpu_ms'], 3),
+                                                    'checks': stats['checks']})
+            continue
+        log.warning(f"Hardware no longer matches the license, re-checking in {CONFIRM_DELAY}s")
+        time.sleep(CONFIRM_DELAY)
+        if not recheck():
+            enforce_failure()
+        log.info("License matches again")
+
+
+def _check(reverify):
+    global result
+    result = verify_license()
+    if not result:
+        enforce_failure()
+    log.info("License verified")
+    if reverify:
+        _reverify_loop()
+
+
+def start(reverify=True):
+    """
+    Verify in the background (idempotent); a mismatch shuts the machine
+    down from that thread.
+
+    Args:
+        reverify: Keep re-checking after the first verification
+
+    Returns:
+        threading.Thread: The verification thread
+    """
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_check, args=(reverify,), name="license-check", daemon=True)
+            _thread.start()
+        return _thread
+
+
+if __name__ == "__main__":
+    # Time a cold and a cached verification, then the cost of re-verifying (run as root)
+    import resource
+
+    clear_cache()
+    for label in ("fingerprint", "cached"):
+        started = time.perf_counter()
+        valid = verify_license()
+        print(f"  {label:12} {(time.perf_counter() - started) * 1000:8.2f} ms  valid={valid}")
+
+    runs = 1000
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    for _ in range(runs):
+        recheck()
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    per_check = stats['cpu_ms'] / runs
+    rusage_ms = ((usage_after.ru_utime - usage_before.ru_utime) +
+                 (usage_after.ru_stime - usage_before.ru_stime)) * 1000 / runs
+    per_day = per_check * 86400 / REVERIFY_INTERVAL
+    print(f"  recheck      {per_check:8.3f} ms CPU (thread_time), {rusage_ms:.3f} ms (getrusage)")
+    print(f"  at one check per {REVERIFY_INTERVAL}s: {per_day:.2f} ms CPU per day, plus hotplug checks")
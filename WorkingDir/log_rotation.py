@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Log rotation for the captive portal's /tmp logs
+/tmp is tmpfs on the kiosks, so every byte of log is RAM. The launcher runs
+a LogRotator that rotates by size and age, gzips rotated segments in the
+background and keeps the total under a memory budget.
+"""
+
+import argparse
+import glob
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+
+import portal_logging
+
+log = portal_logging.get_logger("logrotate")
+
+# Logs owned by the launcher (name -> path)
+MANAGED_LOGS = {
+    'portal-server': '/tmp/portal-server.log',
+    'dnsmasq': '/tmp/dnsmasq.log',
+    'hostapd': '/tmp/hostapd.log',
+}
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024       # rotate a live log beyond this size
+DEFAULT_MAX_AGE = 24 * 3600               # ... or when it is older than this
+DEFAULT_BUDGET_BYTES = 32 * 1024 * 1024   # live logs + all segments
+CHECK_INTERVAL = 30                       # seconds between checks
+
+
+def _segment_paths(path):
+    """Rotated segments of `path`, oldest first (timestamps sort lexically)"""
+    return sorted(glob.glob(glob.escape(path) + '.*'))
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class LogRotator:
+    """
+    Size/age based copy-truncate rotation with background compression.
+
+    Copy-truncate is used because hostapd, dnsmasq and our own log writer
+    all keep their log file open in O_APPEND mode; after truncation they
+    simply continue writing at offset 0.
+    """
+
+    def __init__(self, paths=None, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE,
+                 budget_bytes=DEFAULT_BUDGET_BYTES, interval=CHECK_INTERVAL):
+        self.paths = list(paths or MANAGED_LOGS.values())
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.budget_bytes = budget_bytes
+        self.interval = interval
+
+        self._last_rotation = {path: time.time() for path in self.paths}
+        self._compress_queue = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start the check loop and the compression worker"""
+        for target, name in ((self._check_loop, "logrotate-check"),
+                             (self._compress_loop, "logrotate-gzip")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        log.info("Log rotation started", extra={'logs': self.paths,
+                                                 'budget_bytes': self.budget_bytes})
+
+    def stop(self):
+        self._stop.set()
+        self._compress_queue.put(None)
+
+    # ------------------------
+    # Rotation
+    # ------------------------
+
+    def check_once(self):
+        """Rotate logs over their size/age limit, then enforce the budget"""
+        now = time.time()
+        for path in self.paths:
+            size = _size(path)
+            if size == 0:
+                continue
+            if size >= self.max_bytes or now - self._last_rotation[path] >= self.max_age:
+                self.rotate(path)
+        self.enforce_budget()
+
+    def rotate(self, path):
+        """
+        Copy the live log to a timestamped segment and truncate it.
+
+        Returns:
+            str: Segment path, or None if nothing was rotated
+        """
+        now = time.time()
+        segment = f"{path}.{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}"
+        try:
+            with open(path, 'rb') as src, open(segment, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+                # Pick up lines appended while copying, then truncate right away
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.truncate(path, 0)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            log.error(f"Rotation failed for {path}: {e}")
+            return None
+
+        self._last_rotation[path] = time.time()
+        self._compress_queue.put(segment)
+        return segment
+
+    def enforce_budget(self):
+        """Delete the oldest segments until live logs + segments fit the budget"""
+        segments = []
+        total = 0
+        for path in self.paths:
+            total += _size(path)
+            for segment in _segment_paths(path):
+                try:
+                    stat = os.stat(segment)
+                except OSError:
+                    continue
+                total += stat.st_size
+                segments.append((stat.st_mtime, segment, stat.st_size))
+
+        segments.sort()
+        while total > self.budget_bytes and segments:
+            _, segment, size = segments.pop(0)
+            if not segment.endswith('.gz'):
+                continue  # still waiting for compression
+            try:
+                os.remove(segment)
+                total -= size
+            except OSError:
+                pass
+
+        if total > self.budget_bytes:
+            # Segments alone cannot make room: a live log has outgrown the budget
+            for path in self.paths:
+                if _size(path) > self.budget_bytes // (2 * len(self.paths)):
+                    self.rotate(path)
+        return total
+
+    # ------------------------
+    # Background threads
+    # ------------------------
+
+    def _check_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check_once()
+            except Exception as e:
+                log.error(f"Log rotation check failed: {e}")
+
+    def _compress_loop(self):
+        while True:
+            segment = self._compress_queue.get()
+            if segment is None:
+                return
+            try:
+                with open(segment, 'rb') as src, gzip.open(segment + '.gz', 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.remove(segment)
+            except OSError as e:
+                log.error(f"Compression failed for {segment}: {e}")
+
+
+# ========================
+# Tail API
+# ========================
+
+def tail(path, lines=50, block_size=8192):
+    """
+    Return the last `lines` lines of a live log without reading the whole file.
+
+    Args:
+        path: Log path, or a MANAGED_LOGS name such as "dnsmasq"
+        lines: Number of lines to return
+
+    Returns:
+        list: Lines (str, without newlines), oldest first
+    """
+    path = MANAGED_LOGS.get(path, path)
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            data = b''
+            while position > 0 and data.count(b'\n') <= lines:
+                step = min(block_size, position)
+                position -= step
+                f.seek(position)
+                data = f.read(step) + data
+    except FileNotFoundError:
+        return []
+
+    result = data.decode('utf-8', errors='replace').splitlines()
+    return result[-lines:] if lines else []
+
+
+def usage():
+    """
+    Bytes used per managed log.
+
+    Returns:
+        dict: name -> {'live': bytes, 'segments': bytes, 'segment_count': n}
+    """
+    report = {}
+    for name, path in MANAGED_LOGS.items():
+        segments = _segment_paths(path)
+        report[name] = {
+            'live': _size(path),
+            'segments': sum(_size(s) for s in segments),
+            'segment_count': len(segments),
+        }
+    return report
+
+
+def get_rotation_settings(config):
+    """Build LogRotator keyword arguments from config.sh values"""
+    def number(key, default):
+        try:
+            return float(config.get(key) or default)
+        except ValueError:
+            return default
+
+    return {
+        'max_bytes': int(number('LOG_MAX_KB', DEFAULT_MAX_BYTES / 1024) * 1024),
+        'max_age': number('LOG_MAX_AGE_HOURS', DEFAULT_MAX_AGE / 3600) * 3600,
+        'budget_bytes': int(number('LOG_BUDGET_MB', DEFAULT_BUDGET_BYTES / 1048576) * 1048576),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect the captive portal logs in /tmp')
+    sub = parser.add_subparsers(dest='command', required=True)
+    tail_parser = sub.add_parser('tail', help='Print the last lines of a log')
+    tail_parser.add_argument('name', help=f"One of {', '.join(MANAGED_LOGS)} or a path")
+    tail_parser.add_argument('-n', '--lines', type=int, default=50)
+    sub.add_parser('usage', help='Show memory used by each log')
+    sub.add_parser('rotate', help='Rotate all logs now')
+    args = parser.parse_args()
+
+    if args.command == 'tail':
+        for line in tail(args.name, args.lines):
+            print(line)
+    elif args.command == 'usage':
+        for name, info in usage().items():
+            print(f"  {name:14} live {info['live']:>10} B   "
+                  f"segments {info['segments']:>10} B ({info['segment_count']})")
+    elif args.command == 'rotate':
+        rotator = LogRotator()
+        for path in rotator.paths:
+            if _size(path):
+                rotator.rotate(path)
+        rotator.stop()
+        rotator._compress_loop()  # drain the queued segments in this thread
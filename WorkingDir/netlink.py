@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Minimal rtnetlink client for interface setup
+Brings links up/down, flushes and adds addresses over one NETLINK_ROUTE
+socket instead of forking an `ip` process per step, and waits for link
+events instead of polling. Falls back to the `ip` command when netlink is
+not usable (e.g. blocked by a seccomp profile).
+"""
+
+import errno
+import ipaddress
+import select
+import socket
+import struct
+import subprocess
+import time
+
+import portal_logging
+
+log = portal_logging.get_logger("netlink")
+
+# linux/netlink.h, linux/rtnetlink.h, linux/if_link.h, linux/if_addr.h
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_ACK = 0x4
+NLM_F_REPLACE = 0x100
+NLM_F_DUMP = 0x300
+NLM_F_CREATE = 0x400
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+
+RTMGRP_LINK = 0x1
+
+IFLA_IFNAME = 3
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+
+_NLMSGHDR = struct.Struct("=LHHLL")    # len, type, flags, seq, pid
+_IFINFOMSG = struct.Struct("=BxHiII")  # family, type, index, flags, change
+_IFADDRMSG = struct.Struct("=BBBBi")   # family, prefixlen, flags, scope, index
+_RTATTR = struct.Struct("=HH")         # len, type
+
+RECV_SIZE = 65536
+
+
+class NetlinkError(OSError):
+    """The kernel rejected a request (errno set) or netlink is unavailable"""
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _attr(attr_type, data):
+    payload = _RTATTR.pack(_RTATTR.size + len(data), attr_type) + data
+    return payload + b'\0' * (_align(len(payload)) - len(payload))
+
+
+def _parse_attrs(data):
+    attrs = {}
+    offset = 0
+    while offset + _RTATTR.size <= len(data):
+        length, attr_type = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[attr_type] = data[offset + _RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _parse_link(msg_type, payload):
+    """RTM_NEWLINK/RTM_DELLINK payload -> link dict"""
+    _, _, index, flags, _ = _IFINFOMSG.unpack_from(payload)
+    name = _parse_attrs(payload[_IFINFOMSG.size:]).get(IFLA_IFNAME, b'').rstrip(b'\0').decode()
+    return {
+        'index': index,
+        'name': name,
+        'present': msg_type != RTM_DELLINK,
+        'up': bool(flags & IFF_UP),
+        'carrier': bool(flags & IFF_LOWER_UP),
+    }
+
+
+class Netlink:
+    """
+    One NETLINK_ROUTE socket.
+
+    Args:
+        groups: Multicast groups to subscribe to (e.g. RTMGRP_LINK for
+                link events, read with events())
+    """
+
+    def __init__(self, groups=0):
+        try:
+            self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            self._sock.bind((0, groups))
+        except (AttributeError, OSError) as e:
+            raise NetlinkError(getattr(e, 'errno', errno.EAFNOSUPPORT), f"netlink unavailable: {e}")
+        self._seq = int(time.time())
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    # ------------------------
+    # Request/response
+    # ------------------------
+
+    def _request(self, msg_type, flags, payload):
+        """
+        Send one request and collect the reply.
+
+        Returns:
+            list: (msg_type, payload) of the reply messages (dumps)
+
+        Raises:
+            NetlinkError: with the kernel's errno on failure
+        """
+        self._seq += 1
+        seq = self._seq
+        header = _NLMSGHDR.pack(_NLMSGHDR.size + len(payload), msg_type,
+                                flags | NLM_F_REQUEST | NLM_F_ACK, seq, 0)
+        self._sock.send(header + payload)
+
+        replies = []
+        while True:
+            data = self._sock.recv(RECV_SIZE)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, reply_type, reply_flags, reply_seq, _ = _NLMSGHDR.unpack_from(data, offset)
+                body = data[offset + _NLMSGHDR.size:offset + length]
+                offset += _align(length)
+                if reply_seq != seq:
+                    continue  # multicast event or a stale reply
+                if reply_type == NLMSG_ERROR:
+                    code = -struct.unpack_from("=i", body)[0]
+                    if code:
+                        raise NetlinkError(code, f"{errno.errorcode.get(code, code)}: {msg_type=}")
+                    return replies
+                if reply_type == NLMSG_DONE:
+                    return replies
+                replies.append((reply_type, body))
+                if not reply_flags & NLM_F_MULTI and not flags & NLM_F_DUMP:
+                    return replies
+
+    # ------------------------
+    # Links
+    # ------------------------
+
+    def link(self, iface):
+        """
+        Returns:
+            dict: index, name, up, carrier (None if the interface does not exist)
+        """
+        try:
+            index = socket.if_nametoindex(iface)
+            replies = self._request(RTM_GETLINK, 0, _IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, 0, 0))
+        except OSError:
+            return None
+        for msg_type, body in replies:
+            if msg_type == RTM_NEWLINK:
+                return _parse_link(msg_type, body)
+        return None
+
+    def set_link(self, iface, up):
+        """Set the administrative state of `iface` (like `ip link set up/down`)"""
+        index = socket.if_nametoindex(iface)
+        flags = IFF_UP if up else 0
+        self._request(RTM_NEWLINK, 0, _IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, flags, IFF_UP))
+
+    # ------------------------
+    # Addresses
+    # ------------------------
+
+    def addresses(self, iface):
+        """
+        Returns:
+            list: ifaddrmsg payloads (header + attributes) of the addresses on `iface`
+        """
+        index = socket.if_nametoindex(iface)
+        replies = self._request(RTM_GETADDR, NLM_F_DUMP, _IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0))
+        return [body for msg_type, body in replies
+                if msg_type == RTM_NEWADDR and _IFADDRMSG.unpack_from(body)[4] == index]
+
+    def flush_addresses(self, iface):
+        """Remove every address from `iface` (like `ip addr flush dev`)"""
+        removed = 0
+        for body in self.addresses(iface):
+            try:
+                self._request(RTM_DELADDR, 0, body)
+                removed += 1
+            except NetlinkError as e:
+                if e.errno != errno.EADDRNOTAVAIL:  # already gone (e.g. IPv6 on link down)
+                    raise
+        return removed
+
+    def add_address(self, iface, cidr):
+        """Add (or replace) `cidr`, e.g. "192.168.4.1/24", on `iface`"""
+        interface = ipaddress.ip_interface(cidr)
+        family = socket.AF_INET if interface.version == 4 else socket.AF_INET6
+        packed = interface.ip.packed
+        payload = (_IFADDRMSG.pack(family, interface.network.prefixlen, 0, 0, socket.if_nametoindex(iface))
+                   + _attr(IFA_LOCAL, packed) + _attr(IFA_ADDRESS, packed))
+        self._request(RTM_NEWADDR, NLM_F_CREATE | NLM_F_REPLACE, payload)
+
+    # ------------------------
+    # Events
+    # ------------------------
+
+    def events(self, timeout):
+        """
+        Link events received within `timeout` seconds (requires the
+        RTMGRP_LINK group). Yields link dicts as they arrive.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            readable, _, _ = select.select([self._sock], [], [], remaining)
+            if not readable:
+                return
+            data = self._sock.recv(RECV_SIZE)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, msg_type, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+                if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+                    yield _parse_link(msg_type, data[offset + _NLMSGHDR.size:offset + length])
+                offset += _align(length)
+
+
+# ========================
+# Interface operations (netlink first, `ip` as fallback)
+# ========================
+
+def _ip(*args):
+    result = subprocess.run(["ip", *args], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        log.warning(f"ip {' '.join(args)} failed: {result.stderr.strip()}")
+    return result.returncode == 0
+
+
+def _timed(action, iface, netlink_steps, ip_steps):
+    """Run the steps over one netlink socket, or as `ip` commands if netlink is unavailable"""
+    started = time.perf_counter()
+    try:
+        nl = Netlink()
+    except NetlinkError as e:
+        log.warning(f"{e}, using ip for {action} on {iface}")
+        method = 'ip'
+        ok = all([_ip(*args) for args in ip_steps])
+    else:
+        method = 'netlink'
+        ok = True
+        with nl:
+            try:
+                for step in netlink_steps:
+                    step(nl)
+            except OSError as e:
+                log.error(f"Interface {action} on {iface} failed: {e}")
+                ok = False
+    elapsed = round((time.perf_counter() - started) * 1000, 2)
+    log.info(f"Interface {action}", extra={'iface': iface, 'method': method, 'ms': elapsed})
+    return {'ok': ok, 'method': method, 'ms': elapsed}
+
+
+def configure(iface, cidr):
+    """
+    Give `iface` exactly the address `cidr` and bring it up
+    (down, flush, add, up) in one netlink session.
+
+    Returns:
+        dict: 'ok', 'method' ('netlink' or 'ip') and 'ms'
+    """
+    return _timed("configure", iface, [
+        lambda nl: nl.set_link(iface, False),
+        lambda nl: nl.flush_addresses(iface),
+        lambda nl: nl.add_address(iface, cidr),
+        lambda nl: nl.set_link(iface, True),
+    ], [
+        ("link", "set", iface, "down"),
+        ("addr", "flush", "dev", iface),
+        ("addr", "add", cidr, "dev", iface),
+        ("link", "set", iface, "up"),
+    ])
+
+
+def reset(iface):
+    """Remove all addresses from `iface` and take it down"""
+    return _timed("reset", iface, [
+        lambda nl: nl.flush_addresses(iface),
+        lambda nl: nl.set_link(iface, False),
+    ], [
+        ("addr", "flush", "dev", iface),
+        ("link", "set", iface, "down"),
+    ])
+
+
+def wait_link(iface, timeout, up=False):
+    """
+    Wait until `iface` exists (and is up, if `up`), woken by link events.
+
+    Returns:
+        bool: True if the condition was met within `timeout` seconds
+    """
+    def satisfied(link):
+        return link is not None and link['present'] and (link['up'] or not up)
+
+    try:
+        with Netlink(groups=RTMGRP_LINK) as monitor:
+            # Subscribed before the first check, so no event can be missed in between
+            if satisfied(monitor.link(iface)):
+                return True
+            for link in monitor.events(timeout):
+                if link['name'] == iface and satisfied(link):
+                    return True
+            return False
+    except NetlinkError as e:
+        log.warning(f"netlink unavailable, polling for {iface}: {e}")
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with open(f"/sys/class/net/{iface}/flags") as f:
+                    if int(f.read(), 16) & IFF_UP or not up:
+                        return True
+            except OSError:
+                pass
+            time.sleep(0.1)
+        return False
+
+
+if __name__ == "__main__":
+    # Timing comparison on a scratch interface (default ifb0; needs root).
+    # NOTE: removes the interface's addresses and leaves it down.
+    import statistics
+    import sys
+
+    iface = sys.argv[1] if len(sys.argv) > 1 else "ifb0"
+    cidr = "192.168.254.1/24"
+
+    def timed(fn, rounds=10):
+        samples = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    def ip_configure():
+        for cmd in (f"ip link set {iface} down", f"ip addr flush dev {iface}",
+                    f"ip addr add {cidr} dev {iface}", f"ip link set {iface} up"):
+            subprocess.run(cmd, shell=True)
+
+    with Netlink() as nl:
+        if nl.link(iface) is None:
+            raise SystemExit(f"No interface {iface}")
+
+    print(f"Configuring {iface} with {cidr} (median of 10):")
+    print(f"  ip commands (4 shells):  {timed(ip_configure):7.2f} ms")
+    print(f"  netlink configure():     {timed(lambda: configure(iface, cidr)):7.2f} ms")
+    print(f"  netlink reset():         {timed(lambda: reset(iface)):7.2f} ms")
+    configure(iface, cidr)
+    print(subprocess.run(["ip", "-br", "addr", "show", iface], stdout=subprocess.PIPE, text=True).stdout.strip())
+    print(f"  wait_link(up) on an up link: {timed(lambda: wait_link(iface, 1, up=True)):5.2f} ms")
+    reset(iface)
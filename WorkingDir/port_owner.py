@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Port ownership lookup from /proc
+Finds the process listening on a port by reading the socket inode from
+/proc/net/tcp{,6} and then looking for that inode among /proc/<pid>/fd,
+instead of asking psutil for every connection of every process.
+"""
+
+import os
+import socket
+
+TCP_LISTEN = '0A'
+WILDCARD_ADDRESSES = {'0.0.0.0', '::'}
+
+
+def decode_address(hex_address):
+    """Decode a /proc/net address ("0104A8C0" or a 32-digit IPv6 one)"""
+    raw = bytes.fromhex(hex_address)
+    if len(raw) == 4:
+        return socket.inet_ntop(socket.AF_INET, raw[::-1])
+    words = b''.join(raw[i:i + 4][::-1] for i in range(0, 16, 4))
+    return socket.inet_ntop(socket.AF_INET6, words)
+
+
+def read_sockets(protocol):
+    """
+    Sockets in /proc/net/<protocol> and /proc/net/<protocol>6.
+
+    Args:
+        protocol: 'tcp' or 'udp'
+
+    Yields:
+        tuple: (local_ip_hex, local_port, state_hex, inode)
+    """
+    for path in (f"/proc/net/{protocol}", f"/proc/net/{protocol}6"):
+        try:
+            with open(path) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    local_ip, local_port = fields[1].rsplit(':', 1)
+                    yield local_ip, int(local_port, 16), fields[3], int(fields[9])
+        except (OSError, StopIteration):
+            continue
+
+
+def listening_inodes(port, address=None):
+    """
+    Inodes of TCP sockets listening on `port`.
+
+    Args:
+        port: TCP port
+        address: Only sockets bound to this IP (or the wildcard)
+
+    Returns:
+        set: Socket inode numbers
+    """
+    inodes = set()
+    for local_ip, local_port, state, inode in read_sockets('tcp'):
+        if local_port != port or state != TCP_LISTEN or inode == 0:
+            continue
+        if address is not None:
+            bound_ip = decode_address(local_ip)
+            if bound_ip != address and bound_ip not in WILDCARD_ADDRESSES:
+                continue
+        inodes.add(inode)
+    return inodes
+
+
+def _process_info(pid):
+    try:
+        with open(f"/proc/{pid}/comm") as f:
+            name = f.read().strip()
+        with open(f"/proc/{pid}/cmdline", 'rb') as f:
+            cmdline = f.read().replace(b'\0', b' ').decode(errors='replace').strip()
+    except OSError:
+        name, cmdline = '?', ''
+    return {'pid': pid, 'name': name, 'cmdline': cmdline}
+
+
+def find_owners(port, address=None):
+    """
+    Processes holding a listening socket on `port`.
+
+    The fd scan stops as soon as every listening socket has an owner. A
+    socket shared by forked children may then be reported for one of
+    them only; callers that kill owners simply look again afterwards.
+
+    Returns:
+        list: {'pid', 'name', 'cmdline'} dicts
+    """
+    wanted = {f"socket:[{inode}]" for inode in listening_inodes(port, address)}
+    if not wanted:
+        return []
+
+    owners = []
+    me = os.getpid()
+    for entry in os.scandir('/proc'):
+        if not entry.name.isdigit():
+            continue
+        pid = int(entry.name)
+        fd_dir = f"/proc/{pid}/fd"
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:  # exited, or not ours to inspect
+            continue
+        found = set()
+        for fd in fds:
+            try:
+                target = os.readlink(f"{fd_dir}/{fd}")
+            except OSError:
+                continue
+            if target in wanted:
+                found.add(target)
+        if found:
+            if pid != me:
+                owners.append(_process_info(pid))
+            wanted -= found
+            if not wanted:
+                break
+    return owners
+
+
+if __name__ == "__main__":
+    # Microbenchmark against the psutil scan the launcher used before
+    import statistics
+    import time
+
+    import psutil
+
+    def psutil_owners(port):
+        processes = []
+        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+            try:
+                for conn in proc.connections(kind='inet'):
+                    if conn.status == 'LISTEN' and conn.laddr.port == port:
+                        processes.append(proc.info['pid'])
+                        break
+            except (psutil.NoSuchProcess, psutil.AccessDenied, AttributeError):
+                continue
+        return processes
+
+    def measure(fn, rounds=20):
+        samples = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    # A child process listens so the owner is not this process
+    import subprocess
+    import sys
+    child = subprocess.Popen([sys.executable, "-c",
+                              "import socket, time; s = socket.socket(); "
+                              "s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1); "
+                              "s.bind(('127.0.0.1', 8767)); s.listen(); print('ok', flush=True); time.sleep(60)"],
+                             stdout=subprocess.PIPE)
+    child.stdout.readline()
+    try:
+        print(f"Processes: {len(psutil.pids())}, owner of :8767 = {find_owners(8767)}")
+        print(f"  psutil connections scan: {measure(lambda: psutil_owners(8767)):8.2f} ms")
+        print(f"  /proc inode lookup:      {measure(lambda: find_owners(8767)):8.2f} ms")
+        print(f"  free port (no fd scan):  {measure(lambda: find_owners(8768)):8.3f} ms")
+    finally:
+        child.kill()
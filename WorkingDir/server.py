@@ -6,16 +6,28 @@ for gaming kiosk operations (money loading, balance management, etc.)
 """
 
 from flask import Flask, jsonify, request, send_file, redirect
-import mysql.connector
-import psutil
-import subprocess
 import sys
+import json
 import os
 from datetime import datetime
-import re
-import hashlib
+import threading
+import time
 import server_display  # Server-side on-screen notifications
 import config_loader    # Load configuration from config.sh
+import db_backend       # MySQL or SQLite stand-in connections
+import portal_logging   # Queue-backed structured logging
+import ws_control       # WebSocket control channel
+import game_browser     # Game browser process tracking
+import jobs             # Background worker pool for slow side effects
+import supervisor       # Service states (hostapd, dnsmasq, http)
+import config_watch     # Live reload of config.sh
+import license_check    # Hardware license (background, cached per boot)
+import client_registry  # DHCP lease index (IP -> MAC/hostname)
+import hostapd_events   # Station connect/disconnect from hostapd
+import client_access    # ipset allowlist of released clients
+import traffic_accounting  # Per-client byte/packet counters
+
+log = portal_logging.get_logger("server")
 
 def get_resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -32,124 +44,170 @@ def get_executable_dir():
         return os.path.dirname(sys.executable)
     return os.path.dirname(os.path.abspath(__file__))
 
-# ========================
-# Security Verification
-# ========================
-SALT = "your-product-name-v1"
-LICENSE_FILE = "/home/hp/dlI"  # Fixed absolute path
-
-def run_cmd(cmd):
-    try:
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True
-        )
-        return result.stdout.strip()
-    except Exception:
-        return ""
-
-def get_macs():
-    try:
-        result = subprocess.run(
-            ["ip", "link"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True
-        )
-        return sorted(re.findall(r"link/ether ([0-9a-f:]{17})", result.stdout))
-    except Exception:
-        return []
-
-def calculate_hardware_hash():
-    values = []
-    # Collect same hardware identifiers as secgen.py
-    system_uuid = run_cmd(["dmidecode", "-s", "system-uuid"])
-    baseboard_serial = run_cmd(["dmidecode", "-s", "baseboard-serial-number"])
-    product_uuid = run_cmd(["cat", "/sys/class/dmi/id/product_uuid"])
-    macs = get_macs()
-
-    for v in [system_uuid, baseboard_serial, product_uuid]:
-        if v:
-            values.append(v.strip())
-    values.extend(macs)
-
-    raw = "|".join(values)
-    return hashlib.sha256((SALT + "|" + raw).encode()).hexdigest()
-
-def verify_license():
-    # Only verify if we are running as root (needed for dmidecode)
-    # If not root, we might be in dev mode or unable to verify, skip or fail based on policy
-    # But user asked for check.
-    if os.geteuid() != 0:
-        for i in range(100):
-            print("Warning: Not running as root, cannot verify hardware license.")
-            a=5 #ensure prints to be shown
-        # For now, we might let it pass or fail. 
-        # But 'dmidecode' needs root. Let's assume we must be root.
-        pass
-
-    try:
-        # Look for license file in the fixed absolute directory
-        license_path = LICENSE_FILE
-        
-        if not os.path.exists(license_path):
-             return False
-             
-        with open(license_path, "r") as f:
-            stored_hash = f.read().strip()
-            
-        current_hash = calculate_hardware_hash()
-        print(current_hash)
-        print(stored_hash)  
-        return current_hash == stored_hash
-    except Exception as e:
-        print(f"Verification error: {e}")
-        return False
-
-def init_server():
-    """Initialize server components (License, Display, Config)"""
-    # 1. Verify License
-    if not verify_license():
-        print("\n" + "!"*40)
-        print("arakci ayip sana")
-        print("License verification failed - Shutting down system")
-        print("!"*40 + "\n")
-        
-        try:
-            subprocess.run(["shutdown", "-h", "now"], check=False)
-        except Exception as e:
-            print(f"Shutdown command failed: {e}")
-        sys.exit(1)
+def init_server(config=None):
+    """
+    Initialize server components (Config, License, Display)
+    
+    Args:
+        config: Already loaded config dict (loaded from config.sh if None)
+    """
+    # 0. Settings from config.sh
+    load_settings(config)
+    
+    # 1. Verify the license in the background and keep re-checking it
+    #    (a mismatch shuts the machine down)
+    license_check.start()
 
     # 2. Initialize Display
-    print("Initializing server display...")
+    log.info("Initializing server display...")
     server_display.init_display()
     
-    # 3. Log resource paths
-    print(f"Portal page location: {PORTAL_PAGE}")
+    # 3. Push balance/music changes to connected phones
+    ws_control.hub.start_poller(current_state)
+
+    # 4. Preload the game in a hidden browser (GAME_WARM_STANDBY)
+    GAME_BROWSER.start_standby()
+
+    # 5. Apply config.sh edits while running
+    config_watch.watcher.add_listener(apply_live_config)
+    config_watch.watcher.start(CONFIG)
+
+    # 6. Follow the DHCP leases (which phone is which IP)
+    client_registry.registry.start()
+
+    # 7. Drop a phone's server state as soon as it leaves the hotspot
+    hostapd_events.monitor.add_evictor(evict_client)
+    hostapd_events.monitor.start()
+
+    # 8. Sample per-client traffic counters for /api/metrics
+    traffic_accounting.meter.start()
+
+    # 9. Log resource paths
+    log.info(f"Portal page location: {PORTAL_PAGE}")
     if not os.path.exists(PORTAL_PAGE):
-        print(f"WARNING: Portal page NOT FOUND at {PORTAL_PAGE}")
+        log.warning(f"Portal page NOT FOUND at {PORTAL_PAGE}")
 
 app = Flask(__name__)
 
-# Load configuration from config.sh
-print("Loading configuration from config.sh...")
-CONFIG = config_loader.load_config()
+def apply_log_settings(settings):
+    """Set the log level and warning rate limit (startup and live reload)"""
+    portal_logging.set_level(settings['level'])
+    portal_logging.rate_limiter.configure(window=settings['rate_window'], burst=settings['rate_burst'])
 
 # Configuration
 PORTAL_PAGE = get_resource_path("portal.html")
 
-# MySQL Configuration (loaded from config.sh)
-MYSQL_CONFIG = config_loader.get_mysql_config(CONFIG)
-USER_ID = config_loader.get_user_id(CONFIG)
-SHOP_ID = config_loader.get_shop_id(CONFIG)
+# Settings from config.sh, filled in by load_settings() (not at import, so
+# importing this module stays cheap and has no side effects)
+CONFIG = None
+MYSQL_CONFIG = None
+USER_ID = None
+SHOP_ID = None
+ACCOUNT = None  # (USER_ID, SHOP_ID), read once per transaction so a live reload never mixes accounts
+DB_SETTINGS = None
+DB_POOL = None
+CONFIG_LOCK = threading.Lock()  # Serializes loading and live config changes
 
 # Gaming Configuration
 GAME_URL = "https://fungames.com/specauth/293?token=4wA52wvxGjmwtOfvQ29F2T4RJT5P65iiFMIfc4Qg8WwRqbp10wNL5W2y5ezS4dBq"
+GAME_BROWSER = None
+
+def make_db_pool(db_settings, mysql_config):
+    """Connection pool for the given backend/credentials"""
+    return db_backend.ConnectionPool(lambda: db_backend.connect(db_settings, mysql_config),
+                                     size=db_settings['pool_size'])
+
+def load_settings(config=None):
+    """
+    Load config.sh and set up everything that depends on it (idempotent).
+    
+    Called by init_server(), and by the first request if the app is run
+    without it (development).
+    
+    Args:
+        config: Already loaded config dict (e.g. the launcher's)
+    """
+    global CONFIG, MYSQL_CONFIG, USER_ID, SHOP_ID, ACCOUNT, DB_SETTINGS, DB_POOL, GAME_BROWSER
+    with CONFIG_LOCK:
+        if CONFIG is not None:
+            return
+        if config is None:
+            log.info("Loading configuration from config.sh...")
+            config = config_loader.load_config()
+        apply_log_settings(config_loader.get_log_settings(config))
+        
+        # MySQL Configuration (loaded from config.sh)
+        MYSQL_CONFIG = config_loader.get_mysql_config(config)
+        USER_ID = config_loader.get_user_id(config)
+        SHOP_ID = config_loader.get_shop_id(config)
+        ACCOUNT = (USER_ID, SHOP_ID)
+        DB_SETTINGS = config_loader.get_db_settings(config)
+        DB_POOL = make_db_pool(DB_SETTINGS, MYSQL_CONFIG)
+        GAME_BROWSER = game_browser.GameBrowser(GAME_URL, **config_loader.get_game_settings(config))
+        CONFIG = config
+
+# ========================
+# Live Configuration
+# ========================
+
+def apply_live_config(old, new, changed):
+    """
+    Apply a config.sh change without restarting (config_watch listener).
+    
+    Everything is validated first and then swapped in one step: a bad value
+    leaves the running settings untouched. A changed database setting gets
+    a new pool; connections borrowed from the old one stay usable until
+    their request returns them. Keys in config_loader.RESTART_KEYS are left
+    to the launcher.
+    """
+    global CONFIG, MYSQL_CONFIG, USER_ID, SHOP_ID, ACCOUNT, DB_SETTINGS, DB_POOL
+    try:
+        mysql_config = config_loader.get_mysql_config(new)
+        db_settings = config_loader.get_db_settings(new)
+        log_settings = config_loader.get_log_settings(new)
+    except ValueError as e:
+        log.error(f"Invalid value in config.sh, keeping current settings: {e}")
+        return
+    
+    connection_keys = ('backend', 'sqlite_path', 'pool_size')
+    db_changed = (mysql_config != MYSQL_CONFIG or
+                  any(db_settings[key] != DB_SETTINGS[key] for key in connection_keys))
+    account_changed = (db_settings['user_id'], db_settings['shop_id']) != ACCOUNT
+    
+    old_pool = None
+    with CONFIG_LOCK:
+        if db_changed:
+            old_pool, DB_POOL = DB_POOL, make_db_pool(db_settings, mysql_config)
+        MYSQL_CONFIG = mysql_config
+        DB_SETTINGS = db_settings
+        USER_ID, SHOP_ID = db_settings['user_id'], db_settings['shop_id']
+        ACCOUNT = (USER_ID, SHOP_ID)
+        CONFIG = new
+    apply_log_settings(log_settings)
+    
+    if old_pool is not None:
+        old_pool.close()  # idle connections now, borrowed ones when returned
+    if db_changed or account_changed:
+        refresh_balance_async()  # push the (possibly different) balance to the phones
+    
+    log.info("Applied config change live", extra={'keys': sorted(changed - config_loader.RESTART_KEYS),
+                                                  'db_pool_replaced': db_changed,
+                                                  'account_changed': account_changed})
+
+
+def evict_client(mac, ip):
+    """A station left the hotspot: drop everything the server holds for it"""
+    if ip is None:
+        return
+    closed = ws_control.hub.disconnect_ip(ip)
+    # An IP release would pass to whoever gets this address next (MAC releases stay)
+    try:
+        revoked = client_access.expire(ip=ip)
+    except client_access.ClientAccessError as e:
+        log.error(f"Could not revoke release of {ip}: {e}")
+        revoked = False
+    log.info("Client state evicted", extra={'mac': mac, 'client_ip': ip, 'ws_closed': closed,
+                                            'release_revoked': revoked})
 
 def screensaver_exists() -> bool:
     """Check if the screensaver/music script exists"""
@@ -163,9 +221,11 @@ def toggle_music_logic():
     try:
         if os.path.exists(path_active):
             os.rename(path_active, path_inactive)
+            ws_control.hub.publish(music=False)
             return {'success': True, 'message': 'Müzik Kapatıldı'}
         elif os.path.exists(path_inactive):
             os.rename(path_inactive, path_active)
+            ws_control.hub.publish(music=True)
             return {'success': True, 'message': 'Müzik Açıldı'}
         else:
             return {'success': False, 'message': 'Müzik dosyası bulunamadı!'}
@@ -186,73 +246,108 @@ def manage_bak_file(balance):
             if os.path.exists(path):
                 os.remove(path)
     except Exception as e:
-        print(f"Error managing bak.txt: {e}")
+        log.error(f"Error managing bak.txt: {e}")
 
 # ========================
 # Database Functions
 # ========================
 
 def get_db_connection():
-    """Create and return a MySQL database connection"""
+    """Borrow a database connection from the pool (MySQL, or SQLite when DB_BACKEND=sqlite)"""
     try:
-        connection = mysql.connector.connect(**MYSQL_CONFIG)
-        return connection
-    except mysql.connector.Error as error:
-        print(f"Database connection error: {error}")
+        return DB_POOL.acquire()
+    except (RuntimeError, *db_backend.Error) as error:
+        log.error(f"Database connection error: {error}")
         return None
 
 
-def get_current_balance():
-    """Get current user balance from database"""
+def get_current_balance(connection=None):
+    """
+    Get current user balance from database
+    
+    Args:
+        connection: Optional shared connection (left open for the caller).
+            Its transaction may not be committed yet, so the value is only
+            returned: bak.txt and the phones are updated by the caller's
+            refresh_balance_async() once the transaction settled.
+    """
+    own_connection = connection is None
+    user_id, _ = ACCOUNT
     try:
-        connection = get_db_connection()
-        if not connection:
-            return None
+        if own_connection:
+            connection = get_db_connection()
+            if not connection:
+                return None
         
         cursor = connection.cursor()
-        cursor.execute(f"SELECT balance FROM w_users WHERE id = {USER_ID}")
+        cursor.execute(f"SELECT balance FROM w_users WHERE id = {user_id}")
         result = cursor.fetchone()
         
         balance = float(result[0]) if result else None
         
         cursor.close()
-        connection.close()
+        if own_connection:
+            connection.close()
         
-        # Manage bak.txt based on balance
-        if balance is not None:
+        # Manage bak.txt based on balance (committed values only)
+        if balance is not None and own_connection:
             manage_bak_file(balance)
+            ws_control.hub.publish(balance=balance)
             
         return balance
         
     except Exception as e:
-        print(f"Error getting balance: {e}")
+        log.error(f"Error getting balance: {e}")
         return None
+    finally:
+        if own_connection and connection:
+            connection.close()
 
 
-def para_guncelle(eklenen_miktar):
+def refresh_balance_async():
+    """
+    Re-read the balance on a worker to update bak.txt and the pushed state.
+    Refreshes share one job key, so they apply in commit order.
+    
+    Returns:
+        jobs.Job: The queued refresh (None if it had to run inline)
+    """
+    try:
+        return jobs.executor.submit('refresh_balance', get_current_balance, key='balance')
+    except jobs.QueueFullError:
+        log.warning("Job queue full, refreshing balance inline")
+        get_current_balance()
+        return None
+
+
+def para_guncelle(eklenen_miktar, connection=None):
     """
     Add money to user balance (replicated from kumanda.py)
     
     Args:
         eklenen_miktar: Amount to add to balance
+        connection: Optional shared connection (batch requests). The caller
+            then owns commit/rollback and the bak.txt refresh.
         
     Returns:
         dict: Result with success status and message
     """
+    own_connection = connection is None
+    user_id, shop_id = ACCOUNT
     try:
-        connection = get_db_connection()
-        if not connection:
-            return {'success': False, 'message': 'Veritabanı bağlantı hatası'}
+        if own_connection:
+            connection = get_db_connection()
+            if not connection:
+                return {'success': False, 'message': 'Veritabanı bağlantı hatası'}
         
         cursor = connection.cursor()
         
         # Check shop balance
-        cursor.execute(f"SELECT balance FROM w_shops WHERE id = {SHOP_ID}")
+        cursor.execute(f"SELECT balance FROM w_shops WHERE id = {shop_id}")
         shop_bakiye = cursor.fetchone()[0]
         
         if shop_bakiye < eklenen_miktar:
             cursor.close()
-            connection.close()
             server_display.show_notification("LİMİT YETERSİZ. LİMİTİ ARTIRIN.")
             return {'success': False, 'message': 'LİMİT YETERSİZ. LİMİTİ ARTIRIN.'}
         
@@ -260,11 +355,11 @@ def para_guncelle(eklenen_miktar):
         sql_query = f"""UPDATE w_users 
                        SET balance = balance + {eklenen_miktar}, 
                            count_balance = count_balance + {eklenen_miktar} 
-                       WHERE id = {USER_ID}"""
+                       WHERE id = {user_id}"""
         cursor.execute(sql_query)
         
         # Update w_shops table
-        cursor.execute(f"UPDATE w_shops SET balance = balance - {eklenen_miktar} WHERE id = {SHOP_ID}")
+        cursor.execute(f"UPDATE w_shops SET balance = balance - {eklenen_miktar} WHERE id = {shop_id}")
         
         # Get next statistic_id
         cursor.execute("SELECT MAX(statistic_id) FROM w_statistics_add")
@@ -274,60 +369,71 @@ def para_guncelle(eklenen_miktar):
         # Insert into w_statistics_add
         add_statistics_query = f"""INSERT INTO w_statistics_add 
                                   (statistic_id, credit_out, money_in, user_id, shop_id) 
-                                  VALUES ({next_statistic_id}, {eklenen_miktar}, {eklenen_miktar}, {USER_ID}, {SHOP_ID})"""
+                                  VALUES ({next_statistic_id}, {eklenen_miktar}, {eklenen_miktar}, {user_id}, {shop_id})"""
         cursor.execute(add_statistics_query)
         
         # Update w_statistics
         update_statistics_query = f"""INSERT INTO w_statistics 
                                      (sum, old, user_id, shop_id, updated_at, payeer_id, `system`) 
-                                     VALUES ({eklenen_miktar}, 0.0000, {USER_ID}, {SHOP_ID}, NOW(), 294, 'handpay') 
+                                     VALUES ({eklenen_miktar}, 0.0000, {user_id}, {shop_id}, NOW(), 294, 'handpay') 
                                      ON DUPLICATE KEY UPDATE sum = sum + {eklenen_miktar}, old = 0.0000"""
         cursor.execute(update_statistics_query)
-        
-        connection.commit()
         cursor.close()
-        connection.close()
         
-        # Immediate update for bak.txt via get_current_balance
-        get_current_balance()
+        if own_connection:
+            connection.commit()
+            connection.close()
             
-        print(f"Money loaded successfully: {eklenen_miktar} TL")
+            # Update bak.txt and the pushed balance off the request path
+            refresh_balance_async()
+            
+        log.info("Money loaded successfully", extra={'amount': eklenen_miktar})
         server_display.show_notification(f"{eklenen_miktar} TL YÜKLENDİ")
         return {'success': True, 'message': f'{eklenen_miktar} TL YÜKLENDİ', 'amount': eklenen_miktar}
         
-    except mysql.connector.Error as error:
-        print(f"Database error: {error}")
+    except db_backend.Error as error:
+        log.error(f"Database error: {error}")
         return {'success': False, 'message': f'Veritabanı hatası: {str(error)}'}
     except Exception as error:
-        print(f"Unexpected error: {error}")
+        log.error(f"Unexpected error: {error}")
         return {'success': False, 'message': f'Beklenmeyen hata: {str(error)}'}
+    finally:
+        if own_connection and connection:
+            connection.close()
 
 
-def para_sil():
+def para_sil(connection=None):
     """
     Clear user balance and return to shop (replicated from kumanda.py)
     
+    Args:
+        connection: Optional shared connection (batch requests). The caller
+            then owns commit/rollback and the bak.txt refresh.
+    
     Returns:
         dict: Result with success status and message
     """
+    own_connection = connection is None
+    user_id, shop_id = ACCOUNT
     try:
-        connection = get_db_connection()
-        if not connection:
-            return {'success': False, 'message': 'Veritabanı bağlantı hatası'}
+        if own_connection:
+            connection = get_db_connection()
+            if not connection:
+                return {'success': False, 'message': 'Veritabanı bağlantı hatası'}
         
         cursor = connection.cursor()
         
         # Get current balance
-        cursor.execute(f"SELECT balance FROM w_users WHERE id = {USER_ID}")
+        cursor.execute(f"SELECT balance FROM w_users WHERE id = {user_id}")
         user_balance = cursor.fetchone()[0]
         
         # Clear user balance
         cursor.execute(f"""UPDATE w_users 
                           SET balance = 0, count_balance = 0, count_refunds = 0 
-                          WHERE id = {USER_ID}""")
+                          WHERE id = {user_id}""")
         
         # Return to shop balance
-        cursor.execute(f"UPDATE w_shops SET balance = balance + {user_balance} WHERE id = {SHOP_ID}")
+        cursor.execute(f"UPDATE w_shops SET balance = balance + {user_balance} WHERE id = {shop_id}")
         
         # Get next statistic_id
         cursor.execute("SELECT IFNULL(MAX(statistic_id), 0) FROM w_statistics_add")
@@ -337,44 +443,55 @@ def para_sil():
         # Insert into w_statistics_add
         cursor.execute(f"""INSERT INTO w_statistics_add 
                           (statistic_id, credit_in, money_out, user_id, shop_id) 
-                          VALUES ({next_statistic_id}, {user_balance}, {user_balance}, {USER_ID}, {SHOP_ID})""")
+                          VALUES ({next_statistic_id}, {user_balance}, {user_balance}, {user_id}, {shop_id})""")
         
         # Update w_statistics
         cursor.execute(f"""INSERT INTO w_statistics 
                           (sum, old, user_id, shop_id, updated_at, payeer_id, `system`, type) 
-                          VALUES (-{user_balance}, 0.0000, {USER_ID}, {SHOP_ID}, NOW(), 294, 'handpay', 'out') 
+                          VALUES (-{user_balance}, 0.0000, {user_id}, {shop_id}, NOW(), 294, 'handpay', 'out') 
                           ON DUPLICATE KEY UPDATE sum = sum - {user_balance}, old = 0.0000""")
-        
-        connection.commit()
         cursor.close()
-        connection.close()
         
-        # Immediate removal for bak.txt
-        manage_bak_file(0)
+        if own_connection:
+            connection.commit()
+            connection.close()
+            
+            # Push the zero balance now; bak.txt is removed off the request path
+            ws_control.hub.publish(balance=0.0)
+            refresh_balance_async()
         
-        print("Balance cleared successfully")
+        log.info("Balance cleared successfully", extra={'amount': user_balance})
         server_display.show_notification("SİLİNDİ")
         return {'success': True, 'message': 'SİLİNDİ', 'cleared_amount': user_balance}
         
-    except mysql.connector.Error as error:
-        print(f"Database error: {error}")
+    except db_backend.Error as error:
+        log.error(f"Database error: {error}")
         return {'success': False, 'message': f'Veritabanı hatası: {str(error)}'}
     except Exception as error:
-        print(f"Unexpected error: {error}")
+        log.error(f"Unexpected error: {error}")
         return {'success': False, 'message': f'Beklenmeyen hata: {str(error)}'}
+    finally:
+        if own_connection and connection:
+            connection.close()
 
 
-def get_kazanc():
+def get_kazanc(connection=None):
     """
     Get earnings/profit data (replicated from kumanda.py)
     
+    Args:
+        connection: Optional shared connection (left open for the caller)
+    
     Returns:
         dict: Earnings data with shop balance and net profit
     """
+    own_connection = connection is None
+    _, shop_id = ACCOUNT
     try:
-        connection = get_db_connection()
-        if not connection:
-            return {'success': False, 'message': 'Veritabanı bağlantı hatası'}
+        if own_connection:
+            connection = get_db_connection()
+            if not connection:
+                return {'success': False, 'message': 'Veritabanı bağlantı hatası'}
         
         cursor = connection.cursor()
         
@@ -383,11 +500,10 @@ def get_kazanc():
         net_kazanc = cursor.fetchone()[0] or 0.0
         
         # Get shop balance (remaining limit)
-        cursor.execute(f"SELECT balance FROM w_shops WHERE id = {SHOP_ID}")
+        cursor.execute(f"SELECT balance FROM w_shops WHERE id = {shop_id}")
         shop_bakiye = cursor.fetchone()[0] or 0.0
         
         cursor.close()
-        connection.close()
         
         return {
             'success': True,
@@ -395,67 +511,231 @@ def get_kazanc():
             'net_kazanc': float(net_kazanc)
         }
         
-    except mysql.connector.Error as error:
-        print(f"Database error: {error}")
+    except db_backend.Error as error:
+        log.error(f"Database error: {error}")
         return {'success': False, 'message': f'Veritabanı hatası: {str(error)}'}
     except Exception as error:
-        print(f"Unexpected error: {error}")
+        log.error(f"Unexpected error: {error}")
         return {'success': False, 'message': f'Beklenmeyen hata: {str(error)}'}
+    finally:
+        if own_connection and connection:
+            connection.close()
+
+
+GAME_JOB_LOCK = threading.Lock()
+_game_job = None
 
 
 def toggle_brave():
     """
     Toggle Brave browser - open if closed, close if open (replicated from kumanda.py)
+    The browser is started/stopped by a background job; the response
+    carries its job_id (see /api/jobs/<id>).
     
     Returns:
         dict: Result with success status and action taken
     """
+    global _game_job
     try:
-        # Check if Brave is running
-        brave_found = False
-        for proc in psutil.process_iter(['name', 'cmdline']):
-            try:
-                if proc.info['name'] and 'brave' in proc.info['name'].lower():
-                    cmdline = " ".join(proc.info['cmdline']).lower()
-                    if '--start-fullscreen' in cmdline or '--new-window' in cmdline:
-                        brave_found = True
-                        break
-            except Exception:
-                pass
-        
-        if brave_found:
-            # Close Brave
-            server_display.show_notification("OYUN KAPATILIYOR...")
-            os.system("pkill -f brave")
-            print("Brave browser closed")
-            return {'success': True, 'action': 'closed', 'message': 'OYUN KAPATILIYOR...'}
-        else:
-            
-            # Open Brave
-            server_display.show_notification("İYİ EĞLENCELER...")
-            subprocess.Popen([
-                "brave-browser",
-                "--no-sandbox",
-                "--incognito",
-                "--new-window",
-                "--start-fullscreen",
-                "--ignore-certificate-errors",
-                "--allow-insecure-localhost",
-                "--test-type",
-                "--disable-features=OutdatedBuildDetector",
-        
-                GAME_URL
-            ])
+        with GAME_JOB_LOCK:
+            # One open/close at a time, or two quick presses would both "open"
+            if _game_job is not None and not _game_job.finished:
+                return {'success': False, 'message': 'LÜTFEN BEKLEYİN...', 'job_id': _game_job.id}
             
-
-            print("Brave browser opened")
-            return {'success': True, 'action': 'opened', 'message': 'İYİ EĞLENCELER...'}
+            if GAME_BROWSER.is_open():
+                # Close Brave
+                server_display.show_notification("OYUN KAPATILIYOR...")
+                _game_job = jobs.executor.submit('game_close', GAME_BROWSER.close)
+                log.info("Closing Brave browser", extra={'pid': GAME_BROWSER.pid, 'job_id': _game_job.id})
+                return {'success': True, 'action': 'closed', 'message': 'OYUN KAPATILIYOR...',
+                        'job_id': _game_job.id}
+            else:
+                # Open Brave
+                server_display.show_notification("İYİ EĞLENCELER...")
+                _game_job = jobs.executor.submit('game_open', GAME_BROWSER.open)
+                log.info("Opening Brave browser", extra={'job_id': _game_job.id})
+                return {'success': True, 'action': 'opened', 'message': 'İYİ EĞLENCELER...',
+                        'job_id': _game_job.id}
             
     except Exception as e:
-        print(f"Error toggling Brave: {e}")
+        log.error(f"Error toggling Brave: {e}")
         return {'success': False, 'message': f'Tarayıcı hatası: {str(e)}'}
 
 
+def notify_job_finished(job):
+    """Completion event: tell the phones when a game launch/close failed"""
+    if job.name.startswith('game_') and job.status == jobs.STATUS_FAILED:
+        server_display.show_notification("TARAYICI HATASI")
+        ws_control.hub.broadcast({'type': 'job', **job.to_dict(), 'message': 'Tarayıcı hatası'})
+
+
+jobs.executor.add_listener(notify_job_finished)
+
+
+def current_state():
+    """Snapshot of the state shown on the portal page"""
+    return {'balance': get_current_balance(), 'music': screensaver_exists()}
+
+
+def _load_command(params, connection=None):
+    amount = params.get('amount')
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount <= 0:
+        return {'success': False, 'message': 'Geçersiz miktar'}
+    return para_guncelle(amount, connection)
+
+
+def _balance_command(params, connection=None):
+    balance = get_current_balance(connection)
+    if balance is None:
+        return {'success': False, 'message': 'Bakiye alınamadı'}
+    return {'success': True, 'balance': balance}
+
+
+# Control commands by name (same operations as the REST routes below).
+# Each takes the command parameters and an optional shared DB connection.
+CONTROL_COMMANDS = {
+    'yukle': _load_command,
+    'sil': lambda params, connection=None: para_sil(connection),
+    'toggle_game': lambda params, connection=None: toggle_brave(),
+    'kazanc': lambda params, connection=None: get_kazanc(connection),
+    'toggle_music': lambda params, connection=None: toggle_music_logic(),
+    'music_status': lambda params, connection=None: {'success': True, 'exists': screensaver_exists()},
+    'balance': _balance_command,
+}
+
+# Commands that write to the database (committed/rolled back by run_batch)
+DB_WRITE_COMMANDS = {'yukle', 'sil'}
+
+MAX_BATCH_OPERATIONS = 20
+
+
+def run_command(op, params, connection=None):
+    """
+    Run one control command by name.
+    
+    Args:
+        op: Key of CONTROL_COMMANDS
+        params: Command parameters (e.g. {'amount': 100} for 'yukle')
+        connection: Optional shared DB connection (see run_batch)
+        
+    Returns:
+        dict: Handler result with success status
+    """
+    handler = CONTROL_COMMANDS.get(op)
+    if handler is None:
+        return {'success': False, 'message': f'Bilinmeyen komut: {op}'}
+    try:
+        return handler(params, connection)
+    except Exception as e:
+        log.error(f"Command {op} failed: {e}")
+        return {'success': False, 'message': f'Beklenmeyen hata: {str(e)}'}
+
+
+def run_batch(operations, atomic=False):
+    """
+    Run an ordered list of commands on one pooled connection.
+    
+    Args:
+        operations: List of {'op': name, ...params}
+        atomic: Run all database work in one transaction; stop at the first
+            failure and roll everything back. Browser/music toggles are not
+            transactional and are not undone.
+            
+    Returns:
+        dict: Overall success, whether the DB work was committed and the
+        per-operation results (in order)
+    """
+    connection = get_db_connection()
+    if not connection:
+        return {'success': False, 'committed': False, 'results': [],
+                'message': 'Veritabanı bağlantı hatası'}
+
+    results = []
+    failed = False
+    wrote = False
+    try:
+        for index, operation in enumerate(operations):
+            op = operation.get('op') if isinstance(operation, dict) else None
+            if failed and atomic:
+                results.append({'op': op, 'success': False, 'skipped': True})
+                continue
+
+            result = run_command(op, operation if isinstance(operation, dict) else {}, connection)
+            results.append({'op': op, **result})
+
+            if not result.get('success'):
+                failed = True
+                connection.rollback()
+            elif op in DB_WRITE_COMMANDS:
+                wrote = True
+                if not atomic:
+                    connection.commit()
+
+        committed = not (atomic and failed)
+        if atomic:
+            if failed:
+                connection.rollback()
+                if wrote:
+                    server_display.show_notification("İŞLEM GERİ ALINDI")
+                for result in results:
+                    if result['op'] in DB_WRITE_COMMANDS and result.get('success'):
+                        result['rolled_back'] = True
+            else:
+                connection.commit()
+    except db_backend.Error as error:
+        log.error(f"Batch database error: {error}")
+        connection.rollback()
+        return {'success': False, 'committed': False, 'results': results,
+                'message': f'Veritabanı hatası: {str(error)}'}
+    finally:
+        connection.close()
+
+    # Refresh bak.txt and push the balance once, after the transaction settled
+    # (balance reads inside the batch only return the value)
+    if wrote or any(result['op'] == 'balance' and result.get('success') for result in results):
+        refresh_balance_async()
+
+    return {'success': not failed, 'committed': committed, 'results': results}
+
+
+# ========================
+# Request Context
+# ========================
+
+# Handler latency per API endpoint (reported by /api/metrics)
+REQUEST_LATENCY = {}
+_request_context = threading.local()
+
+
+@app.before_request
+def ensure_settings():
+    """Load config.sh on the first request if init_server() was not called (development)"""
+    if CONFIG is None:
+        load_settings()
+
+
+@app.before_request
+def assign_request_id():
+    """Tag every log record written while handling this request with one ID"""
+    portal_logging.set_request_id(request.headers.get('X-Request-ID'))
+    _request_context.started = time.perf_counter()
+
+
+@app.after_request
+def expose_request_id(response):
+    """Echo the request ID so client-side reports can be matched to server logs"""
+    response.headers['X-Request-ID'] = portal_logging.get_request_id() or ''
+    portal_logging.clear_request_id()
+    
+    endpoint = request.endpoint
+    if endpoint and endpoint.startswith('api_'):
+        stats = REQUEST_LATENCY.get(endpoint)
+        if stats is None:
+            stats = REQUEST_LATENCY.setdefault(endpoint, jobs.LatencyStats())
+        stats.add((time.perf_counter() - _request_context.started) * 1000)
+    return response
+
+
 # ========================
 # Captive Portal Detection Endpoints
 # ========================
@@ -513,6 +793,43 @@ def favicon():
 # API Routes
 # ========================
 
+@app.route('/ws', websocket=True)
+def ws_channel():
+    """
+    WebSocket control channel: one persistent connection per phone.
+    Receives {"id", "op", ...params} commands, replies with
+    {"type": "ack", "id", ...result} and pushes {"type": "state", ...}
+    whenever the balance or music state changes.
+    """
+    ws = ws_control.accept(request.environ)
+    if ws is None:
+        return jsonify({'success': False, 'message': 'WebSocket bağlantısı gerekli'}), 400
+
+    client_ip = request.remote_addr
+    ws_control.hub.register(ws, client_ip)
+    try:
+        while True:
+            message = ws.receive()
+            if message is None:
+                break
+            try:
+                command = json.loads(message)
+                op = command.get('op')
+            except (ValueError, AttributeError):
+                ws.send_json({'type': 'ack', 'id': None, 'success': False, 'message': 'Geçersiz komut'})
+                continue
+
+            portal_logging.set_request_id()
+            result = run_command(op, command)
+            ws.send_json({'type': 'ack', 'id': command.get('id'), 'op': op, **result})
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        ws_control.hub.unregister(ws)
+        ws.close()
+    return ws_control.ClosedResponse()
+
+
 @app.route('/api/balance', methods=['GET'])
 def api_balance():
     """Get current user balance"""
@@ -577,6 +894,77 @@ def api_kazanc():
         return jsonify(result), 500
 
 
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """
+    Run several commands in one request.
+    Body: {"atomic": false, "operations": [{"op": "yukle", "amount": 100},
+                                           {"op": "kazanc"}, {"op": "toggle_game"}]}
+    """
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'success': False, 'message': 'İşlem listesi gerekli'}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({'success': False,
+                        'message': f'En fazla {MAX_BATCH_OPERATIONS} işlem gönderilebilir'}), 400
+
+    result = run_batch(operations, atomic=bool(data.get('atomic', False)))
+    return jsonify(result)
+
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def api_job(job_id):
+    """Status of a background job (e.g. the game launch started by /api/toggle_game)"""
+    job = jobs.executor.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'İş bulunamadı'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    """Handler latency per endpoint, background job statistics and per-client traffic"""
+    return jsonify({
+        'success': True,
+        'requests': {name: stats.summary() for name, stats in REQUEST_LATENCY.items()},
+        'jobs': jobs.executor.stats(),
+        'game': GAME_BROWSER.last_launch,
+        'traffic': traffic_accounting.meter.summary(),
+    })
+
+
+@app.route('/api/clients', methods=['GET'])
+def api_clients():
+    """Phones holding a DHCP lease (and whether they are released), and which of them is asking"""
+    clients = [dict(client, released=client_access.is_allowed(ip=client['ip']) or
+                    client_access.is_allowed(mac=client['mac']))
+               for client in client_registry.registry.clients()]
+    return jsonify({
+        'success': True,
+        'clients': clients,
+        'you': next((c for c in clients if c['ip'] == request.remote_addr), None),
+    })
+
+
+@app.route('/api/stations', methods=['GET'])
+def api_stations():
+    """Associated Wi-Fi stations with connection time and signal (from hostapd)"""
+    hostapd_events.monitor.refresh()
+    return jsonify({
+        'success': True,
+        'attached': hostapd_events.monitor.attached,
+        'stations': hostapd_events.monitor.stations(),
+    })
+
+
+@app.route('/api/services', methods=['GET'])
+def api_services():
+    """State of the supervised services (hostapd, dnsmasq, http)"""
+    return jsonify({'success': True, 'services': supervisor.services.states()})
+
+
 @app.route('/api/music_status', methods=['GET'])
 def api_music_status():
     """Check if music (screensaver) script exists"""
@@ -657,7 +1045,7 @@ if __name__ == "__main__":
     print("Captive Portal Gaming Kiosk Server")
     print("=" * 60)
     print(f"Portal page: {PORTAL_PAGE}")
-    print(f"Database: {MYSQL_CONFIG['database']}")
+    print(f"Database: {MYSQL_CONFIG['database']} ({DB_SETTINGS['backend']})")
     print(f"User ID: {USER_ID}")
     print("\nAPI Endpoints:")
     print("  GET  /              - Portal page")
@@ -666,6 +1054,8 @@ if __name__ == "__main__":
     print("  POST /api/sil       - Clear balance")
     print("  POST /api/toggle_game - Toggle game browser")
     print("  GET  /api/kazanc    - Get earnings data")
+    print("  POST /api/batch     - Run several commands in one request")
+    print("  WS   /ws            - Control channel (commands + live state)")
     print(f"\nStarting server on port {PORT}...")
     if PORT == 8080:
         print(f"Access at: http://localhost:{PORT}/")
@@ -5,15 +5,18 @@ Provides Tkinter-based on-screen notifications for server.py
 Adapted from kumanda.py notification system
 """
 
-import tkinter as tk
-from tkinter import font as tkfont
 import threading
 import queue
 import sys
 import os
 from math import ceil
+import portal_logging
+
+log = portal_logging.get_logger("display")
 
 # Global variables
+tk = None      # tkinter, imported by the display thread (headless runs never load it)
+tkfont = None
 root = None
 notification_window = None
 notification_queue = queue.Queue()
@@ -80,7 +83,7 @@ def init_display():
     
     # Check if we have a display available
     if not os.environ.get('DISPLAY'):
-        print("[DISPLAY] No DISPLAY environment variable found. Running headless.")
+        log.info("No DISPLAY environment variable found. Running headless.")
         display_available = False
         return False
     
@@ -88,19 +91,21 @@ def init_display():
         display_thread = threading.Thread(target=_tkinter_thread, daemon=True)
         display_thread.start()
         display_available = True
-        print("[DISPLAY] Notification display initialized successfully")
+        log.info("Notification display initialized successfully")
         return True
     except Exception as e:
-        print(f"[DISPLAY] Failed to initialize display: {e}")
+        log.error(f"Failed to initialize display: {e}")
         display_available = False
         return False
 
 
 def _tkinter_thread():
     """Background thread that runs the Tkinter event loop"""
-    global root
+    global root, tk, tkfont
     
     try:
+        import tkinter as tk
+        from tkinter import font as tkfont
         root = tk.Tk()
         root.withdraw()  # Hide the main window
         root.attributes('-alpha', 0.0)  # Make it completely transparent
@@ -111,7 +116,7 @@ def _tkinter_thread():
         # Start Tkinter event loop
         root.mainloop()
     except Exception as e:
-        print(f"[DISPLAY] Tkinter thread error: {e}")
+        log.error(f"Tkinter thread error: {e}")
 
 
 def _process_queue():
@@ -131,7 +136,7 @@ def _process_queue():
     except queue.Empty:
         pass
     except Exception as e:
-        print(f"[DISPLAY] Queue processing error: {e}")
+        log.error(f"Queue processing error: {e}")
     
     # Schedule next queue check
     if root:
@@ -147,13 +152,13 @@ def show_notification(message):
         message: Text to display
     """
     if not display_available:
-        print(f"[NOTIFICATION] {message}")
+        log.info("Notification", extra={'notification': message})
         return
     
     try:
         notification_queue.put((message, 'center'))
     except Exception as e:
-        print(f"[DISPLAY] Failed to queue notification: {e}")
+        log.error(f"Failed to queue notification: {e}")
 
 
 def show_notification_top(message):
@@ -165,13 +170,13 @@ def show_notification_top(message):
         message: Text to display
     """
     if not display_available:
-        print(f"[NOTIFICATION] {message}")
+        log.info("Notification", extra={'notification': message})
         return
     
     try:
         notification_queue.put((message, 'top'))
     except Exception as e:
-        print(f"[DISPLAY] Failed to queue notification: {e}")
+        log.error(f"Failed to queue notification: {e}")
 
 
 def _show_notification_center(message):
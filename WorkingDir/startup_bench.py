@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the packaged launcher
+Starts each build with --probe-startup (the launcher logs its first line
+and exits) and measures the time from exec to that first log line, so the
+single-file and the fast-start directory build can be compared.
+
+Usage:
+    python3 startup_bench.py                      # builds found in dist/ + source
+    python3 startup_bench.py --runs 20 ./dist/captive_portal
+    sudo python3 startup_bench.py --cold          # drop the page cache before each run
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_TARGETS = {
+    'onefile': [os.path.join(HERE, "dist", "captive_portal")],
+    'fast (onedir)': [os.path.join(HERE, "dist", "fast", "captive_portal", "captive_portal")],
+    'source': [sys.executable, os.path.join(HERE, "launcher.py")],
+}
+
+
+def drop_caches():
+    """Approximate a cold boot (root only): flush dirty pages and drop the page cache"""
+    os.sync()
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+
+def time_to_first_log(command, timeout=60):
+    """
+    Run `command --probe-startup` once.
+
+    Returns:
+        tuple: (ms until the first stdout line, ms until exit)
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen(command + ["--probe-startup"], stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, cwd=HERE)
+    try:
+        first_line = process.stdout.readline()
+        first_log = (time.perf_counter() - started) * 1000
+        process.stdout.read()
+        process.wait(timeout=timeout)
+    finally:
+        if process.poll() is None:
+            process.kill()
+    if not first_line:
+        raise RuntimeError(f"{command[0]} exited without logging (code {process.returncode})")
+    return first_log, (time.perf_counter() - started) * 1000
+
+
+def bench(command, runs, cold=False):
+    """
+    Returns:
+        dict: Median/min/max time to first log and median time to exit (ms)
+    """
+    first_logs, exits = [], []
+    for _ in range(runs):
+        if cold:
+            drop_caches()
+        first_log, exited = time_to_first_log(command)
+        first_logs.append(first_log)
+        exits.append(exited)
+    return {
+        'first_log_ms': statistics.median(first_logs),
+        'min_ms': min(first_logs),
+        'max_ms': max(first_logs),
+        'exit_ms': statistics.median(exits),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time from exec to the first launcher log line')
+    parser.add_argument('binaries', nargs='*', help='Launcher binaries (default: dist/ builds and the source)')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--cold', action='store_true', help='Drop the page cache before every run (root)')
+    args = parser.parse_args()
+
+    if args.binaries:
+        targets = {path: [os.path.abspath(path)] for path in args.binaries}
+    else:
+        targets = {name: command for name, command in DEFAULT_TARGETS.items() if os.path.exists(command[-1])}
+        for name, command in DEFAULT_TARGETS.items():
+            if name not in targets:
+                print(f"  (skipping {name}: {command[-1]} not built, see build.sh)")
+
+    print(f"Time to first log line, {args.runs} runs{' (cold page cache)' if args.cold else ''}:")
+    for name, command in targets.items():
+        result = bench(command, args.runs, args.cold)
+        print(f"  {name:16} {result['first_log_ms']:8.1f} ms  "
+              f"(min {result['min_ms']:.1f}, max {result['max_ms']:.1f}; exit {result['exit_ms']:.1f} ms)")
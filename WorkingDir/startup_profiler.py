@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Startup timeline profiler for the launcher
+Records how long each bring-up phase took, measured from the moment the
+launcher process was created (so interpreter start and imports are
+included), and writes the timeline to a file after every boot.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+TIMELINE_PATH = "/tmp/portal-startup.json"
+
+
+def _process_start():
+    """Seconds since boot at which this process was created (CLOCK_BOOTTIME)"""
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return int(fields[19]) / os.sysconf("SC_CLK_TCK")  # field 22: starttime
+    except (OSError, IndexError, ValueError):
+        return time.clock_gettime(time.CLOCK_BOOTTIME)
+
+
+class StartupProfiler:
+    """Collects named phases (possibly overlapping, from several threads)"""
+
+    def __init__(self):
+        self.process_start = _process_start()
+        self._lock = threading.Lock()
+        self._phases = []
+
+    def now(self):
+        """Seconds since this process was created"""
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - self.process_start
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time the enclosed block as phase `name`"""
+        start = self.now()
+        try:
+            yield
+        finally:
+            self._record(name, start, self.now())
+
+    def call(self, name, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` as phase `name` (handy for thread pools)"""
+        with self.phase(name):
+            return fn(*args, **kwargs)
+
+    def mark(self, name):
+        """Record an instant (e.g. "imports done")"""
+        moment = self.now()
+        self._record(name, moment, moment)
+
+    def _record(self, name, start, end):
+        with self._lock:
+            self._phases.append({
+                'name': name,
+                'start_s': round(start, 3),
+                'end_s': round(end, 3),
+                'duration_s': round(end - start, 3),
+                'thread': threading.current_thread().name,
+            })
+
+    def timeline(self):
+        """
+        Returns:
+            dict: Boot offset, total time so far and the phases by start time
+        """
+        with self._lock:
+            phases = sorted(self._phases, key=lambda p: (p['start_s'], p['end_s']))
+        return {
+            'boot_to_launcher_s': round(self.process_start, 3),
+            'total_s': round(self.now(), 3),
+            'phases': phases,
+        }
+
+    def write(self, path=TIMELINE_PATH):
+        """Write the timeline as JSON (replacing the previous boot's)"""
+        data = self.timeline()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+        return data
+
+
+profiler = StartupProfiler()
+phase = profiler.phase
+call = profiler.call
+mark = profiler.mark
+write = profiler.write
+
+
+def format_timeline(data, width=50):
+    """Render a timeline dict as a text Gantt chart"""
+    total = max(data['total_s'], 0.001)
+    lines = [f"Boot to launcher start: {data['boot_to_launcher_s']:.2f}s, "
+             f"launcher start to ready: {data['total_s']:.2f}s"]
+    for p in data['phases']:
+        begin = int(p['start_s'] / total * width)
+        length = max(1, int(p['duration_s'] / total * width)) if p['duration_s'] else 0
+        bar = " " * begin + ("#" * length if length else "|")
+        lines.append(f"  {p['name']:<22} {p['start_s']:7.2f}s {p['duration_s']:7.2f}s  {bar}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Print the timeline of the last launcher start
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else TIMELINE_PATH
+    try:
+        with open(path) as f:
+            print(format_timeline(json.load(f)))
+    except FileNotFoundError:
+        print(f"No startup timeline at {path} (written once the portal is ready)")
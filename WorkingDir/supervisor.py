@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Process supervisor for the captive portal services
+Runs hostapd and dnsmasq in the foreground as children, decides they are up
+from real readiness probes (hostapd control socket, bound DNS/DHCP ports,
+HTTP port accepting connections) and restarts them with backoff when they die.
+"""
+
+import os
+import socket
+import subprocess
+import threading
+import time
+
+import portal_logging
+import port_owner
+
+log = portal_logging.get_logger("supervisor")
+
+STATE_STARTING = 'starting'
+STATE_READY = 'ready'
+STATE_RESTARTING = 'restarting'
+STATE_STOPPED = 'stopped'
+
+PROBE_INTERVAL = 0.1   # seconds between readiness checks
+READY_TIMEOUT = 20     # seconds a child gets to become ready before it is restarted
+BACKOFF_MIN = 1        # first restart delay (seconds), doubled per crash
+BACKOFF_MAX = 30
+STABLE_AFTER = 60      # seconds of uptime after which the backoff resets
+STOP_TIMEOUT = 5       # seconds between SIGTERM and SIGKILL on stop
+
+
+# ========================
+# Readiness probes
+# ========================
+
+def hostapd_ctrl_path(conf_path):
+    """
+    Control socket of the hostapd instance configured by `conf_path`
+    (ctrl_interface directory + interface name).
+
+    Returns:
+        str: Socket path, or None if the config has no ctrl_interface
+    """
+    settings = {}
+    try:
+        with open(conf_path) as f:
+            for line in f:
+                key, sep, value = line.strip().partition('=')
+                if sep and not key.startswith('#'):
+                    settings[key.strip()] = value.strip()
+    except OSError:
+        return None
+
+    ctrl_dir = settings.get('ctrl_interface', '')
+    if ctrl_dir.startswith('DIR='):
+        ctrl_dir = ctrl_dir[4:].split()[0]
+    if not ctrl_dir or 'interface' not in settings:
+        return None
+    return os.path.join(ctrl_dir, settings['interface'])
+
+
+def hostapd_request(ctrl_path, command, timeout=1.0):
+    """
+    Send one command over the hostapd control socket.
+
+    Returns:
+        str: Reply text
+
+    Raises:
+        OSError: if hostapd is not answering
+    """
+    local_path = f"/tmp/portal-hostapd-{os.getpid()}-{threading.get_ident()}"
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        try:
+            os.unlink(local_path)
+        except FileNotFoundError:
+            pass
+        sock.bind(local_path)
+        sock.settimeout(timeout)
+        sock.connect(ctrl_path)
+        sock.send(command.encode())
+        return sock.recv(4096).decode(errors='replace')
+    finally:
+        sock.close()
+        try:
+            os.unlink(local_path)
+        except FileNotFoundError:
+            pass
+
+
+def hostapd_probe(conf_path):
+    """
+    Ready when hostapd answers PING with PONG on its control socket.
+    Configs without ctrl_interface (older deployments) cannot be probed;
+    hostapd is then considered ready once started.
+    """
+    ctrl_path = hostapd_ctrl_path(conf_path)
+    if ctrl_path is None:
+        log.warning(f"No ctrl_interface in {conf_path}, hostapd readiness is not checked")
+
+    def probe():
+        if ctrl_path is None:
+            return True
+        try:
+            return hostapd_request(ctrl_path, "PING", timeout=0.5).startswith("PONG")
+        except OSError:
+            return False
+
+    return probe
+
+
+def bound_ports(protocol, address=None):
+    """
+    Local ports with a bound socket, read from /proc/net/<protocol>{,6}.
+    For TCP only listening sockets count.
+
+    Args:
+        protocol: 'tcp' or 'udp'
+        address: Only count sockets bound to this IP (or the wildcard)
+
+    Returns:
+        set: Port numbers
+    """
+    ports = set()
+    for local_ip, local_port, state, _ in port_owner.read_sockets(protocol):
+        if protocol == 'tcp' and state != port_owner.TCP_LISTEN:
+            continue
+        if address is not None:
+            bound_ip = port_owner.decode_address(local_ip)
+            if bound_ip != address and bound_ip not in port_owner.WILDCARD_ADDRESSES:
+                continue
+        ports.add(local_port)
+    return ports
+
+
+def ports_probe(tcp=(), udp=(), address=None):
+    """
+    Ready when every listed TCP port is listening and every UDP port is
+    bound (on `address` or the wildcard, if given)
+    """
+    def probe():
+        return (set(tcp) <= bound_ports('tcp', address)) and (set(udp) <= bound_ports('udp', address))
+
+    return probe
+
+
+def tcp_connect_probe(host, port, timeout=0.5):
+    """Ready when host:port accepts a TCP connection"""
+    def probe():
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+
+    return probe
+
+
+# ========================
+# Services
+# ========================
+
+class Service:
+    """
+    One supervised service.
+
+    With a command, the child is started, probed until ready and restarted
+    with exponential backoff whenever it exits. Without one, the service
+    only watches `probe` (e.g. the web server running in this process).
+    """
+
+    def __init__(self, name, command=None, probe=None, ready_timeout=READY_TIMEOUT):
+        self.name = name
+        self.command = command
+        self.probe = probe
+        self.ready_timeout = ready_timeout
+
+        self.state = STATE_STOPPED
+        self.pid = None
+        self.restarts = 0
+        self.last_exit_code = None
+        self.ready_ms = None
+        self.since = time.time()
+        self.ready = threading.Event()
+
+        self._process = None
+        self._thread = None
+        self._stopping = False
+        self._wakeup = threading.Event()
+
+    def _set_state(self, state):
+        self.state = state
+        self.since = time.time()
+
+    def start(self):
+        """Start supervising in the background (returns immediately)"""
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._supervise, name=f"supervise-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the child without restarting it"""
+        self._stopping = True
+        self._wakeup.set()
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        if self._thread is not None:
+            self._thread.join(timeout=STOP_TIMEOUT)
+            self._thread = None
+        self.ready.clear()
+        self._set_state(STATE_STOPPED)
+
+    def _await_ready(self, started):
+        """Poll the probe until it passes, the child exits or the timeout hits"""
+        deadline = started + self.ready_timeout
+        while not self._stopping and time.monotonic() < deadline:
+            if self._process is not None and self._process.poll() is not None:
+                return False
+            if self.probe is None or self.probe():
+                self.ready_ms = round((time.monotonic() - started) * 1000, 1)
+                self._set_state(STATE_READY)
+                self.ready.set()
+                log.info(f"{self.name} ready", extra={'service': self.name, 'pid': self.pid,
+                                                      'ready_ms': self.ready_ms})
+                return True
+            time.sleep(PROBE_INTERVAL)
+        return False
+
+    def _supervise(self):
+        if self.command is None:
+            self._set_state(STATE_STARTING)
+            if not self._await_ready(time.monotonic()):
+                log.error(f"{self.name} not ready after {self.ready_timeout}s", extra={'service': self.name})
+            return
+
+        backoff = BACKOFF_MIN
+        while not self._stopping:
+            started = time.monotonic()
+            self._set_state(STATE_STARTING)
+            try:
+                self._process = subprocess.Popen(self.command, stdout=subprocess.DEVNULL,
+                                                 stderr=subprocess.DEVNULL)
+                self.pid = self._process.pid
+                log.info(f"Started {self.name}", extra={'service': self.name, 'pid': self.pid})
+
+                if not self._await_ready(started) and self._process.poll() is None and not self._stopping:
+                    log.error(f"{self.name} not ready after {self.ready_timeout}s, restarting",
+                              extra={'service': self.name, 'pid': self.pid})
+                    self._process.terminate()
+
+                self.last_exit_code = self._process.wait()
+            except OSError as e:
+                log.error(f"Could not start {self.name}: {e}", extra={'service': self.name})
+                self.last_exit_code = None
+
+            self.ready.clear()
+            self.pid = None
+            if self._stopping:
+                break
+
+            if time.monotonic() - started >= STABLE_AFTER:
+                backoff = BACKOFF_MIN
+            self.restarts += 1
+            self._set_state(STATE_RESTARTING)
+            log.warning(f"{self.name} exited, restarting in {backoff}s",
+                        extra={'service': self.name, 'exit_code': self.last_exit_code,
+                               'restarts': self.restarts})
+            self._wakeup.wait(backoff)
+            self._wakeup.clear()
+            backoff = min(backoff * 2, BACKOFF_MAX)
+
+    def status(self):
+        return {
+            'state': self.state,
+            'pid': self.pid,
+            'restarts': self.restarts,
+            'last_exit_code': self.last_exit_code,
+            'ready_ms': self.ready_ms,
+            'since': self.since,
+        }
+
+
+class Supervisor:
+    """The set of services started by the launcher"""
+
+    def __init__(self):
+        self._services = {}
+
+    def add(self, service):
+        """Register (or replace) a service"""
+        previous = self._services.get(service.name)
+        if previous is not None:
+            previous.stop()
+        self._services[service.name] = service
+        return service
+
+    def get(self, name):
+        return self._services.get(name)
+
+    def start(self, *names):
+        """Start the named services (all if none given) without waiting"""
+        for name in names or list(self._services):
+            self._services[name].start()
+
+    def wait_ready(self, names=None, timeout=READY_TIMEOUT):
+        """
+        Block until the services are ready, at most `timeout` seconds.
+
+        Returns:
+            list: Names of the services that are still not ready
+        """
+        deadline = time.monotonic() + timeout
+        pending = []
+        for name in names or list(self._services):
+            if not self._services[name].ready.wait(max(0, deadline - time.monotonic())):
+                pending.append(name)
+        return pending
+
+    def stop_all(self):
+        """Stop every service (reverse start order)"""
+        for service in reversed(list(self._services.values())):
+            service.stop()
+
+    def states(self):
+        """
+        Returns:
+            dict: name -> status dict (state, pid, restarts, ...)
+        """
+        return {name: service.status() for name, service in self._services.items()}
+
+
+# Services of this process (launcher + in-process web server)
+services = Supervisor()
+
+
+if __name__ == "__main__":
+    # Demo without hostapd/dnsmasq: a web server that needs a moment to bind,
+    # and one that crashes twice before it comes up.
+    import sys
+    import tempfile
+
+    counter = os.path.join(tempfile.mkdtemp(), "runs")
+    server = ("import http.server\n"
+              "http.server.HTTPServer(('127.0.0.1', {port}), "
+              "http.server.SimpleHTTPRequestHandler).serve_forever()\n")
+    flaky = ("import os, sys\n"
+             f"p = {counter!r}\n"
+             "n = int(open(p).read()) if os.path.exists(p) else 0\n"
+             "open(p, 'w').write(str(n + 1))\n"
+             "if n < 2: sys.exit(1)\n") + server.format(port=8766)
+
+    services.add(Service('web', [sys.executable, '-c', "import time; time.sleep(0.3)\n" + server.format(port=8765)],
+                         probe=tcp_connect_probe('127.0.0.1', 8765)))
+    services.add(Service('flaky', [sys.executable, '-c', flaky], probe=ports_probe(tcp=[8766])))
+
+    started = time.monotonic()
+    services.start()
+    not_ready = services.wait_ready(timeout=15)
+    print(f"Startup finished in {(time.monotonic() - started) * 1000:.0f} ms, not ready: {not_ready}")
+    for name, status in services.states().items():
+        print(f"  {name:6} {status['state']:10} restarts={status['restarts']} ready_ms={status['ready_ms']}")
+    services.stop_all()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Per-client traffic accounting
+The launcher puts every address of the DHCP range into two ipsets created
+with per-entry counters, and two constant mangle rules count each packet
+from the hotspot (up) and to it (down) against the client's entry. Every
+INTERVAL seconds one `ipset save` reads all counters at once; the deltas
+are kept per device (by MAC when the lease is known) in fixed-size rings
+and published with the request metrics.
+"""
+
+import array
+import ipaddress
+import threading
+import time
+
+import client_access
+import client_registry
+import portal_logging
+
+log = portal_logging.get_logger("traffic")
+
+UP_SET = "portal-acct-up"       # matched on the source address (client -> anywhere)
+DOWN_SET = "portal-acct-down"   # matched on the destination address (anywhere -> client)
+ACCOUNTING_SETS = (UP_SET, DOWN_SET)
+
+INTERVAL = 5.0       # seconds between counter reads
+SAMPLES = 120        # intervals kept per device (10 minutes at 5 s)
+IDLE_DROP = 3600     # forget a device without a lease after this long without traffic
+
+
+def ensure_sets(range_start, range_end):
+    """
+    Create the accounting sets and fill them with the DHCP range (the
+    clients can only have these addresses, so the sets never change while
+    running). Must run before a ruleset referencing them is loaded.
+
+    Returns:
+        bool: True if the sets exist; False if ipset is unavailable or the
+              range is invalid (accounting is then disabled)
+    """
+    try:
+        first, last = ipaddress.ip_address(range_start), ipaddress.ip_address(range_end)
+        if last < first:
+            raise ValueError(f"{first} is after {last}")
+    except ValueError as e:
+        log.error(f"Traffic accounting disabled, bad DHCP range: {e}")
+        return False
+    commands = "".join(f"create {name} hash:ip counters maxelem {int(last) - int(first) + 1}\n"
+                       f"add {name} {first}-{last}\n" for name in ACCOUNTING_SETS)
+    try:
+        client_access.run_ipset("-exist", "restore", stdin=commands)
+    except client_access.ClientAccessError as e:
+        log.error(f"Traffic accounting unavailable: {e}")
+        return False
+    return True
+
+
+def destroy():
+    """Remove the sets (only possible once no rule references them)"""
+    for name in ACCOUNTING_SETS:
+        try:
+            client_access.run_ipset("destroy", name)
+        except client_access.ClientAccessError as e:
+            if "does not exist" not in str(e):
+                log.warning(str(e))
+
+
+def parse_counters(text):
+    """
+    Counters of the accounting sets in `ipset save` output.
+
+    Returns:
+        dict: ip -> [up_bytes, up_packets, down_bytes, down_packets]
+    """
+    counters = {}
+    for line in text.splitlines():
+        if not line.startswith('add portal-acct-'):
+            continue
+        fields = line.split()
+        try:
+            packets = int(fields[fields.index('packets') + 1])
+            nbytes = int(fields[fields.index('bytes') + 1])
+        except (ValueError, IndexError):
+            continue
+        entry = counters.setdefault(fields[2], [0, 0, 0, 0])
+        if fields[1] == UP_SET:
+            entry[0], entry[1] = nbytes, packets
+        elif fields[1] == DOWN_SET:
+            entry[2], entry[3] = nbytes, packets
+    return counters
+
+
+class TrafficSeries:
+    """Fixed-size ring of per-interval byte/packet deltas of one device"""
+
+    def __init__(self, size=SAMPLES):
+        self.size = size
+        self.up_bytes = array.array('Q', [0]) * size
+        self.down_bytes = array.array('Q', [0]) * size
+        self.up_packets = array.array('I', [0]) * size
+        self.down_packets = array.array('I', [0]) * size
+        self.filled = 0
+        self.position = 0
+        self.totals = [0, 0, 0, 0]   # up bytes/packets, down bytes/packets since first seen
+        self.last_active = time.time()
+
+    def add(self, up_bytes, up_packets, down_bytes, down_packets):
+        i = self.position
+        self.up_bytes[i], self.up_packets[i] = up_bytes, up_packets
+        self.down_bytes[i], self.down_packets[i] = down_bytes, down_packets
+        self.position = (i + 1) % self.size
+        self.filled = min(self.filled + 1, self.size)
+        for n, value in enumerate((up_bytes, up_packets, down_bytes, down_packets)):
+            self.totals[n] += value
+        if up_packets or down_packets:
+            self.last_active = time.time()
+
+    def summary(self, interval):
+        """
+        Returns:
+            dict: totals, rate over the last interval and over the window, peak rate (bytes/s)
+        """
+        last = (self.position - 1) % self.size
+        window = self.filled * interval or 1
+        up, down = sum(self.up_bytes), sum(self.down_bytes)  # unfilled slots are zero
+        return {
+            'up_bytes': self.totals[0], 'up_packets': self.totals[1],
+            'down_bytes': self.totals[2], 'down_packets': self.totals[3],
+            'up_bps': round(self.up_bytes[last] / interval) if self.filled else 0,
+            'down_bps': round(self.down_bytes[last] / interval) if self.filled else 0,
+            'window_s': round(window),
+            'avg_up_bps': round(up / window),
+            'avg_down_bps': round(down / window),
+            'peak_down_bps': round(max(self.down_bytes) / interval),
+        }
+
+    def series(self):
+        """Samples oldest first as (up_bytes, down_bytes) pairs"""
+        order = range(self.position - self.filled, self.position)
+        return [(self.up_bytes[i % self.size], self.down_bytes[i % self.size]) for i in order]
+
+
+class TrafficMeter:
+    """Reads the accounting counters every `interval` seconds into per-device series"""
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.reads = 0
+        self.read_ms = 0.0
+        self._previous = {}   # ip -> counters of the last read
+        self._devices = {}    # mac (or ip without lease) -> TrafficSeries
+        self._ips = {}        # device -> last ip
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._failing = False
+
+    def start(self):
+        """Sample in the background (idempotent)"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="traffic", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self, text=None):
+        """
+        One read of all counters (`text`: ipset save output, read now if None).
+
+        Returns:
+            bool: True if the counters could be read
+        """
+        started = time.perf_counter()
+        if text is None:
+            try:
+                text = client_access.run_ipset("save")
+            except client_access.ClientAccessError as e:
+                if not self._failing:
+                    log.warning(f"Cannot read traffic counters: {e}")
+                self._failing = True
+                return False
+        self._failing = False
+        counters = parse_counters(text)
+
+        deltas = {}
+        for ip, current in counters.items():
+            previous = self._previous.get(ip, current)
+            # A counter below its last value was reset (sets recreated): count from zero
+            deltas[ip] = [now - before if now >= before else now for now, before in zip(current, previous)]
+        self._previous = counters
+
+        now = time.time()
+        with self._lock:
+            for ip, delta in deltas.items():
+                client = client_registry.registry.lookup(ip)
+                if client is None and not any(delta):
+                    continue
+                device = client['mac'] if client else ip
+                series = self._devices.get(device)
+                if series is None and client is not None and ip in self._devices:
+                    # Counted before its lease was known: carry the history over to the MAC
+                    series = self._devices[device] = self._devices.pop(ip)
+                    self._ips.pop(ip, None)
+                if series is None:
+                    series = self._devices[device] = TrafficSeries()
+                series.add(*delta)
+                self._ips[device] = ip
+            for device in [d for d, s in self._devices.items()
+                           if now - s.last_active > IDLE_DROP and not self._leased(d)]:
+                del self._devices[device]
+                self._ips.pop(device, None)
+        self.reads += 1
+        self.read_ms = round((time.perf_counter() - started) * 1000, 3)
+        return True
+
+    def _leased(self, device):
+        if ':' in device:
+            return client_registry.registry.by_mac(device) is not None
+        return client_registry.registry.lookup(device) is not None
+
+    def summary(self):
+        """
+        Returns:
+            dict: 'reads', 'read_ms' (cost of the last read) and 'clients',
+                  device -> ip, hostname and traffic summary
+        """
+        with self._lock:
+            devices = {device: (self._ips.get(device), series.summary(self.interval))
+                       for device, series in self._devices.items()}
+        clients = {}
+        for device, (ip, stats) in devices.items():
+            client = client_registry.registry.lookup(ip) if ip else None
+            clients[device] = {'ip': ip, 'hostname': client['hostname'] if client else None, **stats}
+        return {'interval_s': self.interval, 'reads': self.reads, 'read_ms': self.read_ms, 'clients': clients}
+
+    def series(self, device):
+        with self._lock:
+            series = self._devices.get(device)
+            return series.series() if series is not None else None
+
+
+meter = TrafficMeter()
+
+
+if __name__ == "__main__":
+    # Cost of one sampling round for a full DHCP range and a large one,
+    # from synthetic `ipset save` output (plus a real read when ipset is there)
+    import os
+    import shutil
+
+    def synthetic(count, step):
+        lines = []
+        for i in range(count):
+            ip = ipaddress.ip_address("10.0.0.2") + i
+            for name in ACCOUNTING_SETS:
+                lines.append(f"add {name} {ip} packets {step * (i + 1)} bytes {step * 900 * (i + 1)}")
+        return "\n".join(lines) + "\n"
+
+    for count in (19, 250):
+        demo = TrafficMeter()
+        rounds = 50
+        texts = [synthetic(count, step) for step in range(1, rounds + 2)]
+        demo.sample(texts[0])
+        started = time.perf_counter()
+        for text in texts[1:]:
+            demo.sample(text)
+        per_round = (time.perf_counter() - started) * 1000 / rounds
+        summary = demo.summary()
+        busiest = max(summary['clients'].items(), key=lambda item: item[1]['down_bytes'])
+        print(f"  {count:4} clients: {per_round:.3f} ms per sample (parse + rings), "
+              f"busiest {busiest[0]} down {busiest[1]['down_bytes']} bytes")
+    print(f"  ring memory per device: {SAMPLES * (8 + 8 + 4 + 4)} bytes of samples")
+
+    if os.geteuid() == 0 and shutil.which("ipset"):
+        started = time.perf_counter()
+        client_access.run_ipset("save")
+        print(f"  ipset save (one batched read): {(time.perf_counter() - started) * 1000:.2f} ms")
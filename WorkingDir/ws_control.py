@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+WebSocket control channel for the portal page
+Minimal RFC 6455 implementation on top of the Werkzeug server socket,
+plus a hub that pushes state changes (balance, music) to every phone
+"""
+
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from urllib.parse import urlsplit
+
+from flask import Response
+
+import portal_logging
+
+log = portal_logging.get_logger("ws")
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_MESSAGE_SIZE = 64 * 1024
+SEND_TIMEOUT = 2.0  # a phone that stops reading is dropped after this long
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class WebSocketError(Exception):
+    """Protocol violation by the peer"""
+
+
+def _apply_mask(payload, mask):
+    """XOR payload with the 4-byte mask (done as one big-int operation)"""
+    if not payload:
+        return payload
+    length = len(payload)
+    key = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+
+
+class WebSocket:
+    """
+    One WebSocket connection over an already-upgraded socket.
+
+    Server-side connections send unmasked frames; client-side ones
+    (mask_outgoing=True) mask every frame as the RFC requires. Sends give
+    up after `send_timeout` seconds (SO_SNDTIMEO, so reads still block);
+    a failed send shuts the socket down.
+    """
+
+    def __init__(self, sock, mask_outgoing=False, send_timeout=SEND_TIMEOUT):
+        self.sock = sock
+        self.mask_outgoing = mask_outgoing
+        self.closed = False
+        self._buffer = b''
+        self._send_lock = threading.Lock()
+        if send_timeout:
+            seconds = int(send_timeout)
+            timeval = struct.pack('ll', seconds, int((send_timeout - seconds) * 1e6))
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, timeval)
+            except OSError as e:
+                log.warning(f"Cannot set WebSocket send timeout: {e}")
+
+    def _recv_exact(self, size):
+        while len(self._buffer) < size:
+            chunk = self.sock.recv(max(4096, size - len(self._buffer)))
+            if not chunk:
+                raise ConnectionError("WebSocket peer went away")
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _read_frame(self):
+        first, second = self._recv_exact(2)
+        fin = bool(first & 0x80)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self._recv_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self._recv_exact(8))[0]
+        if length > MAX_MESSAGE_SIZE:
+            raise WebSocketError(f"Frame too large: {length} bytes")
+        mask = self._recv_exact(4) if second & 0x80 else None
+        payload = self._recv_exact(length)
+        if mask:
+            payload = _apply_mask(payload, mask)
+        return fin, opcode, payload
+
+    def _send_frame(self, opcode, payload):
+        header = bytearray([0x80 | opcode])
+        mask_bit = 0x80 if self.mask_outgoing else 0
+        length = len(payload)
+        if length < 126:
+            header.append(mask_bit | length)
+        elif length < 65536:
+            header.append(mask_bit | 126)
+            header += struct.pack('!H', length)
+        else:
+            header.append(mask_bit | 127)
+            header += struct.pack('!Q', length)
+        if self.mask_outgoing:
+            mask = os.urandom(4)
+            header += mask
+            payload = _apply_mask(payload, mask)
+        with self._send_lock:
+            try:
+                self.sock.sendall(bytes(header) + payload)
+            except BlockingIOError:
+                # SO_SNDTIMEO expired (EAGAIN): the peer stopped reading
+                self._abort()
+                raise TimeoutError("WebSocket send timed out, peer is not reading") from None
+            except OSError:
+                # Timed out or reset: part of a frame may be out, so the stream is unusable
+                self._abort()
+                raise
+
+    def _abort(self):
+        """Mark closed and shut the socket down, waking a reader blocked in recv()"""
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def receive(self):
+        """
+        Block until the next data message arrives.
+
+        Returns:
+            str/bytes: Message (str for text frames), or None once closed
+        """
+        fragments = []
+        message_opcode = None
+        while not self.closed:
+            try:
+                fin, opcode, payload = self._read_frame()
+            except (ConnectionError, OSError, WebSocketError):
+                self.closed = True
+                return None
+
+            if opcode == OP_PING:
+                try:
+                    self._send_frame(OP_PONG, payload)
+                except OSError:
+                    return None
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                self.close(1000)
+                return None
+
+            if opcode != OP_CONTINUATION:
+                message_opcode = opcode
+                fragments = []
+            fragments.append(payload)
+            if sum(len(f) for f in fragments) > MAX_MESSAGE_SIZE:
+                self.close(1009)
+                return None
+            if fin:
+                data = b''.join(fragments)
+                return data.decode('utf-8') if message_opcode == OP_TEXT else data
+        return None
+
+    def send(self, message):
+        """Send a text (str) or binary (bytes) message"""
+        if self.closed:
+            raise ConnectionError("WebSocket is closed")
+        if isinstance(message, str):
+            self._send_frame(OP_TEXT, message.encode('utf-8'))
+        else:
+            self._send_frame(OP_BINARY, message)
+
+    def send_json(self, data):
+        self.send(json.dumps(data, ensure_ascii=False))
+
+    def close(self, code=1000):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._send_frame(OP_CLOSE, struct.pack('!H', code))
+        except OSError:
+            pass
+        # Don't wait for the peer's close frame: a phone that left the
+        # hotspot never sends one, and the reader would sit in recv()
+        self._abort()
+
+
+def accept(environ):
+    """
+    Complete the WebSocket handshake for a Werkzeug request.
+
+    Args:
+        environ: WSGI environ of the upgrade request
+
+    Returns:
+        WebSocket: Open connection, or None if this is not a valid upgrade
+    """
+    key = environ.get('HTTP_SEC_WEBSOCKET_KEY')
+    sock = environ.get('werkzeug.socket')
+    if environ.get('HTTP_UPGRADE', '').lower() != 'websocket' or not key or sock is None:
+        return None
+
+    digest = hashlib.sha1((key + WS_GUID).encode()).digest()
+    sock.sendall(
+        b"HTTP/1.1 101 Switching Protocols\r\n"
+        b"Upgrade: websocket\r\n"
+        b"Connection: Upgrade\r\n"
+        b"Sec-WebSocket-Accept: " + base64.b64encode(digest) + b"\r\n\r\n"
+    )
+    return WebSocket(sock)
+
+
+def connect(url, timeout=5.0):
+    """
+    Open a client connection to a ws:// URL (used for the browser's
+    DevTools endpoint, so only plain ws:// is supported).
+
+    Args:
+        url: ws://host:port/path
+        timeout: Connect/handshake timeout in seconds (also the read timeout)
+
+    Returns:
+        WebSocket: Open client-side connection (outgoing frames masked)
+    """
+    parsed = urlsplit(url)
+    if parsed.scheme != 'ws':
+        raise ValueError(f"Unsupported WebSocket URL: {url}")
+    host, port = parsed.hostname, parsed.port or 80
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+
+    sock = socket.create_connection((host, port), timeout=timeout)
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall(
+        f"GET {path} HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\n"
+        "Sec-WebSocket-Version: 13\r\n\r\n".encode()
+    )
+
+    response = b''
+    while b'\r\n\r\n' not in response:
+        chunk = sock.recv(4096)
+        if not chunk:
+            sock.close()
+            raise ConnectionError("WebSocket handshake failed: connection closed")
+        response += chunk
+    head, _, rest = response.partition(b'\r\n\r\n')
+
+    expected = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest())
+    if not head.startswith(b'HTTP/1.1 101') or expected not in head:
+        sock.close()
+        raise WebSocketError(f"WebSocket handshake rejected: {head.splitlines()[0]!r}")
+
+    ws = WebSocket(sock, mask_outgoing=True)
+    ws._buffer = rest
+    return ws
+
+
+class ClosedResponse(Response):
+    """
+    Returned by a WebSocket view once the connection is finished.
+    The socket was taken over by the WebSocket, so instead of writing an
+    HTTP response we tell Werkzeug the connection is gone.
+    """
+
+    def __call__(self, environ, start_response):
+        raise ConnectionError("WebSocket connection closed")
+
+
+# ========================
+# State Hub
+# ========================
+
+class Hub:
+    """Tracks connected phones and pushes state changes to all of them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held from merging a change until it is sent to every phone, so two
+        # publishers of the same key can't deliver the older value last
+        self._publish_lock = threading.Lock()
+        self._clients = {}  # WebSocket -> client IP
+        self._state = {}
+        self._poller = None
+
+    def register(self, ws, client_ip):
+        with self._publish_lock:
+            with self._lock:
+                self._clients[ws] = client_ip
+                state = dict(self._state)
+            log.info("Control channel opened", extra={'client_ip': client_ip})
+            if state:
+                self._send(ws, {'type': 'state', **state})
+
+    def unregister(self, ws):
+        with self._lock:
+            client_ip = self._clients.pop(ws, None)
+        if client_ip is not None:
+            log.info("Control channel closed", extra={'client_ip': client_ip})
+
+    def client_count(self):
+        return len(self._clients)
+
+    def disconnect_ip(self, client_ip):
+        """Close every control channel opened from `client_ip`"""
+        with self._lock:
+            targets = [ws for ws, ip in self._clients.items() if ip == client_ip]
+        for ws in targets:
+            ws.close(1001)
+            self.unregister(ws)
+        return len(targets)
+
+    def publish(self, **changes):
+        """
+        Merge `changes` into the shared state and push the keys that changed.
+        Publishing an unchanged value is free, so callers need not dedupe.
+        Phones receive changes in the order they were merged (each send
+        gives up after SEND_TIMEOUT).
+        """
+        with self._publish_lock:
+            with self._lock:
+                changed = {k: v for k, v in changes.items() if self._state.get(k, object()) != v}
+                if not changed:
+                    return
+                self._state.update(changed)
+                clients = list(self._clients)
+            message = {'type': 'state', **changed}
+            for ws in clients:
+                self._send(ws, message)
+
+    def broadcast(self, message):
+        """Send a one-off message (not part of the state) to every phone"""
+        with self._lock:
+            clients = list(self._clients)
+        for ws in clients:
+            self._send(ws, message)
+
+    def _send(self, ws, message):
+        try:
+            ws.send_json(message)
+        except (ConnectionError, OSError) as e:
+            # Includes a phone that stopped reading (send timed out): the
+            # socket is shut down, so its /ws handler returns as well
+            log.warning(f"Dropping control channel: {e}", extra={'client_ip': self._clients.get(ws)})
+            self.unregister(ws)
+
+    def start_poller(self, snapshot, interval=2.0):
+        """
+        Poll `snapshot()` (returning a dict of state) every `interval` seconds
+        while at least one phone is connected, and publish the result.
+        Replaces each phone polling /api/balance on its own.
+        """
+        if self._poller is not None:
+            return
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                if not self._clients:
+                    continue
+                try:
+                    self.publish(**snapshot())
+                except Exception as e:
+                    log.error(f"State poll failed: {e}")
+
+        self._poller = threading.Thread(target=poll, name="ws-state-poller", daemon=True)
+        self._poller.start()
+
+
+hub = Hub()